@@ -1,20 +1,82 @@
+import os
 from dotenv import load_dotenv
-load_dotenv()
+# The only .env read in the service; agent/.env wins over the shell, as before
+load_dotenv(os.path.join(os.path.dirname(__file__), ".env"), override=True)
 
-import os
-from fastapi import FastAPI, HTTPException, Query
+import json, time, asyncio, logging
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import FastAPI, HTTPException, Query, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, Response
+
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
+log = logging.getLogger(__name__)
 
 from schemas import (
     GeneralChatRequest,
     GeneralChatResponse,
     AgentPlanRequest,
     PlanResponse,            # ✅ now exists and matches chains.PlanResponse usage
+    PlanBatchRequest,
+    PlanBatchItem,
+    PlanBatchResponse,
+    Booking,
 )
-from chains import general_chat, plan_with_context
-from db import fetch_upcoming_bookings
+import chains
+from chains import general_chat, plan_with_context, general_chat_stream, plan_with_context_stream, plan_batch
+import db
+import bookings_repo
+from bookings_repo import fetch_upcoming_bookings
+import http_clients
+import cache
+import singleflight
+from chat_cache import CHAT_CACHE
+import warmer
+import listings_index
+import metrics
+import resilience
+import deadline
+
+# ---------- Lifecycle ----------
+# Clients are built here rather than at import, so `import app` stays cheap
+# and /ready only turns green once they all exist.
+READY_REQUIRE_DB = os.getenv("READY_REQUIRE_DB", "0") == "1"
+READY_DB_TIMEOUT_S = float(os.getenv("READY_DB_TIMEOUT_S", "1"))
+_state = {"started": False, "startup_s": None}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    t0 = time.perf_counter()
+    await http_clients.startup()
+    chains.get_llm()   # imports LangChain/Anthropic; raises on a missing key like before
+    try:
+        db.get_engine()
+        await bookings_repo.load_schema()
+    except Exception as e:  # DB down at boot: detect lazily on first query instead
+        log.warning("bookings schema detection deferred: %s", e)
+    warm_task = None
+    if warmer.WARMER_INTERVAL_S > 0:
+        warm_task = asyncio.create_task(warmer.run_forever())
+    listings_task = None
+    if listings_index.LISTINGS_REFRESH_S > 0:   # first load runs in the background; chat works without it
+        listings_task = asyncio.create_task(listings_index.run_forever())
+    _state.update(started=True, startup_s=round(time.perf_counter() - t0, 3))
+    log.info("startup complete in %.2fs", _state["startup_s"])
+    try:
+        yield
+    finally:
+        _state["started"] = False   # fail readiness first so the balancer stops sending traffic
+        for task in (warm_task, listings_task):
+            if task:
+                task.cancel()
+        await http_clients.shutdown()
+        await db.dispose()
 
-app = FastAPI(title="StayBnB AI Concierge (LangChain + Ollama)")
+app = FastAPI(title="StayBnB AI Concierge (LangChain + Ollama)", lifespan=lifespan)
 
 # ---------- CORS ----------
 app.add_middleware(
@@ -25,31 +87,207 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ---------- Admission control (503 + Retry-After past ADMISSION_MAX_INFLIGHT) ----------
+app.add_middleware(resilience.AdmissionMiddleware)
+
+# ---------- Request deadlines (per endpoint, X-Request-Deadline overrides) ----------
+app.add_middleware(deadline.DeadlineMiddleware)
+
+# ---------- Metrics ----------
+@app.middleware("http")
+async def _time_requests(request: Request, call_next):
+    t0 = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        metrics.HTTP_SECONDS.observe(
+            time.perf_counter() - t0,
+            path=getattr(route, "path", "unmatched"), method=request.method, status=status,
+        )
+
+def _collect_cache_stats():
+    for name, st in cache.all_stats().items():
+        for field in ("hits", "misses", "evictions"):
+            yield (f"agent_cache_{field}_total", "counter", f"Cache {field}", {"cache": name}, st[field])
+        yield ("agent_cache_hit_ratio", "gauge", "Cache hit ratio", {"cache": name}, st["hit_ratio"])
+        yield ("agent_cache_entries", "gauge", "Cache entries", {"cache": name}, st["size"])
+    cc = CHAT_CACHE.stats()
+    for field in ("exact_hits", "similar_hits", "misses", "evictions", "invalidations"):
+        yield (f"agent_chat_cache_{field}_total", "counter", f"Chat cache {field}", {}, cc[field])
+    yield ("agent_chat_cache_hit_ratio", "gauge", "Chat cache hit ratio", {}, cc["hit_ratio"])
+    yield ("agent_chat_cache_entries", "gauge", "Chat cache entries", {}, cc["size"])
+    for name, st in singleflight.all_stats().items():
+        yield ("agent_singleflight_calls_total", "counter", "Upstream calls made", {"flight": name}, st["calls"])
+        yield ("agent_singleflight_coalesced_total", "counter", "Calls coalesced onto an in-flight one",
+               {"flight": name}, st["coalesced"])
+
+metrics.register_collector(_collect_cache_stats)
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.get("/health")
-def health():
+async def health():
     return {"ok": True}
 
+@app.get("/ready")
+async def ready():
+    """
+    Readiness, unlike /health (liveness): 503 until startup has built the
+    LLM and HTTP clients, and again while shutting down. MySQL is checked
+    too, but only gates readiness with READY_REQUIRE_DB=1 (chat works without it).
+    """
+    checks = {
+        "startup": _state["started"],
+        "llm": chains.llm is not None,
+        "http_clients": http_clients.started(),
+    }
+    try:
+        await db.ping(READY_DB_TIMEOUT_S)
+        db_status = "ok"
+    except Exception as e:
+        db_status = f"error: {type(e).__name__}"
+    if READY_REQUIRE_DB:
+        checks["db"] = db_status == "ok"
+    ok = all(checks.values())
+    body = {"ready": ok, "checks": checks, "db": db_status, "startup_s": _state["startup_s"]}
+    return Response(json.dumps(body), status_code=200 if ok else 503, media_type="application/json")
+
+@app.get("/ai/stats")
+async def ai_stats():
+    return {
+        "caches": cache.all_stats(),
+        "singleflight": singleflight.all_stats(),
+        "chat_cache": CHAT_CACHE.stats(),
+        "upstreams": resilience.all_stats(),
+        "listings": listings_index.stats(),
+        "llm_routes": chains.LLM_ROUTES,
+    }
+
+# ---------- Admin ----------
+ADMIN_TOKEN = (os.getenv("ADMIN_TOKEN") or "").strip()
+
+def _require_admin(token: Optional[str]):
+    if not ADMIN_TOKEN:
+        raise HTTPException(403, "Admin endpoints disabled (set ADMIN_TOKEN)")
+    if token != ADMIN_TOKEN:
+        raise HTTPException(401, "Invalid admin token")
+
+@app.delete("/ai/admin/chat-cache")
+async def ai_admin_invalidate_chat_cache(
+    city: Optional[str] = Query(None, description="Drop answers mentioning this city; omit to clear all"),
+    x_admin_token: Optional[str] = Header(None),
+):
+    _require_admin(x_admin_token)
+    return {"invalidated": CHAT_CACHE.invalidate(city), "city": city}
+
 # ---------- Anonymous mode ----------
 @app.post("/ai/chat", response_model=GeneralChatResponse)
-def ai_chat(body: GeneralChatRequest):
+async def ai_chat(body: GeneralChatRequest):
     try:
-        answer = general_chat(body.question)
+        answer = await general_chat(body.question)
         return {"answer": answer}
     except Exception as e:
         raise HTTPException(500, f"Agent error: {e}")
 
+# ---------- Streaming (Server-Sent Events) ----------
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+_SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+@app.post("/ai/chat/stream")
+async def ai_chat_stream(body: GeneralChatRequest):
+    """Events: `delta` {"text"} per token batch, then `done` {"answer"}."""
+    async def events():
+        parts = []
+        try:
+            async for text in general_chat_stream(body.question):
+                parts.append(text)
+                yield _sse("delta", {"text": text})
+            yield _sse("done", {"answer": "".join(parts)})
+        except Exception as e:
+            yield _sse("error", {"detail": f"Agent error: {e}"})
+    return StreamingResponse(events(), media_type="text/event-stream", headers=_SSE_HEADERS)
+
+@app.post("/ai/plan/stream")
+async def ai_plan_stream(body: AgentPlanRequest):
+    """
+    Events: `itinerary` (one DayBlock), `activities` / `restaurants` (one
+    Activity), `packing` (one string) as each parses out of the model output,
+    then `done` with the full PlanResponse.
+    """
+    async def events():
+        try:
+            async for section, item in plan_with_context_stream(body):
+                yield _sse(section, item.model_dump() if hasattr(item, "model_dump") else item)
+        except Exception as e:
+            yield _sse("error", {"detail": f"Planner error: {e}"})
+    return StreamingResponse(events(), media_type="text/event-stream", headers=_SSE_HEADERS)
+
 # ---------- Logged-in bookings ----------
 @app.get("/ai/bookings")
-def ai_bookings(user_id: int = Query(..., description="Traveler user id")):
+async def ai_bookings(user_id: int = Query(..., description="Traveler user id")):
     try:
-        return {"bookings": fetch_upcoming_bookings(user_id)}
+        return {"bookings": await fetch_upcoming_bookings(user_id)}
     except Exception as e:
         raise HTTPException(500, f"DB error: {e}")
 
 # ---------- Logged-in planner ----------
 @app.post("/ai/plan", response_model=PlanResponse)
-def ai_plan(body: AgentPlanRequest):
+async def ai_plan(body: AgentPlanRequest):
     try:
-        return plan_with_context(body)
+        return await plan_with_context(body)
     except Exception as e:
-        raise HTTPException(500, f"Planner error: {e}")
\ No newline at end of file
+        raise HTTPException(500, f"Planner error: {e}")
+
+@app.post("/ai/plan/batch")
+async def ai_plan_batch(body: PlanBatchRequest, stream: bool = Query(True, description="SSE per plan; false returns one JSON list")):
+    """
+    Plan several bookings in one call: every upcoming booking of `user_id`,
+    or the explicit `requests`. Shared city/date context is fetched once.
+    Stream events: `plan` (PlanBatchItem) as each finishes, then `done` {"count"}
+    (or `error` {"detail"} if the batch itself fails partway).
+    """
+    reqs = list(body.requests)
+    if body.user_id is not None:
+        try:
+            rows = await fetch_upcoming_bookings(body.user_id)
+        except Exception as e:
+            raise HTTPException(500, f"DB error: {e}")
+        reqs += [
+            AgentPlanRequest(
+                booking=Booking(id=r["id"], location=str(r["location"]), start=str(r["start"])[:10],
+                                end=str(r["end"])[:10], guests=int(r["guests"] or 1)),
+                preferences=body.preferences, ask=body.ask,
+            )
+            for r in rows
+        ]
+    if not reqs:
+        raise HTTPException(400, "Nothing to plan: pass user_id with upcoming bookings, or requests")
+
+    def _item(i: int, result) -> PlanBatchItem:
+        if isinstance(result, Exception):
+            return PlanBatchItem(index=i, booking=reqs[i].booking, error=f"Planner error: {result}")
+        return PlanBatchItem(index=i, booking=reqs[i].booking, plan=result)
+
+    if not stream:
+        try:
+            items = [_item(i, r) async for i, r in plan_batch(reqs)]
+        except Exception as e:
+            raise HTTPException(500, f"Planner error: {e}")
+        return PlanBatchResponse(plans=sorted(items, key=lambda it: it.index))
+
+    async def events():
+        try:
+            async for i, result in plan_batch(reqs):
+                yield _sse("plan", _item(i, result).model_dump())
+            yield _sse("done", {"count": len(reqs)})
+        except Exception as e:
+            yield _sse("error", {"detail": f"Planner error: {e}"})
+    return StreamingResponse(events(), media_type="text/event-stream", headers=_SSE_HEADERS)
@@ -0,0 +1,119 @@
+# agent/bench/bench_bookings_query.py
+"""
+Upcoming-bookings query: old vs indexed, on a seeded SQLite stand-in.
+
+Seeds `bookings` (default 1M rows) + `properties` into a throwaway SQLite
+file, then times the traveler lookup /ai/bookings runs for random travelers:
+
+  old       DATE(start) >= today OR DATE(end) >= today, no index  (previous query)
+  old+idx   same predicate with the composite index present
+  new+idx   end >= today with the composite index                  (bookings_repo)
+
+and reports p50/p99 per variant, plus the query plan for each. The index
+turns a full-table scan into a per-traveler seek, which is where nearly all
+of the win is; the bare-column predicate only matters once a traveler has a
+long booking history (MySQL can then range on the date columns too).
+SQLite's planner is not MySQL's, so read the plans as indicative.
+
+    cd agent && python bench/bench_bookings_query.py [--rows 1000000] [--queries 300] [--db /tmp/bookings_bench.sqlite]
+
+The seeded file is reused on later runs with the same --rows.
+"""
+import os, time, random, sqlite3, argparse, tempfile, statistics
+from datetime import date, timedelta
+
+STATUSES = ("PENDING", "ACCEPTED", "CONFIRMED", "CANCELLED")
+SELECT = """
+    SELECT b.id, p.location, p.name, b.start_date, b.end_date, b.guests
+    FROM bookings b JOIN properties p ON p.id = b.property_id
+    WHERE b.traveler_id = ? AND b.status IN ('PENDING','ACCEPTED','CONFIRMED')
+      AND {pred}
+    ORDER BY b.start_date LIMIT 25
+"""
+OLD_PRED = "(DATE(b.start_date) >= DATE('now') OR DATE(b.end_date) >= DATE('now'))"
+NEW_PRED = "b.end_date >= DATE('now')"
+INDEX = "CREATE INDEX IF NOT EXISTS idx_bookings_traveler_status_start ON bookings (traveler_id, status, start_date, end_date)"
+
+
+def seed(path: str, rows: int, travelers: int, properties: int) -> sqlite3.Connection:
+    if os.path.exists(path):
+        conn = sqlite3.connect(path)
+        try:
+            if conn.execute("SELECT COUNT(*) FROM bookings").fetchone()[0] == rows:
+                return conn
+        except sqlite3.Error:
+            pass
+        conn.close()
+        os.remove(path)
+
+    t0 = time.perf_counter()
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        PRAGMA journal_mode = OFF; PRAGMA synchronous = OFF;
+        CREATE TABLE properties (id INTEGER PRIMARY KEY, name TEXT, location TEXT);
+        CREATE TABLE bookings (id INTEGER PRIMARY KEY, property_id INT NOT NULL, traveler_id INT NOT NULL,
+                               start_date TEXT NOT NULL, end_date TEXT NOT NULL, guests INT NOT NULL, status TEXT);
+    """)
+    rng = random.Random(7)
+    conn.executemany("INSERT INTO properties VALUES (?, ?, ?)",
+                     ((i, f"Stay {i}", f"City {i % 500}") for i in range(1, properties + 1)))
+    today = date.today()
+
+    def _rows():
+        for i in range(1, rows + 1):
+            start = today + timedelta(days=rng.randint(-730, 365))   # mostly past trips, like a real table
+            yield (i, rng.randint(1, properties), rng.randint(1, travelers), start.isoformat(),
+                   (start + timedelta(days=rng.randint(1, 14))).isoformat(), rng.randint(1, 6),
+                   rng.choice(STATUSES))
+
+    conn.executemany("INSERT INTO bookings VALUES (?, ?, ?, ?, ?, ?, ?)", _rows())
+    conn.commit()
+    print(f"seeded {rows:,} bookings in {time.perf_counter() - t0:.1f}s -> {path}")
+    return conn
+
+
+def run(conn: sqlite3.Connection, sql: str, ids) -> dict:
+    lat = []
+    for uid in ids:
+        t0 = time.perf_counter()
+        conn.execute(sql, (uid,)).fetchall()
+        lat.append(time.perf_counter() - t0)
+    lat.sort()
+    return {"p50": statistics.median(lat), "p99": lat[min(len(lat) - 1, int(len(lat) * 0.99))]}
+
+
+def plan(conn: sqlite3.Connection, sql: str) -> str:
+    return "; ".join(r[-1] for r in conn.execute("EXPLAIN QUERY PLAN " + sql, (1,)))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    ap.add_argument("--travelers", type=int, default=50_000)
+    ap.add_argument("--properties", type=int, default=10_000)
+    ap.add_argument("--queries", type=int, default=300)
+    ap.add_argument("--db", default=os.path.join(tempfile.gettempdir(), "bookings_bench.sqlite"))
+    args = ap.parse_args()
+
+    conn = seed(args.db, args.rows, args.travelers, args.properties)
+    rng = random.Random(1)
+    ids = [rng.randint(1, args.travelers) for _ in range(args.queries)]
+    old, new = SELECT.format(pred=OLD_PRED), SELECT.format(pred=NEW_PRED)
+
+    results = []
+    conn.execute("DROP INDEX IF EXISTS idx_bookings_traveler_status_start")
+    results.append(("old", plan(conn, old), run(conn, old, ids[: max(args.queries // 10, 10)])))  # full scans: fewer samples
+    t0 = time.perf_counter()
+    conn.execute(INDEX)
+    print(f"index build: {time.perf_counter() - t0:.1f}s")
+    results.append(("old+idx", plan(conn, old), run(conn, old, ids)))
+    results.append(("new+idx", plan(conn, new), run(conn, new, ids)))
+
+    print(f"\n{'variant':8} {'p50 ms':>9} {'p99 ms':>9}  plan")
+    for name, qp, r in results:
+        print(f"{name:8} {r['p50'] * 1e3:>9.3f} {r['p99'] * 1e3:>9.3f}  {qp}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# agent/bench/bench_chat_cache.py
+"""
+Corpus check + micro-benchmark for the anonymous chat answer cache.
+
+Each case stores one question, then asks another and says whether it must
+hit (rewording with stopwords, punctuation, case) or miss (another city, month or
+number). The script fails (exit 1) if any case goes the wrong way, then
+reports the lookup cost (paraphrased asks) over a cache filled with
+--entries generated questions.
+
+    cd agent && python bench/bench_chat_cache.py [--entries 5000] [--lookups 5000]
+"""
+import os, sys, time, random, argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from chat_cache import ChatCache  # noqa: E402
+
+# (stored question, asked question, expect a hit)
+CORPUS = [
+    ("When is the best time to visit Lisbon?", "best time to visit lisbon", True),
+    ("What's the weather like in Porto in May?", "Whats the weather like in Porto in May", True),
+    ("Can you tell me the best beaches near Lisbon?", "best beaches near lisbon", True),
+    ("Weather in Lisbon in May", "Weather in Porto in May", False),
+    ("Weather in Lisbon in May", "Weather in Lisbon in June", False),
+    ("Plan 3 days in Rome", "Plan 5 days in Rome", False),
+    ("Where should 2 people stay in Miami?", "Where should 8 people stay in Miami?", False),
+    ("Hotels in Paris under $150 a night", "Hotels in Paris under $250 a night", False),
+]
+
+CITIES = ["Lisbon", "Porto", "Rome", "Paris", "Kyoto", "Miami", "Berlin", "Seville", "Oslo", "Quebec"]
+TEMPLATES = ["What is the weather in {c} in {m}?", "Best things to do in {c} for {n} days",
+             "Where should {n} people stay in {c}?", "Is {c} good for a family trip in {m}?"]
+MONTHS = ["January", "March", "May", "July", "September", "November"]
+
+
+def _fill(n, rng):
+    for _ in range(n):
+        yield rng.choice(TEMPLATES).format(c=rng.choice(CITIES), m=rng.choice(MONTHS), n=rng.randint(1, 9))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--entries", type=int, default=5000)
+    ap.add_argument("--lookups", type=int, default=5000)
+    args = ap.parse_args()
+
+    failures = 0
+    print(f"{'stored':46} {'asked':40} {'want':>5} {'got':>5}")
+    for stored, asked, want in CORPUS:
+        cache = ChatCache(ttl_s=60, max_entries=100, similarity=0.8)
+        cache.set(stored, "answer")
+        got = cache.get(asked) is not None
+        failures += got != want
+        print(f"{stored:46} {asked:40} {'hit' if want else 'miss':>5} {'hit' if got else 'miss':>5}"
+              f"{'' if got == want else '   <-- wrong'}")
+
+    rng = random.Random(9)
+    cache = ChatCache(ttl_s=3600, max_entries=args.entries, similarity=0.8)
+    for q in _fill(args.entries, rng):
+        cache.set(q, "answer")
+    asks = list(_fill(args.lookups, rng))
+    t0 = time.perf_counter()
+    for q in asks:
+        cache.get("Please tell me: " + q.lower())
+    per = (time.perf_counter() - t0) / len(asks)
+    st = cache.stats()
+    print(f"\nlookup: {per * 1e6:.0f} µs/question over {st['size']} entries "
+          f"(exact {st['exact_hits']}, similar {st['similar_hits']}, miss {st['misses']})")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# agent/bench/bench_climate.py
+"""
+Lookup cost of the climate normals store vs. the network weather path.
+
+Builds a synthetic store (--cells populated 0.25° cells plus a small
+gazetteer) in a temp dir, then reports:
+
+  open       mmap + header parse
+  exact      nearest() when the point's own cell is populated
+  ring       nearest() when only a neighbouring cell is populated
+  e2e        summarize_weather() for a stay months away, with the
+             geocode / forecast stages checked to be untouched
+  chat       the chat path: place and month pulled from sample questions
+             (places.extract_place with chains._known_place,
+             chains._month_window), then summarize_weather() — also
+             required to find every place and to make no network call
+
+    cd agent && python bench/bench_climate.py [--cells 200000] [--lookups 20000]
+"""
+import os, sys, time, random, asyncio, argparse, datetime, tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import climate  # noqa: E402
+import places  # noqa: E402
+
+RES = 0.25
+CITIES = {"lisbon": (38.7223, -9.1393), "porto": (41.1579, -8.6291), "reykjavik": (64.1466, -21.9426)}
+QUESTIONS = [
+    "What is the weather like in Lisbon in {month}?",
+    "Is Porto good for a family trip in {month}?",
+    "What should I pack for Reykjavik in {month}?",
+    "whats the weather in porto in {month_lc}",   # lowercase: found via the gazetteer
+]
+
+
+def build(path, n_cells, rng):
+    ncols = int(360 / RES)
+    cells = {}
+    for name, (lat, lon) in CITIES.items():
+        r, c, _ = climate._cell(lat, lon, RES)
+        cells[r * ncols + c] = None
+    while len(cells) < n_cells:
+        cells[rng.randrange(int(180 / RES) * ncols)] = None
+    for cid in cells:
+        base = rng.uniform(-5, 28)
+        cells[cid] = [[base + 6 + m % 6, base - 2 + m % 6, rng.uniform(0, 200), rng.uniform(0, 20)]
+                      for m in range(12)]
+    climate.write_store(path, RES, cells, CITIES)
+
+
+def per_call(fn, args_list):
+    t0 = time.perf_counter()
+    for a in args_list:
+        fn(*a)
+    return (time.perf_counter() - t0) / len(args_list)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--cells", type=int, default=200_000)
+    ap.add_argument("--lookups", type=int, default=20_000)
+    args = ap.parse_args()
+    rng = random.Random(7)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "normals.bin")
+        build(path, args.cells, rng)
+        t0 = time.perf_counter()
+        store = climate.ClimateStore(path)
+        t_open = time.perf_counter() - t0
+        print(f"store      {args.cells} cells, {os.path.getsize(path) / 1e6:.1f} MB, open {t_open * 1e6:.0f} µs")
+
+        ids = list(store._cells)
+        ncols = int(360 / RES)
+        exact = []
+        for cid in rng.sample(ids, min(args.lookups, len(ids))):
+            r, c = divmod(cid, ncols)
+            exact.append(((r + 0.5) * RES - 90, (c + 0.5) * RES - 180))
+        near = [(lat + RES * 1.2, lon) for lat, lon in exact]
+        print(f"exact      {per_call(store.nearest, exact) * 1e6:6.2f} µs/lookup")
+        print(f"ring       {per_call(store.nearest, near) * 1e6:6.2f} µs/lookup (misses search 2 rings)")
+
+        # End to end through the weather tool, with this store installed
+        os.environ.setdefault("GEOCODE_CACHE_BACKEND", "memory")
+        from tools import weather
+        from metrics import STAGE_SECONDS
+        climate._store, climate._store_missing = store, False
+        start = datetime.date.today() + datetime.timedelta(days=120)
+        end = start + datetime.timedelta(days=4)
+        q = f"Lisbon | {start} to {end}"
+        text = asyncio.run(weather.summarize_weather(q))
+        t0 = time.perf_counter()
+        n = 2000
+        for _ in range(n):
+            asyncio.run(weather.summarize_weather(q))
+        e2e = (time.perf_counter() - t0) / n
+        network = sum(STAGE_SECONDS.count(stage=s, outcome=o)
+                      for s in ("geocode", "forecast") for o in ("ok", "error"))
+        print(f"e2e        {e2e * 1e6:6.0f} µs/summary incl. asyncio.run, network stages hit: {network}")
+        print(f"           {text}")
+
+        # Same, but the way /ai/chat gets there: from the question text
+        os.environ.setdefault("ANTHROPIC_API_KEY", "sk-ant-bench")
+        import chains
+        month = climate.MONTH_NAMES[(datetime.date.today().month + 3) % 12]   # ~4 months out
+        missed = 0
+        for q in (t.format(month=month, month_lc=month.lower()) for t in QUESTIONS):
+            city = places.extract_place(q, chains._known_place)
+            if city is None:
+                missed += 1
+                print(f"chat       {q!r} -> no place found")
+                continue
+            mn, _ = chains._extract_month(q)
+            s, e = chains._month_window(mn)
+            text = asyncio.run(weather.summarize_weather(f"{city} | {s} to {e}"))
+            print(f"chat       {q!r} -> {city!r}: {text[:70]}…")
+        network = sum(STAGE_SECONDS.count(stage=s, outcome=o)
+                      for s in ("geocode", "forecast") for o in ("ok", "error"))
+        print(f"           network stages hit: {network}")
+        climate._store = None
+        store.close()
+    sys.exit(1 if network or missed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+# agent/bench/bench_context.py
+"""
+Prompt tokens vs. grounding for the Tavily context builder.
+
+Runs a fixed corpus of Tavily-shaped responses (listicles, syndicated copies,
+tracking-param duplicates, cookie banners, long run-on excerpts) through both
+the legacy concatenate-and-truncate snippet and context_compress, and reports
+per section:
+
+  tokens  — estimated prompt tokens of the block (~4 chars/token)
+  recall  — share of the gold venues (the real places a good plan should be
+            grounded on) still present in the block
+
+Recall is a proxy for plan quality: the planner can only ground items on
+venues it can see. The script exits 1 if compression loses recall vs legacy.
+
+    cd agent && python bench/bench_context.py [--rounds 200]
+"""
+import os, sys, time, argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from context_compress import compress_results, estimate_tokens, BUDGETS  # noqa: E402
+
+COOKIE = "We use cookies to improve your experience. By continuing you accept our privacy policy. "
+NEWSLETTER = "Subscribe to our newsletter for weekly travel deals! "
+
+
+def _r(url, title, content, score):
+    return {"url": url, "title": title, "content": content, "score": score}
+
+
+POI_LISBON = (
+    "Best things to do in Lisbon between 2030-05-01 and 2030-05-04. Include addresses and note "
+    "kid-friendly or wheelchair-friendly if relevant. Hints from user: ",
+    "Lisbon's top sights are in Belém and the old town hills.",
+    [
+        _r("https://www.timeout.com/lisbon/things-to-do/best-things-to-do-in-lisbon?utm_source=x",
+           "The 30 best things to do in Lisbon", COOKIE +
+           "Lisbon is a city of hills, trams and viewpoints, and there is plenty to fill a long weekend. "
+           "Jerónimos Monastery in Belém (Praça do Império 1400-206) is a UNESCO-listed masterpiece of "
+           "Manueline architecture; arrive at opening to beat the queues. Just down the riverfront, "
+           "Belém Tower guards the Tagus and is partly accessible to wheelchairs at ground level. "
+           "In the Alfama district, São Jorge Castle (Rua de Santa Cruz do Castelo) offers the best views "
+           "over the city. " + NEWSLETTER +
+           "Nothing beats a ride on the historic Tram 28 from Martim Moniz through the narrow streets, "
+           "although kids may prefer the Oceanário de Lisboa at Parque das Nações, one of Europe's largest aquariums.",
+           0.93),
+        _r("https://timeout.com/lisbon/things-to-do/best-things-to-do-in-lisbon",
+           "The 30 best things to do in Lisbon (2030)",
+           "Jerónimos Monastery in Belém (Praça do Império 1400-206) is a UNESCO-listed masterpiece of "
+           "Manueline architecture; arrive at opening to beat the queues.", 0.91),
+        _r("https://travelblog.example.com/lisbon-itinerary",
+           "Lisbon in 3 days: the perfect itinerary",
+           "Day one is for Belém: the Jerónimos Monastery, Belém Tower and the riverside MAAT museum "
+           "(Av. Brasília) with its walkable roof. On day two, wander Alfama and climb to the Miradouro "
+           "de Santa Luzia before lunch. In the evening, catch a fado show in Alfama. Day three is "
+           "for the Calouste Gulbenkian Museum (Av. de Berna 45A), a calm, fully step-free collection "
+           "that is great in case of rain. " + COOKIE, 0.88),
+        _r("https://syndicated.example.net/lisbon-itinerary-copy",
+           "Lisbon in 3 days: the perfect itinerary (repost)",
+           "Day one is for Belém: the Jerónimos Monastery, Belém Tower and the riverside MAAT museum "
+           "(Av. Brasília) with its walkable roof. On day two, wander Alfama and climb to the Miradouro "
+           "de Santa Luzia before lunch. In the evening, catch a fado show in Alfama.", 0.80),
+        _r("https://www.lonelyplanet.com/portugal/lisbon/attractions",
+           "Must-see attractions in Lisbon",
+           "Lisbon rewards the curious wanderer. " * 8 +
+           "LX Factory (Rua Rodrigues de Faria 103) is a converted industrial complex in Alcântara full of "
+           "bookshops, cafes and Sunday markets. The Elevador de Santa Justa lifts you from Baixa to Carmo, "
+           "where the roofless Carmo Convent ruins are a haunting sight.", 0.77),
+        _r("https://kids.example.org/lisbon-with-kids",
+           "Lisbon with kids: 10 family-friendly ideas",
+           "Click here to read more family guides. The Oceanário de Lisboa is the obvious pick. "
+           "Pavilhão do Conhecimento science centre (Largo José Mariano Gago 1) is hands-on and "
+           "stroller friendly, and the Jardim Zoológico at Praça Marechal Humberto Delgado has a cable car.",
+           0.71),
+        _r("https://forum.example.com/t/lisbon-tips",
+           "Lisbon tips thread", "honestly just walk around lol. we did the tram and it was packed. "
+           "would go again maybe in winter", 0.35),
+        _r("https://www.lonelyplanet.com/portugal/lisbon/top-things-to-do",
+           "Top things to do in Lisbon",
+           "Sintra, a short train ride from Rossio station, is the classic day trip: Pena Palace and "
+           "the Moorish Castle sit in misty hills above the town.", 0.69),
+    ],
+    ["Jerónimos", "Belém Tower", "São Jorge", "Tram 28", "Oceanário", "MAAT", "Gulbenkian",
+     "LX Factory", "Santa Justa", "Carmo", "Pavilhão do Conhecimento", "Zoológico", "Pena Palace"],
+)
+
+FOOD_LISBON = (
+    "Best restaurants in Lisbon between 2030-05-01 and 2030-05-04. Prefer options matching dietary hints from: vegetarian",
+    "",
+    [
+        _r("https://www.eater.com/maps/best-lisbon-restaurants",
+           "The 18 essential Lisbon restaurants",
+           COOKIE + "Time Out Market (Av. 24 de Julho 49) gathers dozens of the city's chefs under one roof. "
+           "Cervejaria Ramiro (Av. Almirante Reis 1) is the place for garlic prawns and a steak sandwich to finish. "
+           "For pastries, Pastéis de Belém (Rua de Belém 84-92) has been baking custard tarts since 1837. "
+           "Taberna da Rua das Flores (Rua das Flores 103) serves small plates on a chalkboard menu. "
+           "Affiliate links may earn us a commission.", 0.92),
+        _r("https://www.eater.com/maps/best-lisbon-restaurants?ref=home",
+           "The 18 essential Lisbon restaurants",
+           "Time Out Market (Av. 24 de Julho 49) gathers dozens of the city's chefs under one roof.", 0.90),
+        _r("https://veggie.example.com/lisbon",
+           "Vegetarian and vegan Lisbon",
+           "Ao 26 Vegan Food Project (Rua do Vale 26) does hearty plant-based Portuguese dishes. "
+           "Jardim das Cerejas (Calçada do Sacramento 38) is a vegetarian buffet near Chiado. "
+           "The Food Temple in Mouraria has a short daily vegan menu and tables on the steps outside.", 0.86),
+        _r("https://blog.example.com/where-to-eat-lisbon",
+           "Where to eat in Lisbon: a local's list",
+           "We love this city and all of its food. " * 6 + "A Cevicheria (Rua Dom Pedro V 129) with the giant octopus on the ceiling, "
+           "and O Velho Eurico (Largo São Cristóvão 3) for classic tasca food.", 0.74),
+        _r("https://blog.example.com/where-to-eat-lisbon-part-2",
+           "Where to eat in Lisbon: part 2",
+           "Manteigaria (Rua do Loreto 2) makes the best pastel de nata in Chiado, warm from the oven. "
+           "Zé da Mouraria serves enormous plates of bacalhau at lunch only.", 0.70),
+        _r("https://reviews.example.com/lisbon",
+           "Lisbon restaurant reviews", "Sign up to see more reviews. Log in to continue reading.", 0.40),
+    ],
+    ["Time Out Market", "Ramiro", "Pastéis de Belém", "Rua das Flores", "Ao 26", "Jardim das Cerejas",
+     "Food Temple", "Cevicheria", "Velho Eurico", "Manteigaria", "Zé da Mouraria"],
+)
+
+CORPUS = [("poi", POI_LISBON), ("food", FOOD_LISBON)]
+
+
+def legacy_snippet(answer, results, max_len=1800):
+    """The previous tavily_snippet body, verbatim."""
+    lines = []
+    if answer:
+        lines.append(f"Summary from Tavily: {answer.strip()}")
+    for idx, item in enumerate(results[:8], start=1):
+        score = item.get("score", None)
+        score_str = f"{score:.2f}" if isinstance(score, (int, float)) else "N/A"
+        lines.append(f"- #{idx} TITLE: {item.get('title') or ''}\n  SCORE: {score_str}\n"
+                     f"  EXCERPT: {(item.get('content') or '')[:500]}\n  SOURCE: {item.get('url') or ''}")
+    return "\n".join(lines)[:max_len] or "No web results found."
+
+
+def recall(text, gold):
+    return sum(g.lower() in text.lower() for g in gold) / len(gold)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rounds", type=int, default=200)
+    ap.add_argument("--show", action="store_true", help="print the compressed blocks")
+    args = ap.parse_args()
+
+    worse = 0
+    tot_old = tot_new = 0
+    print(f"{'section':8} {'legacy tok':>10} {'new tok':>8} {'saved':>6} {'legacy recall':>14} {'new recall':>11}")
+    for section, (query, answer, results, gold) in CORPUS:
+        old = legacy_snippet(answer, results)
+        new = compress_results(query, results, budget_tokens=BUDGETS[section], answer=answer)
+        t_old, t_new = estimate_tokens(old), estimate_tokens(new)
+        r_old, r_new = recall(old, gold), recall(new, gold)
+        tot_old, tot_new = tot_old + t_old, tot_new + t_new
+        worse += r_new < r_old
+        print(f"{section:8} {t_old:>10} {t_new:>8} {1 - t_new / t_old:>6.0%} {r_old:>14.0%} {r_new:>11.0%}")
+        if args.show:
+            print(new, "\n")
+    print(f"{'total':8} {tot_old:>10} {tot_new:>8} {1 - tot_new / tot_old:>6.0%}")
+
+    t0 = time.perf_counter()
+    for _ in range(args.rounds):
+        for section, (query, answer, results, _) in CORPUS:
+            compress_results(query, results, budget_tokens=BUDGETS[section], answer=answer)
+    per = (time.perf_counter() - t0) / (args.rounds * len(CORPUS))
+    print(f"\ncompress_results: {per * 1e6:.0f} µs/section")
+    sys.exit(1 if worse else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# agent/bench/bench_listings.py
+"""
+Lookup cost of the in-process listings index (listings_index.py).
+
+Loads --rows synthetic `properties` rows (cities with multi-word names,
+state/country codes, list- and dict-shaped amenities JSON), then reports:
+
+  build      ListingsIndex.add for all rows, and the numeric column bytes
+  city       search("New York") — place match only
+  filtered   search with budget, party size and an amenity
+  block      the chat path on a question: places.extract_place, then
+             chains._listings_block (budget/party parsing, amenity
+             detection, search and prompt formatting)
+
+Exits 1 if any lookup averages over --max-lookup-us, so it can gate CI next
+to the other bench scripts.
+
+    cd agent && python bench/bench_listings.py [--rows 100000] [--lookups 5000] [--max-lookup-us 1000]
+"""
+import os, sys, json, time, random, argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import listings_index  # noqa: E402
+import places  # noqa: E402
+
+CITIES = [("New York, NY", "US"), ("Miami, FL", "US"), ("San Diego, CA", "US"), ("San Jose, CA", "US"),
+          ("Lisbon", "Portugal"), ("Porto", "Portugal"), ("Paris", "France"), ("Kyoto", "Japan")]
+AMENITIES = ["wifi", "ac", "pool", "parking", "washer", "kitchen", "gym", "elevator", "hot tub", "workspace"]
+TYPES = ["apartment", "house", "studio", "villa", "cabin"]
+
+
+def rows(n, rng):
+    for i in range(1, n + 1):
+        loc, country = rng.choice(CITIES)
+        am = rng.sample(AMENITIES, rng.randint(1, 5))
+        yield {
+            "id": i, "name": f"Listing {i}", "type": rng.choice(TYPES), "location": loc, "country": country,
+            "amenities": json.dumps(am if i % 3 else {a: True for a in am}),
+            "price_per_night": round(rng.uniform(40, 600), 2),
+            "bedrooms": rng.randint(1, 5), "max_guests": rng.randint(1, 10),
+        }
+
+
+def per_call(fn, n):
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=100_000)
+    ap.add_argument("--lookups", type=int, default=5000)
+    ap.add_argument("--max-lookup-us", type=float, default=1000.0)
+    args = ap.parse_args()
+    rng = random.Random(21)
+
+    idx = listings_index.ListingsIndex()
+    data = list(rows(args.rows, rng))
+    t0 = time.perf_counter()
+    idx.add(data)
+    t_build = time.perf_counter() - t0
+    print(f"build      {len(idx)} rows in {t_build * 1000:.0f} ms, numeric columns + place groups {idx.nbytes() / 1e6:.1f} MB")
+
+    listings_index._index = idx
+    os.environ.setdefault("ANTHROPIC_API_KEY", "sk-ant-bench")
+    import chains
+    q = "Where should 4 of us stay in San Diego in July, under $200 a night with a pool?"
+    results = {
+        "city": per_call(lambda: idx.search("New York"), args.lookups),
+        "filtered": per_call(lambda: idx.search("Miami, FL in May", max_price=150, guests=4, amenities=["pool"]),
+                             args.lookups),
+        "block": per_call(lambda: chains._listings_block(places.extract_place(q), q, 3), args.lookups),
+    }
+    for name, s in results.items():
+        print(f"{name:10} {s * 1e6:8.1f} µs/lookup")
+    print("\n" + chains._listings_block(places.extract_place(q), q, 3))
+
+    slow = [n for n, s in results.items() if s * 1e6 > args.max_lookup_us]
+    if slow:
+        print(f"\nFAIL: {', '.join(slow)} over --max-lookup-us {args.max_lookup_us:.0f}")
+    sys.exit(1 if slow else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# agent/bench/bench_plan_parser.py
+"""
+Corpus check + micro-benchmark for plan_parser.
+
+Each case is a realistic malformed planner output with the number of items
+we expect to salvage per section. The script fails (exit 1) if any case
+recovers fewer items than expected, then reports how many outputs the old
+strict json.loads path would have thrown away and the parse cost per output.
+
+    cd agent && python bench/bench_plan_parser.py [--rounds 200]
+"""
+import os, sys, json, time, argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from plan_parser import parse_plan, IncrementalPlanParser  # noqa: E402
+
+ACT = {"title": "Jerónimos Monastery", "address": "Praça do Império, Lisbon", "priceTier": "$$",
+       "duration": "2h", "tags": ["history"], "flags": {"wheelchair": True, "childFriendly": True}}
+FOOD = {"title": "Time Out Market", "address": "Av. 24 de Julho 49", "priceTier": "$$",
+        "duration": "1h", "tags": ["food hall"], "flags": {"wheelchair": True, "childFriendly": True}}
+
+
+def _day(date):
+    return {"date": date, "morning": [ACT], "afternoon": [ACT], "evening": [FOOD]}
+
+
+FULL = {
+    "itinerary": [_day("2030-05-01"), _day("2030-05-02"), _day("2030-05-03")],
+    "activities": [ACT, ACT],
+    "restaurants": [FOOD, FOOD],
+    "packing": ["sunscreen", "light jacket"],
+}
+CLEAN = json.dumps(FULL, ensure_ascii=False)
+PRETTY = json.dumps(FULL, ensure_ascii=False, indent=2)
+
+# (name, raw output, expected minimum {section: count})
+CORPUS = [
+    ("clean", CLEAN, {"itinerary": 3, "activities": 2, "restaurants": 2, "packing": 2}),
+    ("code_fence", "```json\n" + PRETTY + "\n```", {"itinerary": 3, "packing": 2}),
+    ("preamble", "Here is your itinerary for Lisbon:\n\n" + PRETTY + "\n\nEnjoy your trip!",
+     {"itinerary": 3, "restaurants": 2}),
+    ("trailing_commas", PRETTY.replace('"light jacket"\n', '"light jacket",\n').replace("}\n  ],", "},\n  ],"),
+     {"itinerary": 3, "packing": 2}),
+    ("truncated_in_string", PRETTY[: PRETTY.index('"restaurants"') + 60], {"itinerary": 3, "activities": 2}),
+    ("truncated_after_key", CLEAN[: CLEAN.index('"packing"') + len('"packing":')],
+     {"itinerary": 3, "activities": 2, "restaurants": 2}),
+    ("truncated_mid_day", CLEAN[: CLEAN.index('"2030-05-03"') + 40], {"itinerary": 2}),
+    ("string_blocks", json.dumps({"itinerary": [{"date": "2030-05-01", "morning": "Walk Alfama",
+                                                 "afternoon": ["Tram 28"], "evening": None}],
+                                  "packing": "umbrella"}),
+     {"itinerary": 1, "packing": 1}),
+    ("bad_price_tiers", json.dumps({"activities": [dict(ACT, priceTier="cheap"), dict(ACT, priceTier=3),
+                                                   dict(ACT, priceTier="$$-$$$")]}),
+     {"activities": 3}),
+    ("one_invalid_item", json.dumps({"activities": [ACT, {"address": "no title"}, "Belém Tower"]}),
+     {"activities": 2}),
+    ("smart_quotes", CLEAN.replace('"packing": ["sunscreen"', "“packing”: [“sunscreen”"),
+     {"itinerary": 3, "packing": 2}),
+    ("raw_newline_in_string", CLEAN.replace("Praça do Império, Lisbon", "Praça do Império,\nLisbon"),
+     {"itinerary": 3}),
+]
+
+
+def _counts(plan):
+    return {k: len(getattr(plan, k)) for k in ("itinerary", "activities", "restaurants", "packing")} if plan else {}
+
+
+def _strict_ok(raw):
+    try:
+        json.loads(raw)
+        return True
+    except ValueError:
+        return False
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rounds", type=int, default=200)
+    ap.add_argument("--chunk", type=int, default=12, help="chars per simulated stream chunk")
+    args = ap.parse_args()
+
+    failures = 0
+    print(f"{'case':24} {'strict':>6} {'days':>5} {'acts':>5} {'food':>5} {'pack':>5} {'stream':>6}")
+    for name, raw, expected in CORPUS:
+        got = _counts(parse_plan(raw))
+        p = IncrementalPlanParser()
+        streamed = sum(len(p.feed(raw[i:i + args.chunk])) for i in range(0, len(raw), args.chunk))
+        ok = all(got.get(k, 0) >= v for k, v in expected.items())
+        failures += not ok
+        print(f"{name:24} {'ok' if _strict_ok(raw) else 'FAIL':>6} "
+              f"{got.get('itinerary', 0):>5} {got.get('activities', 0):>5} "
+              f"{got.get('restaurants', 0):>5} {got.get('packing', 0):>5} {streamed:>6}"
+              f"{'' if ok else '   <-- expected ' + json.dumps(expected)}")
+
+    strict_lost = sum(not _strict_ok(raw) for _, raw, _ in CORPUS)
+    print(f"\nstrict json.loads would discard {strict_lost}/{len(CORPUS)} outputs")
+
+    t0 = time.perf_counter()
+    for _ in range(args.rounds):
+        for _, raw, _ in CORPUS:
+            parse_plan(raw)
+    per = (time.perf_counter() - t0) / (args.rounds * len(CORPUS))
+    print(f"parse_plan: {per * 1e6:.0f} µs/output (avg over {args.rounds} rounds)")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# agent/bench/bench_startup.py
+"""
+Cold-start cost of the agent service: what a fresh uvicorn worker pays
+before it can take traffic.
+
+  import    `import app` in a fresh interpreter (median / max of --runs)
+  startup   the FastAPI lifespan: HTTP clients, LLM client, DB engine
+  lazy      modules that must NOT be imported by `import app` (they are
+            built in the lifespan or on first use)
+
+Each measurement runs in its own subprocess with placeholder credentials, an
+unreachable MySQL and the warmer and listings refresh off, so nothing leaves the machine. Exits 1
+if the median import exceeds --max-import-s or a lazy module is imported
+eagerly, so it can gate CI next to the other bench scripts.
+
+    cd agent && python bench/bench_startup.py [--runs 5] [--max-import-s 2.0] [--top 10]
+"""
+import os, sys, json, argparse, statistics, subprocess
+
+AGENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Heavy dependencies deferred out of the import path
+LAZY_MODULES = ("langchain_anthropic", "anthropic", "langchain.tools", "sqlalchemy",
+                "sqlalchemy.ext.asyncio")
+
+ENV = {
+    "ANTHROPIC_API_KEY": "sk-ant-bench",
+    "MYSQL_HOST": "127.0.0.1", "MYSQL_PORT": "1",   # refused immediately
+    "MYSQL_USER": "bench", "MYSQL_PASSWORD": "bench", "MYSQL_DATABASE": "bench",
+    "WARMER_INTERVAL_S": "0", "LISTINGS_REFRESH_S": "0",
+    "CACHE_BACKEND": "memory", "GEOCODE_CACHE_BACKEND": "memory",
+    "LOG_LEVEL": "ERROR",
+}
+
+IMPORT_SNIPPET = """
+import sys, time, json
+t0 = time.perf_counter()
+import app
+dt = time.perf_counter() - t0
+print(json.dumps({"import_s": dt, "lazy_loaded": [m for m in %r if m in sys.modules]}))
+""" % (LAZY_MODULES,)
+
+STARTUP_SNIPPET = """
+import time, json, asyncio
+import app
+async def main():
+    t0 = time.perf_counter()
+    async with app.app.router.lifespan_context(app.app):
+        up = time.perf_counter() - t0
+        t1 = time.perf_counter()
+    return up, time.perf_counter() - t1
+up, down = asyncio.run(main())
+print(json.dumps({"startup_s": up, "shutdown_s": down}))
+"""
+
+
+def _run(code, *args):
+    env = dict(os.environ, **ENV)
+    out = subprocess.run([sys.executable, *args, "-c", code], cwd=AGENT_DIR, env=env,
+                         capture_output=True, text=True, check=True)
+    return out
+
+
+def top_imports(n):
+    """Slowest modules imported directly by app.py (cumulative µs) from -X importtime."""
+    err = _run("import app", "-X", "importtime").stderr
+    rows = []
+    for line in err.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cum, name = line[len("import time:"):].split("|")
+        name = name[1:]   # two spaces of indent per nesting level below `app`
+        if cum.strip().isdigit() and name.startswith("  ") and not name.startswith("   "):
+            rows.append((int(cum), name.strip()))
+    return sorted(rows, reverse=True)[:n]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--max-import-s", type=float, default=2.0)
+    ap.add_argument("--top", type=int, default=10, help="show the N slowest top-level imports (0 = off)")
+    args = ap.parse_args()
+
+    imports, lazy_loaded = [], set()
+    for _ in range(args.runs):
+        r = json.loads(_run(IMPORT_SNIPPET).stdout.strip().splitlines()[-1])
+        imports.append(r["import_s"])
+        lazy_loaded.update(r["lazy_loaded"])
+    life = json.loads(_run(STARTUP_SNIPPET).stdout.strip().splitlines()[-1])
+
+    med = statistics.median(imports)
+    print(f"import app   median {med * 1000:7.0f} ms   max {max(imports) * 1000:7.0f} ms   ({args.runs} runs)")
+    print(f"lifespan     startup {life['startup_s'] * 1000:6.0f} ms   shutdown {life['shutdown_s'] * 1000:5.0f} ms")
+    print(f"cold start   {(med + life['startup_s']) * 1000:7.0f} ms")
+    if args.top:
+        print("\nslowest imports (cumulative):")
+        for us, name in top_imports(args.top):
+            print(f"  {us / 1000:7.0f} ms  {name}")
+
+    failed = False
+    if lazy_loaded:
+        print(f"\nFAIL: imported eagerly by `import app`: {', '.join(sorted(lazy_loaded))}")
+        failed = True
+    if med > args.max_import_s:
+        print(f"\nFAIL: median import {med:.2f}s > --max-import-s {args.max_import_s:.2f}s")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+# agent/bench/fake_upstreams.py
+"""
+Local stand-ins for every service the agent calls, on one port:
+
+    /anthropic/v1/messages     Anthropic Messages API (JSON and SSE streaming)
+    /tavily/search             Tavily search
+    /nominatim/search          Nominatim geocoding
+    /open-meteo/v1/forecast    Open-Meteo daily forecast
+
+Point the agent at it with (load_driver.py does this for you):
+
+    ANTHROPIC_API_URL=http://127.0.0.1:8900/anthropic
+    TAVILY_BASE_URL=http://127.0.0.1:8900/tavily
+    NOMINATIM_BASE_URL=http://127.0.0.1:8900/nominatim
+    OPEN_METEO_BASE_URL=http://127.0.0.1:8900/open-meteo
+
+Latency per service is a distribution spec:
+    const:MS | uniform:LO_MS:HI_MS | lognormal:MEDIAN_MS:SIGMA
+Anthropic latency is per request (time to first token when streaming);
+ANTHROPIC_TOKENS_PER_S paces generation (streamed deltas, or the wait before
+a non-streamed reply), and output is cut at the request's max_tokens.
+Prompt caching is mimicked in the reported usage: the text up to the last
+cache_control block (if at least --cache-min-tokens) is a cache write the
+first time per model and a cache read for the next 5 minutes. /_stats counts
+requests per model and cache reads/writes.
+
+    python bench/fake_upstreams.py --port 8900 \\
+        --latency anthropic=lognormal:1800:0.4 --latency tavily=lognormal:700:0.5 \\
+        --errors anthropic=0.02 --errors tavily=0.05 [--payloads DIR]
+
+--payloads DIR overrides the canned bodies with DIR/<service>.json files
+(anthropic.json: {"plan", "chat", "skeleton", "day", "extras": "..."} model
+texts, the last three for the chunked planner; tavily.json,
+nominatim.json, open_meteo.json: raw response bodies). "{city}" in any
+string is replaced with the city found in the request ("{date}" with the
+day being planned).
+"""
+import os, re, sys, json, time, zlib, random, asyncio, argparse
+from typing import Any, Dict, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+SERVICES = ("anthropic", "tavily", "nominatim", "open_meteo")
+
+
+# =========================
+# Latency / error models
+# =========================
+class Latency:
+    def __init__(self, spec: str):
+        kind, *args = spec.split(":")
+        self.spec, self.kind, self.args = spec, kind, [float(a) for a in args]
+        if kind not in ("const", "uniform", "lognormal"):
+            raise ValueError(f"unknown latency kind {kind!r} in {spec!r}")
+
+    def sample_s(self) -> float:
+        if self.kind == "const":
+            ms = self.args[0]
+        elif self.kind == "uniform":
+            ms = random.uniform(self.args[0], self.args[1])
+        else:  # lognormal: median, sigma
+            ms = random.lognormvariate(0.0, self.args[1]) * self.args[0]
+        return max(ms, 0.0) / 1000
+
+
+DEFAULT_LATENCY = {
+    "anthropic": "lognormal:1500:0.35",
+    "tavily": "lognormal:700:0.45",
+    "nominatim": "lognormal:120:0.3",
+    "open_meteo": "lognormal:90:0.3",
+}
+
+
+# =========================
+# Canned payloads
+# =========================
+def _activity(title: str, addr: str, tier: str = "$$") -> Dict[str, Any]:
+    return {"title": title, "address": addr, "priceTier": tier, "duration": "2h",
+            "tags": ["sightseeing"], "flags": {"wheelchair": True, "childFriendly": True}}
+
+
+DEFAULT_PLAN = {
+    "itinerary": [
+        {"date": d, "morning": [_activity("Old Town walking tour", "Main Square, {city}")],
+         "afternoon": [_activity("City Museum", "1 Museum Street, {city}")],
+         "evening": [_activity("Harbour dinner", "Harbour Road 12, {city}", "$$$")]}
+        for d in ("2030-05-01", "2030-05-02", "2030-05-03")
+    ],
+    "activities": [_activity("Botanical Garden", "Garden Lane 4, {city}", "$"),
+                   _activity("Castle viewpoint", "Castle Hill, {city}")],
+    "restaurants": [_activity("Market Hall", "Market Street 9, {city}"),
+                    _activity("Corner Bistro", "Rue de la Paix 3, {city}", "$$$")],
+    "packing": ["comfortable shoes", "light jacket", "sunscreen"],
+}
+
+
+def default_payloads() -> Dict[str, Any]:
+    return {
+        "anthropic": {
+            "plan": json.dumps(DEFAULT_PLAN),
+            "skeleton": json.dumps({"itinerary": [], "packing": DEFAULT_PLAN["packing"]}),
+            "day": json.dumps({"itinerary": [{
+                "date": "{date}",
+                "morning": [_activity("Neighbourhood walk ({date})", "Main Square, {city}")],
+                "afternoon": [_activity("Gallery visit ({date})", "1 Museum Street, {city}")],
+                "evening": [_activity("Dinner ({date})", "Harbour Road 12, {city}", "$$$")]}]}),
+            "extras": json.dumps({k: DEFAULT_PLAN[k] for k in ("activities", "restaurants")}),
+            "chat": "{city} is lovely in spring: mild days, few crowds and long evenings. "
+                    "Book popular museums ahead and pack layers for cool nights.",
+        },
+        "tavily": {
+            "answer": "{city} is known for its historic centre, museums and food markets.",
+            "results": [
+                {"url": f"https://guide{i}.example.com/{{city}}/top-{i}",
+                 "title": f"Top {10 + i} things to do in {{city}}",
+                 "content": f"The City Museum (1 Museum Street) anchors the old town of {{city}}. "
+                            f"Market Hall (Market Street 9) has {20 + i} food stalls. "
+                            f"The Botanical Garden on Garden Lane is free on Sundays.",
+                 "score": round(0.95 - i * 0.07, 2)}
+                for i in range(6)
+            ],
+        },
+        "nominatim": [{"lat": "38.7223", "lon": "-9.1393", "display_name": "{city}"}],
+        "open_meteo": {"daily": {
+            "time": ["2030-05-01", "2030-05-02", "2030-05-03"],
+            "temperature_2m_max": [24.0, 27.5, 22.1],
+            "temperature_2m_min": [14.2, 15.0, 13.8],
+            "precipitation_probability_max": [10, 45, 20],
+        }},
+    }
+
+
+DEFAULT_ANTHROPIC = default_payloads()["anthropic"]
+
+
+def _fill(obj: Any, city: str) -> Any:
+    if isinstance(obj, str):
+        return obj.replace("{city}", city)
+    if isinstance(obj, list):
+        return [_fill(v, city) for v in obj]
+    if isinstance(obj, dict):
+        return {k: _fill(v, city) for k, v in obj.items()}
+    return obj
+
+
+_DAY_RE = re.compile(r"PLAN THIS DAY: (\d{4}-\d{2}-\d{2})")
+_CITY_RE = re.compile(r"(?:City:\s*|\bin\s+|\bfor\s+)([A-Z][\w\-]+(?:[ ,]+[A-Z][\w\-]+)*)")
+
+
+def _city(text: str) -> str:
+    m = _CITY_RE.search(text or "")
+    return m.group(1).strip(" ,") if m else "the city"
+
+
+# =========================
+# App
+# =========================
+CACHE_TTL_S = 300
+
+
+def _cached_prefix(body: Dict[str, Any]) -> str:
+    """Prompt text up to the last cache_control breakpoint (system, then message blocks)."""
+    blocks = list(body["system"]) if isinstance(body.get("system"), list) else []
+    for m in body.get("messages", []):
+        if isinstance(m.get("content"), list):
+            blocks += m["content"]
+    last = max((i for i, b in enumerate(blocks) if isinstance(b, dict) and b.get("cache_control")), default=-1)
+    return "".join(b.get("text", "") for b in blocks[:last + 1] if isinstance(b, dict))
+
+
+def build_app(latency: Dict[str, Latency], errors: Dict[str, float], payloads: Dict[str, Any],
+              tokens_per_s: float, cache_min_tokens: int = 1024) -> FastAPI:
+    app = FastAPI(title="fake upstreams")
+    stats: Dict[str, Dict[str, int]] = {s: {"requests": 0, "errors": 0} for s in SERVICES}
+    prompt_cache: Dict[int, float] = {}   # hash(model, prefix) -> expiry
+
+    async def _delay_or_fail(service: str) -> Optional[JSONResponse]:
+        stats[service]["requests"] += 1
+        await asyncio.sleep(latency[service].sample_s())
+        if random.random() < errors.get(service, 0.0):
+            stats[service]["errors"] += 1
+            status = 529 if service == "anthropic" else 503
+            return JSONResponse({"type": "error", "error": {"type": "overloaded_error",
+                                 "message": "fake upstream error"}}, status_code=status)
+        return None
+
+    @app.get("/_stats")
+    async def _stats():
+        return stats
+
+    @app.post("/tavily/search")
+    async def tavily(request: Request):
+        body = await request.json()
+        fail = await _delay_or_fail("tavily")
+        if fail:
+            return fail
+        return _fill(payloads["tavily"], _city(body.get("query", "")))
+
+    @app.get("/nominatim/search")
+    async def nominatim(q: str = ""):
+        fail = await _delay_or_fail("nominatim")
+        if fail:
+            return fail
+        # Spread cities over distinct grid cells so forecast caching behaves like production
+        shift = (zlib.crc32(q.lower().encode()) % 2000) / 100
+        return [dict(p, lat=f"{float(p['lat']) + shift - 10:.4f}", lon=f"{float(p['lon']) + shift:.4f}")
+                if isinstance(p, dict) and "lat" in p else p for p in _fill(payloads["nominatim"], q)]
+
+    @app.get("/open-meteo/v1/forecast")
+    async def open_meteo():
+        fail = await _delay_or_fail("open_meteo")
+        return fail or payloads["open_meteo"]
+
+    @app.post("/anthropic/v1/messages")
+    async def anthropic(request: Request):
+        body = await request.json()
+        prompt = json.dumps(body.get("messages", []), ensure_ascii=False) + str(body.get("system", ""))
+        fail = await _delay_or_fail("anthropic")
+        if fail:
+            return fail
+        kind = ("skeleton" if "ITINERARY SKELETON" in prompt else "day" if "PLAN THIS DAY" in prompt
+                else "extras" if "EXTRA SUGGESTIONS" in prompt else "plan" if "JSON" in prompt else "chat")
+        text = _fill(payloads["anthropic"].get(kind) or DEFAULT_ANTHROPIC[kind], _city(prompt.replace("\\n", "\n")))
+        day = _DAY_RE.search(prompt)
+        text = text.replace("{date}", day.group(1) if day else "")
+        stop_reason = "end_turn"
+        if body.get("max_tokens") and len(text) > body["max_tokens"] * 4:   # truncate like the real API
+            text, stop_reason = text[:body["max_tokens"] * 4], "max_tokens"
+        usage = {"input_tokens": len(prompt) // 4, "output_tokens": len(text) // 4,
+                 "cache_creation_input_tokens": 0, "cache_read_input_tokens": 0}
+        model = body.get("model", "fake")
+        st = stats["anthropic"]
+        st[f"model:{model}"] = st.get(f"model:{model}", 0) + 1
+        prefix = _cached_prefix(body)
+        if len(prefix) // 4 >= cache_min_tokens:
+            key, now = hash((model, prefix)), time.monotonic()
+            kind = "read" if prompt_cache.get(key, 0) > now else "creation"
+            prompt_cache[key] = now + CACHE_TTL_S   # reads refresh the TTL too
+            usage[f"cache_{kind}_input_tokens"] = len(prefix) // 4
+            usage["input_tokens"] = max(usage["input_tokens"] - len(prefix) // 4, 0)
+            st[f"cache_{kind}"] = st.get(f"cache_{kind}", 0) + 1
+        msg = {"id": f"msg_fake_{int(time.time() * 1e6)}", "type": "message", "role": "assistant",
+               "model": model, "stop_reason": stop_reason, "stop_sequence": None}
+        if not body.get("stream"):
+            if tokens_per_s > 0:   # the whole answer is generated before it is returned
+                await asyncio.sleep(usage["output_tokens"] / tokens_per_s)
+            return dict(msg, content=[{"type": "text", "text": text}], usage=usage)
+
+        async def events():
+            def ev(name: str, data: Dict[str, Any]) -> str:
+                return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+            yield ev("message_start", {"type": "message_start", "message": dict(
+                msg, content=[], stop_reason=None, usage=dict(usage, output_tokens=1))})
+            yield ev("content_block_start", {"type": "content_block_start", "index": 0,
+                                             "content_block": {"type": "text", "text": ""}})
+            step = 16   # ~4 tokens per delta
+            for i in range(0, len(text), step):
+                yield ev("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                                 "delta": {"type": "text_delta", "text": text[i:i + step]}})
+                if tokens_per_s > 0:
+                    await asyncio.sleep(4 / tokens_per_s)
+            yield ev("content_block_stop", {"type": "content_block_stop", "index": 0})
+            yield ev("message_delta", {"type": "message_delta", "delta": {"stop_reason": stop_reason,
+                                       "stop_sequence": None}, "usage": {"output_tokens": usage["output_tokens"]}})
+            yield ev("message_stop", {"type": "message_stop"})
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def _pairs(values, cast) -> Dict[str, Any]:
+    out = {}
+    for v in values or []:
+        name, _, spec = v.partition("=")
+        name = name.replace("-", "_")
+        if name not in SERVICES:
+            raise SystemExit(f"unknown service {name!r}; expected one of {', '.join(SERVICES)}")
+        out[name] = cast(spec)
+    return out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Fake Anthropic / Tavily / Nominatim / Open-Meteo for load tests.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8900)
+    ap.add_argument("--latency", action="append", metavar="SERVICE=SPEC",
+                    help="e.g. tavily=lognormal:700:0.45 (repeatable)")
+    ap.add_argument("--errors", action="append", metavar="SERVICE=RATE", help="e.g. anthropic=0.02 (repeatable)")
+    ap.add_argument("--tokens-per-s", type=float, default=float(os.getenv("ANTHROPIC_TOKENS_PER_S", "120")),
+                    help="streamed output pace; 0 sends everything at once")
+    ap.add_argument("--payloads", help="directory with <service>.json overrides")
+    ap.add_argument("--cache-min-tokens", type=int, default=1024,
+                    help="shortest prefix the fake prompt cache stores (the API minimum for most models)")
+    ap.add_argument("--seed", type=int, default=None)
+    args = ap.parse_args(argv)
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    latency = {s: Latency(spec) for s, spec in {**DEFAULT_LATENCY, **_pairs(args.latency, str)}.items()}
+    errors = _pairs(args.errors, float)
+    payloads = default_payloads()
+    if args.payloads:
+        for s in SERVICES:
+            path = os.path.join(args.payloads, f"{s}.json")
+            if os.path.exists(path):
+                with open(path, encoding="utf-8") as f:
+                    payloads[s] = json.load(f)
+
+    import uvicorn
+    print(f"fake upstreams on http://{args.host}:{args.port} latency="
+          + ", ".join(f"{s}={l.spec}" for s, l in latency.items()), file=sys.stderr)
+    uvicorn.run(build_app(latency, errors, payloads, args.tokens_per_s, args.cache_min_tokens),
+                host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
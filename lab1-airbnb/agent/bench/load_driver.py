@@ -0,0 +1,421 @@
+# agent/bench/load_driver.py
+"""
+Closed-loop load driver for the agent, fully offline.
+
+By default boots bench/fake_upstreams.py and `uvicorn app:app` wired to it
+(ANTHROPIC_API_URL / TAVILY_BASE_URL / NOMINATIM_BASE_URL / OPEN_METEO_BASE_URL),
+runs `--concurrency` workers for `--duration` seconds over a weighted mix of
+endpoints, then reports:
+
+  - throughput and p50/p95/p99 latency per endpoint (plus time to first
+    event for the streaming endpoints)
+  - p50/p95/p99 per pipeline stage, from the agent's /metrics histograms
+    (diffed against a snapshot taken after warm-up)
+  - per LLM route and model: call count, p50/p95 latency, p50 time to first
+    token for streams, and tokens per call by kind (input, output, prompt
+    cache reads/writes), to check model routing and prompt caching
+  - upstream calls seen by the fakes
+
+    cd agent && python bench/load_driver.py --duration 30 --concurrency 16 \\
+        --mix chat=5,plan=3,plan_stream=2 --out runs/base.json
+    # change chains.py ...
+    python bench/load_driver.py --duration 30 --concurrency 16 \\
+        --mix chat=5,plan=3,plan_stream=2 --compare runs/base.json
+
+--compare exits 1 if any endpoint or stage p95 got more than --threshold
+(default 15%) slower, or throughput dropped by more than that.
+--agent-url targets an already running agent instead of booting one
+(its upstream env is then up to you). --unique makes every request miss
+the caches (distinct dates and questions, chat cache off) to measure the
+cold path; the default mix reuses a pool of cities the way real traffic does.
+--soon-share (default 0.5) of plan bookings start within the forecast
+window, so the geocode / forecast stages are measured; the rest start a
+month or more out and take the climate-normals path.
+Anything after --fake-args is passed to fake_upstreams.py (latency / errors).
+"""
+import os, re, sys, json, time, random, socket, asyncio, argparse, subprocess
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+AGENT_DIR = os.path.dirname(HERE)
+
+CITIES = ["Lisbon", "Porto", "Madrid", "Barcelona", "Rome", "Florence", "Paris", "Lyon", "Berlin",
+          "Munich", "Vienna", "Prague", "Amsterdam", "Copenhagen", "Dublin", "Edinburgh", "Athens",
+          "Istanbul", "Kyoto", "Tokyo"]
+MONTHS = ["January", "March", "May", "July", "September", "November"]
+QUESTIONS = [
+    "What is the weather like in {city} in {month}?",
+    "What should I pack for {city} in {month}?",
+    "Best neighbourhoods to stay in for {city}?",
+    "Is {city} good for a family trip in {month}?",
+]
+SOON_SHARE = 0.5   # --soon-share: bookings starting within the forecast window
+
+
+# =========================
+# Request builders
+# =========================
+def _booking(rng: random.Random, n: int, unique: bool) -> Dict[str, Any]:
+    # Stays inside the forecast window (FORECAST_HORIZON_DAYS, default 7) exercise
+    # the geocode + forecast stages; later ones are answered from climate normals
+    if rng.random() < SOON_SHARE:
+        day = n % 7 if unique else rng.randint(0, 6)
+    else:
+        day = 30 + ((n % 300) + 1 if unique else rng.randint(1, 5))
+    start = time.strftime("%Y-%m-%d", time.gmtime(time.time() + 86400 * day))
+    end = time.strftime("%Y-%m-%d", time.gmtime(time.time() + 86400 * (day + 2)))
+    return {"location": rng.choice(CITIES), "start": start, "end": end, "guests": rng.randint(1, 4)}
+
+
+def build_request(kind: str, rng: random.Random, n: int, unique: bool) -> Tuple[str, Dict[str, Any]]:
+    if kind in ("chat", "chat_stream"):
+        q = rng.choice(QUESTIONS).format(city=rng.choice(CITIES), month=rng.choice(MONTHS))
+        if unique:
+            q += f" (trip {n})"
+        return ("/ai/chat" if kind == "chat" else "/ai/chat/stream"), {"question": q}
+    if kind in ("plan", "plan_stream"):
+        return ("/ai/plan" if kind == "plan" else "/ai/plan/stream"), {"booking": _booking(rng, n, unique)}
+    if kind == "plan_batch":
+        return "/ai/plan/batch?stream=false", {"requests": [{"booking": _booking(rng, n * 3 + i, unique)}
+                                                             for i in range(3)]}
+    raise SystemExit(f"unknown endpoint kind {kind!r}")
+
+
+# =========================
+# Stats helpers
+# =========================
+def pct(sorted_vals: List[float], q: float) -> Optional[float]:
+    if not sorted_vals:
+        return None
+    return sorted_vals[min(len(sorted_vals) - 1, int(q * len(sorted_vals)))]
+
+
+_SAMPLE_RE = re.compile(r'^(?P<name>\w+)\{(?P<labels>[^}]*)\} (?P<v>[\d.e+]+)$')
+
+
+def parse_series(text: str, name: str) -> List[Tuple[Dict[str, str], float]]:
+    """(labels, value) for every sample of metric `name`."""
+    out = []
+    for line in text.splitlines():
+        m = _SAMPLE_RE.match(line)
+        if not m or m.group("name") != name:
+            continue
+        labels = dict(kv.split("=", 1) for kv in m.group("labels").split(","))
+        out.append(({k: v.strip('"') for k, v in labels.items()}, float(m.group("v"))))
+    return out
+
+
+def parse_buckets(text: str, metric: str, key) -> Dict[str, Dict[float, float]]:
+    """key(labels) -> {le: cumulative count}; series where key() returns None are skipped."""
+    out: Dict[str, Dict[float, float]] = defaultdict(dict)
+    for labels, v in parse_series(text, f"{metric}_bucket"):
+        k = key(labels)
+        if k is None:
+            continue
+        le = float("inf") if labels["le"] == "+Inf" else float(labels["le"])
+        out[k][le] = v
+    return out
+
+
+def parse_stage_buckets(text: str) -> Dict[str, Dict[float, float]]:
+    """stage -> {le: cumulative count} for outcome="ok" series."""
+    return parse_buckets(text, "agent_stage_seconds",
+                         lambda l: l["stage"] if l.get("outcome") == "ok" else None)
+
+
+def bucket_quantile(buckets: Dict[float, float], q: float) -> Optional[float]:
+    """Prometheus-style histogram_quantile over cumulative buckets."""
+    les = sorted(buckets)
+    total = buckets[les[-1]] if les else 0
+    if total <= 0:
+        return None
+    rank, prev_le, prev_c = q * total, 0.0, 0.0
+    for le in les:
+        c = buckets[le]
+        if c >= rank:
+            if le == float("inf"):
+                return prev_le
+            return prev_le + (le - prev_le) * ((rank - prev_c) / (c - prev_c) if c > prev_c else 1.0)
+        prev_le, prev_c = le, c
+    return prev_le
+
+
+def _diff_quantiles(b: Dict[str, Dict[float, float]], a: Dict[str, Dict[float, float]],
+                    qs=(0.5, 0.95, 0.99)) -> Dict[str, Dict[str, float]]:
+    out = {}
+    for k, buckets in a.items():
+        diff = {le: c - b.get(k, {}).get(le, 0.0) for le, c in buckets.items()}
+        count = diff.get(float("inf"), 0)
+        if count > 0:
+            out[k] = {"count": count, **{f"p{int(q * 100)}": bucket_quantile(diff, q) for q in qs}}
+    return out
+
+
+def stage_report(before: str, after: str) -> Dict[str, Dict[str, float]]:
+    return _diff_quantiles(parse_stage_buckets(before), parse_stage_buckets(after))
+
+
+def llm_report(before: str, after: str) -> Dict[str, Dict[str, float]]:
+    """"route model" -> call count, latency quantiles, stream TTFT p50, tokens per call by kind."""
+    key = lambda l: f"{l['route']} {l['model']}"   # noqa: E731
+    out = _diff_quantiles(parse_buckets(before, "agent_llm_seconds", key),
+                          parse_buckets(after, "agent_llm_seconds", key), qs=(0.5, 0.95))
+    ttft = _diff_quantiles(parse_buckets(before, "agent_llm_ttft_seconds", key),
+                           parse_buckets(after, "agent_llm_ttft_seconds", key), qs=(0.5,))
+    for k, r in ttft.items():
+        out.setdefault(k, {"count": r["count"]})["ttft_p50"] = r["p50"]
+    tokens_before = {(key(l), l["kind"]): v for l, v in parse_series(before, "agent_llm_tokens_total")}
+    for labels, v in parse_series(after, "agent_llm_tokens_total"):
+        k = key(labels)
+        if k in out:
+            out[k][labels["kind"]] = (v - tokens_before.get((k, labels["kind"]), 0.0)) / out[k]["count"]
+    return out
+
+
+# =========================
+# Processes
+# =========================
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _wait_ready(url: str, timeout_s: float = 60) -> None:
+    deadline = time.monotonic() + timeout_s
+    async with httpx.AsyncClient() as c:
+        while time.monotonic() < deadline:
+            try:
+                if (await c.get(url, timeout=2)).status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.25)
+    raise SystemExit(f"timed out waiting for {url}")
+
+
+def boot(args) -> Tuple[str, str, List[subprocess.Popen]]:
+    fake_port, agent_port = args.fake_port or _free_port(), args.port or _free_port()
+    fake = f"http://127.0.0.1:{fake_port}"
+    procs = [subprocess.Popen([sys.executable, os.path.join(HERE, "fake_upstreams.py"),
+                               "--port", str(fake_port), *args.fake_args])]
+    env = dict(os.environ)
+    env.update({
+        "ANTHROPIC_API_URL": f"{fake}/anthropic",
+        "TAVILY_BASE_URL": f"{fake}/tavily",
+        "NOMINATIM_BASE_URL": f"{fake}/nominatim",
+        "OPEN_METEO_BASE_URL": f"{fake}/open-meteo",
+        "LOG_LEVEL": env.get("LOG_LEVEL", "WARNING"),
+        "CACHE_BACKEND": "memory",
+        "GEOCODE_CACHE_BACKEND": "memory",     # runs start cold and leave no .cache behind
+        "WARMER_INTERVAL_S": "0",
+    })
+    for k, v in (("ANTHROPIC_API_KEY", "sk-ant-loadtest"), ("TAVILY_API_KEY", "tvly-loadtest"),
+                 ("MYSQL_USER", "loadtest"), ("MYSQL_PASSWORD", "loadtest"), ("MYSQL_DATABASE", "loadtest")):
+        env.setdefault(k, v)
+    if args.unique:
+        env["CHAT_CACHE_ENABLED"] = "0"
+    for kv in args.env or []:
+        k, _, v = kv.partition("=")
+        env[k] = v
+    procs.append(subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(agent_port), "--log-level", "warning"],
+        cwd=AGENT_DIR, env=env,
+    ))
+    return f"http://127.0.0.1:{agent_port}", fake, procs
+
+
+# =========================
+# Load
+# =========================
+async def _one(client: httpx.AsyncClient, path: str, body: Dict[str, Any], stream: bool) -> Tuple[int, float, Optional[float]]:
+    t0 = time.perf_counter()
+    first = None
+    if stream:
+        async with client.stream("POST", path, json=body) as r:
+            async for line in r.aiter_lines():
+                if first is None and line.startswith("event:"):
+                    first = time.perf_counter() - t0
+                if line.startswith("event: error"):
+                    return 599, time.perf_counter() - t0, first
+            return r.status_code, time.perf_counter() - t0, first
+    r = await client.post(path, json=body)
+    return r.status_code, time.perf_counter() - t0, None
+
+
+async def drive(agent: str, mix: Dict[str, float], concurrency: int, duration_s: float,
+                unique: bool, seed: int, timeout_s: float) -> Dict[str, Any]:
+    kinds, weights = zip(*mix.items())
+    lat: Dict[str, List[float]] = defaultdict(list)
+    ttfe: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    counter = iter(range(10 ** 9))
+    stop_at = time.monotonic() + duration_s
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=agent, timeout=timeout_s, limits=limits) as client:
+        async def worker(wid: int):
+            rng = random.Random(seed * 1000 + wid)
+            while time.monotonic() < stop_at:
+                kind = rng.choices(kinds, weights)[0]
+                path, body = build_request(kind, rng, next(counter), unique)
+                try:
+                    status, elapsed, first = await _one(client, path, body, kind.endswith("_stream"))
+                except httpx.HTTPError:
+                    status, elapsed, first = 598, timeout_s, None
+                if status >= 400:
+                    errors[kind] += 1
+                    continue
+                lat[kind].append(elapsed)
+                if first is not None:
+                    ttfe[kind].append(first)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+        wall = time.perf_counter() - t0
+
+    endpoints = {}
+    for kind in kinds:
+        vals = sorted(lat[kind])
+        row = {"ok": len(vals), "errors": errors[kind], "rps": len(vals) / wall,
+               "p50": pct(vals, 0.5), "p95": pct(vals, 0.95), "p99": pct(vals, 0.99)}
+        if ttfe[kind]:
+            row["first_event_p50"] = pct(sorted(ttfe[kind]), 0.5)
+        endpoints[kind] = row
+    total_ok = sum(len(v) for v in lat.values())
+    return {"wall_s": wall, "throughput_rps": total_ok / wall, "endpoints": endpoints}
+
+
+# =========================
+# Report / compare
+# =========================
+def _ms(v: Optional[float]) -> str:
+    return f"{v * 1000:8.0f}" if v is not None else f"{'-':>8}"
+
+
+def print_report(run: Dict[str, Any]) -> None:
+    print(f"\nthroughput {run['throughput_rps']:.2f} req/s over {run['wall_s']:.1f}s "
+          f"(concurrency {run['config']['concurrency']})\n")
+    print(f"{'endpoint':14} {'ok':>6} {'err':>5} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'1st ev':>8}")
+    for k, r in run["endpoints"].items():
+        print(f"{k:14} {r['ok']:>6} {r['errors']:>5} {r['rps']:>7.2f} {_ms(r['p50'])} {_ms(r['p95'])} "
+              f"{_ms(r['p99'])} {_ms(r.get('first_event_p50'))}")
+    if run.get("stages"):
+        print(f"\n{'stage':14} {'count':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for k, r in sorted(run["stages"].items()):
+            print(f"{k:14} {r['count']:>6.0f} {_ms(r['p50'])} {_ms(r['p95'])} {_ms(r['p99'])}")
+    if run.get("llm"):
+        kinds = ("input", "output", "cache_read", "cache_creation")
+        print(f"\n{'llm route / model':40} {'calls':>6} {'p50 ms':>8} {'p95 ms':>8} {'ttft ms':>8}  "
+              + " ".join(f"{k:>14}" for k in kinds) + "  (tokens/call)")
+        for k, r in sorted(run["llm"].items()):
+            print(f"{k:40} {r['count']:>6.0f} {_ms(r.get('p50'))} {_ms(r.get('p95'))} {_ms(r.get('ttft_p50'))}  "
+                  + " ".join(f"{r.get(t, 0):>14.0f}" for t in kinds))
+    if run.get("upstream"):
+        print("\nupstream calls: " + ", ".join(f"{s}={v['requests']} ({v['errors']} err)"
+                                               for s, v in run["upstream"].items()))
+
+
+def compare(run: Dict[str, Any], base: Dict[str, Any], threshold: float) -> int:
+    regressions = []
+    print(f"\n{'vs baseline':22} {'base p95':>9} {'new p95':>9} {'change':>8}")
+    for group in ("endpoints", "stages"):
+        for k, r in run.get(group, {}).items():
+            b = base.get(group, {}).get(k)
+            if not b or not b.get("p95") or r.get("p95") is None:
+                continue
+            change = r["p95"] / b["p95"] - 1
+            flag = change > threshold
+            regressions += [f"{group[:-1]} {k} p95 {change:+.0%}"] if flag else []
+            print(f"{group[:-1] + ' ' + k:22} {_ms(b['p95'])} {_ms(r['p95'])} {change:>+7.0%}{'  <-- regression' if flag else ''}")
+    t_change = run["throughput_rps"] / base["throughput_rps"] - 1 if base.get("throughput_rps") else 0.0
+    print(f"{'throughput':22} {base.get('throughput_rps', 0):>9.2f} {run['throughput_rps']:>9.2f} {t_change:>+7.0%}")
+    if t_change < -threshold:
+        regressions.append(f"throughput {t_change:+.0%}")
+    if regressions:
+        print("\nREGRESSIONS: " + "; ".join(regressions))
+        return 1
+    print("\nno regressions beyond threshold")
+    return 0
+
+
+async def run(args) -> int:
+    procs: List[subprocess.Popen] = []
+    fake = None
+    try:
+        if args.agent_url:
+            agent = args.agent_url.rstrip("/")
+        else:
+            agent, fake, procs = boot(args)
+            await _wait_ready(f"{fake}/_stats")
+        await _wait_ready(f"{agent}/ready")
+
+        mix = {k: float(v) for k, v in (p.split("=") for p in args.mix.split(","))}
+        if args.warmup > 0:
+            await drive(agent, mix, args.concurrency, args.warmup, args.unique, args.seed + 1, args.timeout)
+        async with httpx.AsyncClient(base_url=agent, timeout=10) as c:
+            before = (await c.get("/metrics")).text
+            up_before = (await c.get(f"{fake}/_stats")).json() if fake else {}
+            result = await drive(agent, mix, args.concurrency, args.duration, args.unique, args.seed, args.timeout)
+            after = (await c.get("/metrics")).text
+            result["stages"] = stage_report(before, after)
+            result["llm"] = llm_report(before, after)
+            if fake:
+                up_after = (await c.get(f"{fake}/_stats")).json()
+                result["upstream"] = {s: {k: v[k] - up_before.get(s, {}).get(k, 0) for k in v}
+                                      for s, v in up_after.items()}
+        result["config"] = {"mix": mix, "concurrency": args.concurrency, "duration_s": args.duration,
+                            "unique": args.unique, "soon_share": args.soon_share, "fake_args": args.fake_args, "env": args.env or []}
+        print_report(result)
+
+        if args.out:
+            os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+            with open(args.out, "w") as f:
+                json.dump(result, f, indent=2)
+            print(f"\nwrote {args.out}")
+        if args.compare:
+            with open(args.compare) as f:
+                return compare(result, json.load(f), args.threshold)
+        return 0
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            try:
+                p.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+
+
+def main(argv=None):
+    global SOON_SHARE
+    ap = argparse.ArgumentParser(description="Offline load test for the agent API.")
+    ap.add_argument("--agent-url", help="use a running agent instead of booting one")
+    ap.add_argument("--port", type=int, default=0, help="agent port when booting (default: free port)")
+    ap.add_argument("--fake-port", type=int, default=0)
+    ap.add_argument("--duration", type=float, default=30)
+    ap.add_argument("--warmup", type=float, default=5, help="seconds of unrecorded load first")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--mix", default="chat=5,plan=3,plan_stream=2",
+                    help="weights over chat, chat_stream, plan, plan_stream, plan_batch")
+    ap.add_argument("--unique", action="store_true", help="defeat caches (cold-path numbers)")
+    ap.add_argument("--soon-share", type=float, default=SOON_SHARE,
+                    help="fraction of bookings starting 0-6 days out (the rest 30+ days)")
+    ap.add_argument("--timeout", type=float, default=120)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--env", action="append", metavar="KEY=VALUE", help="extra env for the booted agent")
+    ap.add_argument("--out", help="write the run as JSON")
+    ap.add_argument("--compare", help="baseline JSON from a previous --out")
+    ap.add_argument("--threshold", type=float, default=0.15)
+    ap.add_argument("--fake-args", nargs=argparse.REMAINDER, default=[],
+                    help="remaining args go to fake_upstreams.py")
+    args = ap.parse_args(argv)
+    SOON_SHARE = args.soon_share
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+# agent/bookings_repo.py
+"""
+Read-side data access for `bookings` (MySQL, via db.get_engine()).
+
+The date column names differ between deployments (start_date/end_date in
+DB_Setup.sql, start/end in older dumps). They are detected once — at app
+startup via `load_schema()`, or lazily on first query — and cached for the
+life of the process instead of running SHOW COLUMNS before every query.
+
+Predicates compare the bare date columns against CURDATE() so MySQL can
+range-scan the composite indexes below (see migrations/add_bookings_indexes.py):
+
+    idx_bookings_traveler_status_start  (traveler_id, status, start_date, end_date)
+        -> fetch_upcoming_bookings: traveler equality plus the status IN
+           list narrows the scan to that traveler's active bookings, end
+           date checked from the index; with three status values MySQL
+           still sorts on start (a small filesort, one traveler's rows)
+    idx_bookings_status_start           (status, start_date, end_date)
+        -> fetch_upcoming_trip_windows: start-date window across travelers
+"""
+import asyncio, logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from db import get_engine
+from metrics import span
+
+log = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ("PENDING", "ACCEPTED", "CONFIRMED")
+_STATUS_SQL = ", ".join(f"'{s}'" for s in ACTIVE_STATUSES)
+
+_DATE_COLUMN_CANDIDATES: Tuple[Tuple[str, str], ...] = (("start_date", "end_date"), ("start", "end"))
+
+_schema: Optional[Tuple[str, str]] = None
+_schema_lock = asyncio.Lock()
+
+
+# =========================
+# Schema (detected once)
+# =========================
+async def load_schema(refresh: bool = False) -> Optional[Tuple[str, str]]:
+    """
+    Detect whether bookings has start_date/end_date or start/end and cache it.
+    Returns (start_col, end_col), or None if neither pair is present.
+    """
+    global _schema
+    if _schema is not None and not refresh:
+        return _schema
+    from sqlalchemy import text
+    async with _schema_lock:
+        if _schema is not None and not refresh:
+            return _schema
+        with span("db_schema"):
+            async with get_engine().connect() as conn:
+                cols = {row[0] for row in await conn.execute(text("SHOW COLUMNS FROM bookings"))}
+        for sc, ec in _DATE_COLUMN_CANDIDATES:
+            if {sc, ec}.issubset(cols):
+                _schema = (sc, ec)
+                log.info("bookings date columns: %s/%s", sc, ec)
+                break
+        else:
+            log.warning("bookings has no known date columns (saw %s)", sorted(cols))
+        return _schema
+
+
+def index_ddl(sc: str, ec: str) -> Dict[str, str]:
+    """Composite indexes the queries below are written for, keyed by index name."""
+    return {
+        "idx_bookings_traveler_status_start":
+            f"CREATE INDEX idx_bookings_traveler_status_start ON bookings (traveler_id, status, `{sc}`, `{ec}`)",
+        "idx_bookings_status_start":
+            f"CREATE INDEX idx_bookings_status_start ON bookings (status, `{sc}`, `{ec}`)",
+    }
+
+
+# =========================
+# Queries
+# =========================
+def _upcoming_sql(sc: str, ec: str):
+    # Upcoming = ongoing or future. start <= end, so "starts today or later OR
+    # ends today or later" is just "ends today or later"; comparing the bare
+    # column (not DATE(col)) keeps the predicate index-friendly and still
+    # ignores time of day for DATETIME columns.
+    # COALESCE builds a location when p.location is null.
+    from sqlalchemy import text
+    return text(f"""
+        SELECT  b.id,
+                COALESCE(p.location, CONCAT_WS(', ', p.city, p.state, p.country)) AS location,
+                p.name AS property_name,
+                b.`{sc}` AS start,
+                b.`{ec}` AS end,
+                b.guests
+        FROM bookings b
+        JOIN properties p ON p.id = b.property_id
+        WHERE b.traveler_id = :uid
+          AND b.status IN ({_STATUS_SQL})
+          AND b.`{ec}` >= CURDATE()
+        ORDER BY b.`{sc}` ASC
+        LIMIT 25
+    """)
+
+
+async def fetch_upcoming_bookings(user_id: int) -> List[Dict[str, Any]]:
+    """
+    Fetch upcoming (future or ongoing) bookings for a traveler.
+    - Includes PENDING, ACCEPTED, CONFIRMED
+    - Upcoming = ends today or later
+    - Handles both (start_date/end_date) and (start/end) schemas
+    """
+    global _schema
+    from sqlalchemy.exc import ProgrammingError
+    schema = await load_schema()
+
+    with span("db"):
+        async with get_engine().connect() as conn:
+            if schema:
+                rows = (await conn.execute(_upcoming_sql(*schema), {"uid": user_id})).mappings().all()
+                return [dict(r) for r in rows]
+
+            # Detection found nothing usable: probe each layout and remember the one that parses
+            for sc, ec in _DATE_COLUMN_CANDIDATES:
+                try:
+                    rows = (await conn.execute(_upcoming_sql(sc, ec), {"uid": user_id})).mappings().all()
+                except ProgrammingError:
+                    continue
+                _schema = (sc, ec)
+                return [dict(r) for r in rows]
+            return []
+
+
+async def fetch_upcoming_trip_windows(days_ahead: int = 30, limit: int = 500) -> List[Dict[str, Any]]:
+    """
+    Distinct (location, start, end, guests) stays across ALL travelers that are
+    ongoing or start within `days_ahead` days — what the planner will be asked
+    about soon. Used by warmer.py; soonest trips first.
+    """
+    from sqlalchemy import text
+    sc, ec = await load_schema() or _DATE_COLUMN_CANDIDATES[0]
+    sql = text(f"""
+        SELECT  COALESCE(p.location, CONCAT_WS(', ', p.city, p.state, p.country)) AS location,
+                DATE(b.`{sc}`) AS start,
+                DATE(b.`{ec}`) AS end,
+                b.guests AS guests,
+                COUNT(*) AS bookings
+        FROM bookings b
+        JOIN properties p ON p.id = b.property_id
+        WHERE b.status IN ({_STATUS_SQL})
+          AND b.`{sc}` < CURDATE() + INTERVAL :days DAY
+          AND b.`{ec}` >= CURDATE()
+        GROUP BY location, DATE(b.`{sc}`), DATE(b.`{ec}`), b.guests
+        ORDER BY start ASC, bookings DESC
+        LIMIT :lim
+    """)
+    with span("db"):
+        async with get_engine().connect() as conn:
+            rows = (await conn.execute(sql, {"days": days_ahead, "lim": limit})).mappings().all()
+    return [dict(r) for r in rows]
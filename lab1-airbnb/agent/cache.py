@@ -0,0 +1,252 @@
+# agent/cache.py
+"""
+Small TTL + LRU result cache with pluggable storage.
+
+    TAVILY_CACHE = make_cache("tavily", ttl_s=6 * 3600, max_entries=2000)
+    hit = TAVILY_CACHE.get(key)
+    if hit is None:
+        TAVILY_CACHE.set(key, value)
+
+Backends:
+  memory  (default) OrderedDict in process, lost on restart
+  sqlite  single-file store under CACHE_DIR, survives restarts; values must be
+          JSON-serialisable
+  tiered  in-memory LRU front over the sqlite store (fast reads, persistent)
+
+Env:
+  CACHE_BACKEND   memory | sqlite | tiered   (default memory, per-cache override allowed)
+  CACHE_DIR       directory for sqlite files (default agent/.cache)
+"""
+import os, json, time, sqlite3, hashlib, threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory").strip().lower()
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(os.path.dirname(__file__), ".cache"))
+
+
+def make_key(*parts: Any) -> str:
+    """Stable short key from any JSON-serialisable parts."""
+    raw = json.dumps(parts, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+# =========================
+# Backends
+# =========================
+class MemoryBackend:
+    """OrderedDict kept in LRU order; oldest entry evicted past max_entries."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, Tuple[Optional[float], Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[Optional[float], Any]]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                self._data.move_to_end(key)
+            return item
+
+    def set(self, key: str, expires_at: Optional[float], value: Any) -> int:
+        """Store and return how many entries were evicted."""
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            evicted = 0
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                evicted += 1
+            return evicted
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteBackend:
+    """
+    One table per file. LRU order is tracked with a last_access column so
+    eviction survives restarts along with the data. The file is opened on
+    first use, so building a cache at import time touches no disk.
+    """
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self._conn: Optional[sqlite3.Connection] = None
+        self._open_lock = threading.Lock()
+        self._lock = threading.Lock()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            with self._open_lock:
+                if self._conn is None:
+                    os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                    conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS cache ("
+                        " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+                        " expires_at REAL, last_access REAL NOT NULL)"
+                    )
+                    conn.execute("CREATE INDEX IF NOT EXISTS cache_lru ON cache(last_access)")
+                    self._conn = conn
+        return self._conn
+
+    def get(self, key: str) -> Optional[Tuple[Optional[float], Any]]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT expires_at, value FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE cache SET last_access = ? WHERE key = ?", (time.time(), key))
+        return row[0], json.loads(row[1])
+
+    def set(self, key: str, expires_at: Optional[float], value: Any) -> int:
+        payload = json.dumps(value)
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, payload, expires_at, time.time()),
+            )
+            over = len(self) - self.max_entries
+            if over > 0:
+                self.conn.execute(
+                    "DELETE FROM cache WHERE key IN"
+                    " (SELECT key FROM cache ORDER BY last_access ASC LIMIT ?)",
+                    (over,),
+                )
+            return max(over, 0)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self.conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        with self._lock:
+            self.conn.execute("DELETE FROM cache")
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+
+class TieredBackend:
+    """Memory LRU in front of a persistent store; misses fall through and warm the front."""
+
+    def __init__(self, front: MemoryBackend, back: SQLiteBackend):
+        self.front = front
+        self.back = back
+
+    def get(self, key: str) -> Optional[Tuple[Optional[float], Any]]:
+        item = self.front.get(key)
+        if item is None:
+            item = self.back.get(key)
+            if item is not None:
+                self.front.set(key, *item)
+        return item
+
+    def set(self, key: str, expires_at: Optional[float], value: Any) -> int:
+        self.front.set(key, expires_at, value)
+        return self.back.set(key, expires_at, value)
+
+    def delete(self, key: str) -> None:
+        self.front.delete(key)
+        self.back.delete(key)
+
+    def clear(self) -> None:
+        self.front.clear()
+        self.back.clear()
+
+    def __len__(self) -> int:
+        return len(self.back)
+
+
+# =========================
+# Cache front
+# =========================
+class TTLCache:
+    """TTL on top of a bounded LRU backend, with hit/miss/eviction counters."""
+
+    def __init__(self, name: str, backend, ttl_s: Optional[float]):
+        self.name = name
+        self.backend = backend
+        self.ttl_s = ttl_s
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        item = self.backend.get(key)
+        if item is not None:
+            expires_at, value = item
+            if expires_at is None or expires_at > time.time():
+                self.hits += 1
+                return value
+            self.backend.delete(key)
+        self.misses += 1
+        return None
+
+    def set(self, key: str, value: Any, ttl_s: Optional[float] = None) -> None:
+        ttl = self.ttl_s if ttl_s is None else ttl_s
+        expires_at = time.time() + ttl if ttl else None
+        self.evictions += self.backend.set(key, expires_at, value)
+
+    def delete(self, key: str) -> None:
+        self.backend.delete(key)
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "size": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+_REGISTRY: Dict[str, TTLCache] = {}
+
+
+def make_cache(
+    name: str,
+    *,
+    ttl_s: Optional[float],
+    max_entries: int,
+    backend: Optional[str] = None,
+) -> TTLCache:
+    """
+    Build (and register for stats) a named cache. `backend` defaults to
+    <NAME>_CACHE_BACKEND, then CACHE_BACKEND. ttl_s=None means no expiry.
+    """
+    kind = (backend or os.getenv(f"{name.upper()}_CACHE_BACKEND") or CACHE_BACKEND).lower()
+    if kind == "sqlite":
+        store = SQLiteBackend(os.path.join(CACHE_DIR, f"{name}.sqlite3"), max_entries)
+    elif kind == "tiered":
+        store = TieredBackend(
+            MemoryBackend(min(max_entries, 1000)),
+            SQLiteBackend(os.path.join(CACHE_DIR, f"{name}.sqlite3"), max_entries),
+        )
+    else:
+        store = MemoryBackend(max_entries)
+    cache = _REGISTRY[name] = TTLCache(name, store, ttl_s)
+    return cache
+
+
+def all_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: c.stats() for name, c in _REGISTRY.items()}
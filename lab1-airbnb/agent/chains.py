@@ -1,58 +1,166 @@
 # agent/chains.py
-import os, re, json, datetime
-from typing import Tuple, Optional, List, Dict, Any
-
-import httpx
-from dotenv import load_dotenv
-from langchain_anthropic import ChatAnthropic
-
-from schemas import AgentPlanRequest, PlanResponse
-from tools.weather import weather_summary
+import os, re, json, time, asyncio, logging, calendar, datetime
+from typing import Tuple, Optional, List, Dict, Any, AsyncIterator
+
+from schemas import AgentPlanRequest, DayBlock, PlanResponse, Preferences
+from tools.weather import summarize_weather
+from places import extract_place
+from fanout import gather_context
+from http_clients import get_client, request_timeout
+from cache import make_cache, make_key
+from singleflight import SingleFlight
+from plan_parser import IncrementalPlanParser, parse_plan, repair_json, strip_wrapping
+from chat_cache import CHAT_CACHE, CHAT_CACHE_ENABLED, normalize_question
+from metrics import LLM_TTFT_SECONDS, span, record_llm
+from resilience import UPSTREAMS, UpstreamUnavailable, hedged
+import deadline
+import listings_index
+import climate
+from context_compress import CONTEXT_COMPRESS, compress_results, estimate_tokens, fit, section_budget
+
+log = logging.getLogger(__name__)
 
 # =========================
 # 0) Environment & LLM init
 # =========================
-dotenv_path = os.path.join(os.path.dirname(__file__), ".env")
-load_dotenv(dotenv_path, override=True)
-
-ANTHROPIC_API_KEY = (os.getenv("ANTHROPIC_API_KEY") or "").strip()
-if not ANTHROPIC_API_KEY.startswith("sk-ant-"):
-    raise RuntimeError(
-        "❌ Anthropic API key not found or invalid. "
-        "Set ANTHROPIC_API_KEY in agent/.env (starts with sk-ant-)."
-    )
-
+# .env is loaded once by app.py (or the script entry point) before this import.
+# The LangChain/Anthropic client is the slowest import in the service, so it
+# is built on first use — app.py's lifespan calls get_llm() at startup.
 ANTHROPIC_MODEL = os.getenv("ANTHROPIC_MODEL", "claude-3-5-haiku-20241022")
 
-llm = ChatAnthropic(
-    model=ANTHROPIC_MODEL,
-    anthropic_api_key=ANTHROPIC_API_KEY,
-    temperature=0.3,
-    max_tokens=2200,   # room for JSON
-)
+llm = None  # ChatAnthropic, see get_llm()
+
+def get_llm():
+    global llm
+    if llm is None:
+        api_key = (os.getenv("ANTHROPIC_API_KEY") or "").strip()
+        if not api_key.startswith("sk-ant-"):
+            raise RuntimeError(
+                "❌ Anthropic API key not found or invalid. "
+                "Set ANTHROPIC_API_KEY in agent/.env (starts with sk-ant-)."
+            )
+        from langchain_anthropic import ChatAnthropic
+        llm = ChatAnthropic(
+            model=ANTHROPIC_MODEL,
+            anthropic_api_key=api_key,
+            temperature=0.3,
+            max_tokens=2200,   # room for JSON; calls pass their route's max_tokens
+        )
+    return llm
+
+# Model routing: every LLM call names a route, and the route picks the model
+# and max_tokens (passed per call, so one client serves them all). Short,
+# simple chat questions go to the fast model with a small budget; planning
+# keeps the larger configuration. plan_* routes (chunked planner) use plan's
+# model and pass their own max_tokens.
+ANTHROPIC_FAST_MODEL = os.getenv("ANTHROPIC_FAST_MODEL", ANTHROPIC_MODEL)
+ANTHROPIC_PLAN_MODEL = os.getenv("ANTHROPIC_PLAN_MODEL", ANTHROPIC_MODEL)
+LLM_ROUTES: Dict[str, Dict[str, Any]] = {
+    "chat_fast": {"model": ANTHROPIC_FAST_MODEL, "max_tokens": int(os.getenv("CHAT_FAST_MAX_TOKENS", "300"))},
+    "chat":      {"model": ANTHROPIC_MODEL,      "max_tokens": int(os.getenv("CHAT_MAX_TOKENS", "600"))},
+    "plan":      {"model": ANTHROPIC_PLAN_MODEL, "max_tokens": int(os.getenv("PLAN_MAX_TOKENS", "2200"))},
+}
+
+def llm_route(route: str) -> Dict[str, Any]:
+    """ainvoke/astream kwargs (model, max_tokens) for `route`."""
+    return dict(LLM_ROUTES.get(route) or LLM_ROUTES[route.split("_")[0]])
+
+# Prompt caching: static system prompts (and the planner's per-booking brief,
+# shared by every chunked-planner call) are sent as separate blocks marked
+# with an Anthropic cache breakpoint, so repeats read them from the prompt
+# cache instead of re-processing them. Prefixes shorter than the model's
+# minimum cacheable length are processed normally.
+PROMPT_CACHE = os.getenv("PROMPT_CACHE", "1") == "1"
+
+def _messages(system: str, *user: str, cached: int = 0) -> List[Dict[str, Any]]:
+    """
+    System + one user message of text blocks. The system block and the first
+    `cached` user blocks are cacheable, so they must not vary between the
+    calls meant to share them.
+    """
+    def block(text: str, cache: bool) -> Dict[str, Any]:
+        b = {"type": "text", "text": text}
+        if cache and PROMPT_CACHE:
+            b["cache_control"] = {"type": "ephemeral"}
+        return b
+    return [
+        {"role": "system", "content": [block(system, True)]},
+        {"role": "user", "content": [block(u, i == cached - 1) for i, u in enumerate(user) if u]},
+    ]
+
+async def _invoke(route: str, messages: List[Dict[str, Any]], **kwargs):
+    """One guarded, deadline-bounded LLM call on `route` (kwargs override the route's)."""
+    kw = {**llm_route(route), **kwargs}
+    with span("llm"):
+        async with UPSTREAMS["anthropic"].guard():
+            t0 = time.perf_counter()
+            resp = await deadline.within(get_llm().ainvoke(messages, **kw))
+    record_llm(route, messages, resp, model=kw["model"], seconds=time.perf_counter() - t0)
+    return resp
+
+async def _stream(route: str, messages: List[Dict[str, Any]]) -> AsyncIterator[str]:
+    """
+    Streamed LLM call on `route`: yields text as generated, records time to
+    first token. The chunks are added up so the final message carries the
+    token usage reported at the start and end of the stream.
+    """
+    kw = llm_route(route)
+    full, first = None, True
+    async with UPSTREAMS["anthropic"].guard():
+        t0 = time.perf_counter()
+        async for chunk in deadline.aiter_within(get_llm().astream(messages, **kw)):
+            full = chunk if full is None else full + chunk
+            text = _chunk_text(chunk)
+            if text:
+                if first:
+                    LLM_TTFT_SECONDS.observe(time.perf_counter() - t0, route=route, model=kw["model"])
+                    first = False
+                yield text
+    record_llm(route, messages, full if full is not None else "", model=kw["model"],
+               seconds=time.perf_counter() - t0)
 
 # =========================
 # 1) Tavily lightweight client
 # =========================
 TAVILY_API_KEY = (os.getenv("TAVILY_API_KEY") or "").strip()
 
-def tavily_search(
+# Popular cities repeat the same queries all day; cache successful searches.
+TAVILY_CACHE = make_cache(
+    "tavily",
+    ttl_s=float(os.getenv("TAVILY_CACHE_TTL_S", str(6 * 3600))),
+    max_entries=int(os.getenv("TAVILY_CACHE_MAX", "2000")),
+)
+
+# Concurrent identical searches share one upstream call
+TAVILY_FLIGHT = SingleFlight("tavily")
+
+def _tavily_cache_key(q: str, max_results: int, depth: str, include, exclude, include_answer: bool) -> str:
+    norm_q = re.sub(r"\s+", " ", q.strip().lower())
+    return make_key(norm_q, max_results, depth, sorted(include or []), sorted(exclude or []), include_answer)
+
+async def tavily_search(
     q: str,
     max_results: int = 8,
     depth: str = "advanced",
     include: Optional[List[str]] = None,
     exclude: Optional[List[str]] = None,
     include_answer: bool = True,
-    timeout_s: int = 20,
+    timeout_s: Optional[float] = None,
 ) -> Dict[str, Any]:
     """
-    Minimal Tavily REST call.
+    Minimal Tavily REST call (cached by normalized query + search options).
     Returns a dict: { query, answer, results: [ {title,url,content,score,...}, ... ] }
     """
     if not TAVILY_API_KEY:
-        print("[TAVILY] No API key configured.")
+        log.warning("Tavily: no API key configured")
         return {"query": q, "answer": "", "results": []}
 
+    cache_key = _tavily_cache_key(q, max_results, depth, include, exclude, include_answer)
+    cached = TAVILY_CACHE.get(cache_key)
+    if cached is not None:
+        log.debug("Tavily cache hit: %.80s", q)
+        return cached
+
     payload = {
         "api_key": TAVILY_API_KEY,
         "query": q,
@@ -62,41 +170,60 @@ def tavily_search(
         "include_domains": include or [],
         "exclude_domains": exclude or [],
     }
+    return await TAVILY_FLIGHT.do(cache_key, lambda: _tavily_fetch(q, payload, cache_key, timeout_s))
 
-    try:
-        with httpx.Client(timeout=timeout_s) as c:
-            r = c.post("https://api.tavily.com/search", json=payload)
+# Second Tavily attempt after the observed p95 (this until there is enough data)
+TAVILY_HEDGE_DELAY_S = float(os.getenv("TAVILY_HEDGE_DELAY_S", "2.5"))
+
+async def _tavily_post(payload: Dict[str, Any], timeout_s: float) -> Dict[str, Any]:
+    with span("tavily"):
+        async with UPSTREAMS["tavily"].guard():
+            r = await get_client("tavily").post("/search", json=payload, timeout=timeout_s)
             r.raise_for_status()
-            data = r.json() or {}
-            # ---------- DEBUG ----------
-            print("\n" + "="*80)
-            print(f"[TAVILY RAW] Query: {q}")
-            # Print a pretty but bounded preview
-            try:
-                print(json.dumps(data, indent=2)[:3000])
-            except Exception:
-                print(str(data)[:3000])
-            print("="*80 + "\n")
-            # ---------------------------
-            # Ensure shape
-            data.setdefault("query", q)
-            data.setdefault("answer", "")
-            data.setdefault("results", [])
-            return data
+            return r.json() or {}
+
+async def _tavily_fetch(q: str, payload: Dict[str, Any], cache_key: str, timeout_s: Optional[float]) -> Dict[str, Any]:
+    try:
+        # Shared pooled client; timeout is TAVILY_TIMEOUT_S cut to the request deadline
+        timeout_s = request_timeout("tavily") if timeout_s is None else timeout_s
+        data = await hedged("tavily", lambda: _tavily_post(payload, timeout_s),
+                            default_delay_s=TAVILY_HEDGE_DELAY_S)
+        # Raw dump is only serialised when DEBUG is on
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Tavily raw for %r:\n%s", q, json.dumps(data, indent=2, default=str)[:3000])
+        # Ensure shape
+        data.setdefault("query", q)
+        data.setdefault("answer", "")
+        data.setdefault("results", [])
+        if data["results"] or data["answer"]:
+            TAVILY_CACHE.set(cache_key, data)
+        return data
+    except UpstreamUnavailable:
+        raise  # fail fast: the caller's fallback text says "unavailable"
     except Exception as e:
-        print(f"[TAVILY ERROR] {e}")
+        log.warning("Tavily error: %s", e)
         return {"query": q, "answer": "", "results": []}
 
-def tavily_snippet(query: str, *, max_len: int = 1800, **search_kwargs) -> str:
+async def tavily_snippet(
+    query: str, *, max_len: int = 1800, section: str = "web", budget_tokens: Optional[int] = None, **search_kwargs,
+) -> str:
     """
-    Fetch richer Tavily snippets including title, score, and URLs.
-    Gives the LLM explicit structured input so it can extract real entities.
-    DEBUG: prints summary lines and the final snippet size.
+    Fetch Tavily results and build the structured TITLE / EXCERPT / SOURCE
+    block the LLM reads. By default results are deduped, ranked and packed
+    into the `section` token budget (see context_compress); with
+    CONTEXT_COMPRESS=0 the first 8 results are concatenated up to `max_len`.
     """
-    data = tavily_search(query, **search_kwargs)  # returns dict
+    data = await tavily_search(query, **search_kwargs)  # returns dict
     answer = data.get("answer") or ""
     results = data.get("results") or []
 
+    if CONTEXT_COMPRESS:
+        budget = budget_tokens or section_budget(section)
+        snippet = compress_results(query, results, budget_tokens=budget, answer=answer) or "No web results found."
+        log.debug("Tavily snippet for %r: ~%d/%d tokens from %d results",
+                  query, estimate_tokens(snippet), budget, len(results))
+        return snippet
+
     lines = []
     if answer:
         lines.append(f"Summary from Tavily: {answer.strip()}")
@@ -113,14 +240,7 @@ def tavily_snippet(query: str, *, max_len: int = 1800, **search_kwargs) -> str:
 
     snippet = "\n".join(lines)[:max_len] or "No web results found."
 
-    # ---------- DEBUG ----------
-    print("[TAVILY SNIPPET] Built snippet for query:")
-    print(f"  {query}")
-    print(f"  Lines: {len(lines)}, Length: {len(snippet)} chars")
-    print("  Preview:")
-    print("  " + "\n  ".join(snippet.splitlines()[:6]))
-    print("-"*80)
-    # ---------------------------
+    log.debug("Tavily snippet for %r: %d lines, %d chars", query, len(lines), len(snippet))
 
     return snippet
 
@@ -141,6 +261,14 @@ def _extract_month(q: str) -> Tuple[Optional[int], Optional[str]]:
         if re.search(rf"\b{a}\b", ql): return i, a
     return None, None
 
+def _month_window(month: int, today: Optional[datetime.date] = None) -> Tuple[str, str]:
+    """Next occurrence of `month` as ISO dates: the rest of it if it is this month, else all of it."""
+    today = today or datetime.date.today()
+    year = today.year + (month < today.month)
+    start = today if month == today.month else datetime.date(year, month, 1)
+    end = datetime.date(year, month, calendar.monthrange(year, month)[1])
+    return start.isoformat(), end.isoformat()
+
 def _clean_concise(text: str) -> str:
     if not isinstance(text, str):
         return str(text)
@@ -148,6 +276,15 @@ def _clean_concise(text: str) -> str:
     t = re.sub(r"^\s*(Answer|Summary|Final Answer)\s*[:\-]\s*", "", t, flags=re.I)
     return t if len(t) <= 1200 else t[:1200].rsplit(" ", 1)[0] + "…"
 
+def _chunk_text(chunk: Any) -> str:
+    """Text of a streamed AIMessageChunk (content may be a str or a list of blocks)."""
+    content = getattr(chunk, "content", chunk)
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(b.get("text", "") if isinstance(b, dict) else str(b) for b in content)
+    return str(content or "")
+
 def _date_range(start: str, end: str) -> List[str]:
     """Inclusive ISO date range; fallback to 2 days if parsing fails."""
     try:
@@ -170,75 +307,202 @@ def _date_range(start: str, end: str) -> List[str]:
 # =========================
 # 3) Anonymous Chat (web + weather + LLM)
 # =========================
-def general_chat(question: str) -> str:
+CHAT_COALESCE = os.getenv("CHAT_COALESCE", "1") == "1"
+CHAT_FLIGHT = SingleFlight("general_chat")
+# A coalesced answer is shared, so it runs under the endpoint's default budget
+# rather than whichever caller's X-Request-Deadline happened to arrive first
+CHAT_SHARED_BUDGET_S = deadline.ENDPOINT_BUDGETS["/ai/chat"]
+CHAT_FALLBACK_ANSWER = "Sorry, I had trouble answering that."
+# Part of the request deadline kept for the LLM after context gathering
+CHAT_LLM_RESERVE_S = float(os.getenv("CHAT_LLM_RESERVE_S", "8"))
+
+async def general_chat(question: str) -> str:
     """
     Non-logged-in flow:
     - Tavily snippet (quick grounding)
     - Weather hint if month+city detected
+    - StayBnB listings for the city (in-process index, see listings_index.py)
     - Concise 3–6 sentence answer
+    Answers are cached (exact + near-duplicate questions, see chat_cache.py)
+    and identical questions asked concurrently share one answer.
     """
-    print("\n[GENERAL_CHAT] Q:", question)
-
-    ctx_parts = []
-    web = tavily_snippet(question)
-    if web:
-        ctx_parts.append("Web:\n" + web)
+    log.info("general_chat q=%r", question)
+    if CHAT_CACHE_ENABLED:
+        cached = CHAT_CACHE.get(question)
+        if cached is not None:
+            log.debug("general_chat cache hit")
+            return cached
 
-    # Weather context if "in/for <city>" + month present
-    wx_text = ""
+    try:
+        if CHAT_COALESCE:
+            return await CHAT_FLIGHT.do(normalize_question(question), lambda: _shared_chat(question))
+        return await _cached_chat(question)
+    except deadline.DeadlineExceeded as e:
+        # The shared answer may still land; it is cached for the next asker
+        log.warning("general_chat gave up waiting: %s", e)
+        return CHAT_FALLBACK_ANSWER
+
+async def _cached_chat(question: str) -> str:
+    ans = await _general_chat(question)
+    if CHAT_CACHE_ENABLED and ans != CHAT_FALLBACK_ANSWER:
+        CHAT_CACHE.set(question, ans)
+    return ans
+
+async def _shared_chat(question: str) -> str:
+    with deadline.scope(CHAT_SHARED_BUDGET_S):
+        return await _cached_chat(question)
+
+# Own-inventory grounding from the in-process listings index (no DB query per request)
+CHAT_LISTINGS_LIMIT = int(os.getenv("CHAT_LISTINGS_LIMIT", "3"))
+_BUDGET_RE = re.compile(r"(?:under|below|less than|max(?:imum)?|up to|within)\s*\$?\s*(\d{2,5})|\$\s*(\d{2,5})", re.I)
+_GUESTS_RE = re.compile(r"\b(\d{1,2})\s*(?:people|persons|guests|adults|travell?ers|of us)\b", re.I)
+
+def _listings_block(where: str, text: str, limit: int, guests: Optional[int] = None) -> str:
+    """StayBnB listings in `where` within the budget/party size/amenities mentioned in `text`."""
+    with span("listings"):
+        bm, gm = _BUDGET_RE.search(text), _GUESTS_RE.search(text)
+        idx = listings_index.get_index()
+        rows = idx.search(
+            where,
+            max_price=float(bm.group(1) or bm.group(2)) if bm else None,
+            guests=int(gm.group(1)) if gm else guests,
+            amenities=idx.amenities_in(text),
+            limit=limit,
+        )
+    return listings_index.format_listings(rows)
+
+def _known_place(name: str) -> bool:
+    """Lowercase place fallback (places.extract_place): our listings or the climate gazetteer."""
+    if listings_index.get_index().has_place(name):
+        return True
+    store = climate.get_store()
+    return store is not None and store.city(name) is not None
+
+async def _chat_prompt(question: str) -> Tuple[str, str]:
+    """Gather chat context and return (system, user) prompt strings."""
+    # Web + weather lookups run concurrently; weather only if a place + month are present
+    jobs = {"web": tavily_snippet(question)}
     mn, _ = _extract_month(question)
-    cm = re.search(r"(?:in|for)\s+([A-Za-z][A-Za-z\s\-,]+)", question)
-    if mn and cm:
-        city = cm.group(1).strip().rstrip(".?")
-        start, end = f"2025-{mn:02d}-05", f"2025-{mn:02d}-10"
-        try:
-            wx_text = weather_summary(f"{city} | {start} to {end}")
-            if wx_text:
-                ctx_parts.append("Weather:\n" + wx_text)
-        except Exception as e:
-            print("[GENERAL_CHAT] Weather summary error:", e)
+    city = extract_place(question, _known_place)
+    if mn and city:
+        start, end = _month_window(mn)
+        jobs["weather"] = summarize_weather(f"{city} | {start} to {end}")
 
-    system = (
-        "You are TripMate, a concise travel assistant.\n"
-        "Use the context if helpful. Answer in 3–6 sentences. Be specific and practical."
-    )
-    user = (("Context:\n" + "\n\n".join(ctx_parts) + "\n\n") if ctx_parts else "") + f"Question: {question}\nAnswer:"
+    with span("context"):
+        ctx = await gather_context(jobs, fallbacks={"web": "", "weather": ""},
+                                   reserve_s=CHAT_LLM_RESERVE_S, optional=("weather",))
 
-    print(f"[GENERAL_CHAT] Context blocks: {len(ctx_parts)}, total length: {len(user)} chars")
+    ctx_parts = []
+    if ctx["web"]:
+        ctx_parts.append("Web:\n" + ctx["web"])
+    if ctx.get("weather"):
+        ctx_parts.append("Weather:\n" + ctx["weather"])
+    if city and CHAT_LISTINGS_LIMIT > 0:
+        stays = _listings_block(city, question, CHAT_LISTINGS_LIMIT)
+        if stays:
+            ctx_parts.append("StayBnB listings matching this city/budget:\n" + stays)
+
+    with span("prompt_build"):
+        system, user = _chat_messages(question, ctx_parts)
+    log.debug("general_chat context blocks=%d user_chars=%d", len(ctx_parts), len(user))
+    return system, user
+
+CHAT_SYSTEM_PROMPT = (
+    "You are TripMate, a concise travel assistant.\n"
+    "Use the context if helpful. Answer in 3–6 sentences. Be specific and practical."
+)
 
+def _chat_messages(question: str, ctx_parts: List[str]) -> Tuple[str, str]:
+    system = CHAT_SYSTEM_PROMPT
+    user = (("Context:\n" + "\n\n".join(ctx_parts) + "\n\n") if ctx_parts else "") + f"Question: {question}\nAnswer:"
+    return system, user
+
+# Router: short single questions without planning words take the fast route
+CHAT_ROUTER = os.getenv("CHAT_ROUTER", "1") == "1"
+CHAT_FAST_MAX_WORDS = int(os.getenv("CHAT_FAST_MAX_WORDS", "25"))
+_COMPLEX_CHAT_RE = re.compile(
+    r"\b(?:plan|planning|itinerar(?:y|ies)|schedule|compare|comparison|versus|vs|pros and cons|"
+    r"day[- ]by[- ]day|step[- ]by[- ]step|explain)\b", re.I)
+
+def _chat_route(question: str) -> str:
+    """'chat_fast' for short, simple questions; 'chat' otherwise."""
+    if not CHAT_ROUTER:
+        return "chat"
+    simple = (len(question.split()) <= CHAT_FAST_MAX_WORDS and question.count("?") <= 1
+              and not _COMPLEX_CHAT_RE.search(question))
+    return "chat_fast" if simple else "chat"
+
+async def _general_chat(question: str) -> str:
+    system, user = await _chat_prompt(question)
     try:
-        resp = llm.invoke(system + "\n\n" + user)
+        resp = await _invoke(_chat_route(question), _messages(system, user))
         text = resp.content if hasattr(resp, "content") else str(resp)
         ans = _clean_concise(text)
-        print("[GENERAL_CHAT] Answer preview:", ans[:200], "...")
+        log.debug("general_chat answer: %.200s", ans)
         return ans
     except Exception as e:
-        print(f"[TripMate ERROR] Claude invocation failed: {e}")
-        return "Sorry, I had trouble answering that."
+        log.error("Claude invocation failed: %s", e)
+        return CHAT_FALLBACK_ANSWER
+
+async def general_chat_stream(question: str) -> AsyncIterator[str]:
+    """
+    Same flow as general_chat, but yields answer text as Claude generates it.
+    Streams are per-caller, so no coalescing here.
+    """
+    log.info("general_chat_stream q=%r", question)
+    system, user = await _chat_prompt(question)
+    try:
+        async for text in _stream(_chat_route(question), _messages(system, user)):
+            yield text
+    except Exception as e:
+        log.error("Claude stream failed: %s", e)
+        yield CHAT_FALLBACK_ANSWER
 
 # =========================
 # 4) Logged-in Structured Planner (JSON)
 # =========================
-def plan_with_context(req: AgentPlanRequest) -> PlanResponse:
-    """
-    Generate a full travel plan based on booking (dates, city, guests) and
-    optional free-text ask. Automatically fuses Tavily and weather context.
-    Adds detailed DEBUG prints at each step.
-    """
-    # --- 1. Basic fields ---
-    city   = req.booking.location
-    start  = req.booking.start[:10] if isinstance(req.booking.start, str) else str(req.booking.start)
-    end    = req.booking.end[:10]   if isinstance(req.booking.end, str)   else str(req.booking.end)
-    guests = int(req.booking.guests or 1)
-    party  = getattr(req.booking, "partyType", "group")
-    ask    = (getattr(req, "ask", "") or "").strip()
+PLAN_SYSTEM_PROMPT = (
+    "You are TripMate, an expert AI travel planner.\n"
+    "You will receive:\n"
+    "- A booking (city, dates, guests)\n"
+    "- A free-text traveler request\n"
+    "- Tavily web data with TITLE, CONTENT EXCERPTS, URL, and SCORE (as a structured text block)\n"
+    "- Weather summary\n\n"
+    "Your job:\n"
+    "1. Infer traveler preferences (budget, interests, mobility, dietary) from the free text if present.\n"
+    "2. Use Tavily 'content' excerpts to extract REAL places and restaurants (do NOT just repeat article titles).\n"
+    "3. Produce strictly valid JSON with keys:\n"
+    "{\n"
+    "  \"itinerary\": [ { \"date\": string, \"morning\": [Activity], \"afternoon\": [Activity], \"evening\": [Activity] } ],\n"
+    "  \"activities\": [Activity],\n"
+    "  \"restaurants\": [Activity],\n"
+    "  \"packing\": [string]\n"
+    "}\n"
+    "Activity = { \"title\": string, \"address\": string, \"priceTier\": \"$\"|\"$$\"|\"$$$\"|\"$$$$\", "
+    "\"duration\": string, \"tags\": [string], \"flags\": {\"wheelchair\": boolean, \"childFriendly\": boolean} }\n"
+    "Generate at least 2 itinerary days (or all between start and end), with 1–2 items per block, grounded by Tavily.\n"
+    "Weather should influence packing and indoor/outdoor timing.\n"
+    "Return ONLY the JSON — no commentary."
+)
 
-    print("\n" + "#"*90)
-    print("[PLAN] Booking:", {"city": city, "start": start, "end": end, "guests": guests, "partyType": party})
-    print("[PLAN] User ask:", ask)
-    print("#"*90 + "\n")
+# Part of the request deadline kept for plan generation after context gathering
+PLAN_LLM_RESERVE_S = float(os.getenv("PLAN_LLM_RESERVE_S", "25"))
+# Listings from the in-process index, added when the ask is about lodging; 0 disables
+PLAN_LISTINGS_LIMIT = int(os.getenv("PLAN_LISTINGS_LIMIT", "3"))
+_LODGING_RE = re.compile(
+    r"\b(?:hotels?|lodging|accommodations?|listings?|apartments?|airbnb|staybnb|places? to stay|where to stay)\b", re.I)
 
-    # --- 2. Context from Tavily + weather ---
+async def _weather_block(city: str, start: str, end: str) -> str:
+    wx = await summarize_weather(f"{city} | {start} to {end}")
+    return fit(wx, section_budget("weather")) if CONTEXT_COMPRESS else wx
+
+async def plan_context(city: str, start: str, end: str, ask: str = "") -> Dict[str, str]:
+    """
+    Tavily POIs + restaurants and weather for a stay, fetched in parallel.
+    Returns {"poi", "food", "weather"} text blocks (fallback text if missing).
+    Under a tight request deadline only the POI search runs.
+    Also used by warmer.py to pre-populate the caches for booked trips.
+    """
     poi_query = (
         f"Best things to do in {city} between {start} and {end}. "
         f"Include addresses and note kid-friendly or wheelchair-friendly if relevant. "
@@ -249,81 +513,367 @@ def plan_with_context(req: AgentPlanRequest) -> PlanResponse:
         f"Prefer options matching dietary hints from: {ask[:250]}"
     )
 
-    poi_snip = tavily_snippet(poi_query, max_len=1800, include_answer=True)
-    food_snip = tavily_snippet(food_query, max_len=1800, include_answer=True)
+    # All three lookups in parallel under one deadline; missing blocks become "unavailable"
+    return await gather_context(
+        {
+            "poi": tavily_snippet(poi_query, max_len=1800, section="poi", include_answer=True),
+            "food": tavily_snippet(food_query, max_len=1800, section="food", include_answer=True),
+            "weather": _weather_block(city, start, end),
+        },
+        fallbacks={
+            "poi": "Web results unavailable.",
+            "food": "Web results unavailable.",
+            "weather": "Weather data unavailable.",
+        },
+        reserve_s=PLAN_LLM_RESERVE_S,
+        optional=("food", "weather"),
+    )
+
+def _plan_window(req: AgentPlanRequest) -> Tuple[str, str, str, str]:
+    """(city, start, end, ask) — everything plan_context depends on."""
+    city  = req.booking.location
+    start = req.booking.start[:10] if isinstance(req.booking.start, str) else str(req.booking.start)
+    end   = req.booking.end[:10]   if isinstance(req.booking.end, str)   else str(req.booking.end)
+    ask   = (getattr(req, "ask", "") or "").strip()
+    return city, start, end, ask
 
+async def _plan_prompt(req: AgentPlanRequest, ctx: Optional[Dict[str, str]] = None) -> Tuple[List[Dict[str, Any]], str]:
+    """
+    Build the planner prompt for a booking (dates, city, guests) and optional
+    free-text ask, fusing Tavily and weather context (fetched here unless the
+    caller already has it for this window, see plan_batch).
+    Returns (messages, weather_summary); only the system prompt is cacheable
+    (the brief is cached on the chunked path, where several calls share it).
+    """
+    brief, wx = await _plan_brief(req, ctx)
+    log.debug("plan prompt chars system=%d user=%d", len(PLAN_SYSTEM_PROMPT), len(brief))
+    return _messages(PLAN_SYSTEM_PROMPT, brief, "Return ONLY the JSON object."), wx
+
+async def _plan_brief(req: AgentPlanRequest, ctx: Optional[Dict[str, str]] = None) -> Tuple[str, str]:
+    """Booking, traveler text and Tavily/weather context as one prompt block; (brief, weather_summary)."""
+    # --- 1. Basic fields ---
+    city, start, end, ask = _plan_window(req)
+    guests = int(req.booking.guests or 1)
+    party  = getattr(req.booking, "partyType", "group")
+
+    log.info("plan booking city=%r %s→%s guests=%d party=%s ask=%r", city, start, end, guests, party, ask)
+
+    # --- 2. Context from Tavily + weather ---
+    if ctx is None:
+        with span("context"):
+            ctx = await plan_context(city, start, end, ask)
+    poi_snip, food_snip, wx = ctx["poi"], ctx["food"], ctx["weather"]
+    log.debug("plan context chars poi=%d food=%d weather=%d", len(poi_snip), len(food_snip), len(wx))
+    stays = ""
+    if PLAN_LISTINGS_LIMIT > 0 and _LODGING_RE.search(ask):
+        stays = _listings_block(city, ask, PLAN_LISTINGS_LIMIT, guests)
+
+    # --- 3. Booking context shared by every planner prompt ---
+    with span("prompt_build"):
+        brief = (
+            f"BOOKING:\n"
+            f"City: {city}\nDates: {start} → {end}\nGuests: {guests}\nParty type: {party}\n\n"
+            f"USER TEXT:\n{ask or '(none)'}\n\n"
+            f"TAVILY – PLACES (structured lines):\n{poi_snip}\n\n"
+            f"TAVILY – RESTAURANTS (structured lines):\n{food_snip}\n\n"
+            f"WEATHER:\n{wx}\n\n"
+        )
+        if stays:
+            brief += f"STAYBNB LISTINGS IN {city.upper()}:\n{stays}\n\n"
+    return brief, wx
+
+def _parse_plan(raw: str, wx: str) -> PlanResponse:
+    """
+    Tolerant parse of the model output (fences, truncation, bad items are
+    repaired or dropped individually). Empty plan (+ weather) if nothing parses.
+    """
+    log.debug("plan raw LLM output (%d chars): %.1200s", len(raw), raw)
+
+    parsed = parse_plan(raw)
+    if parsed is not None:
+        return parsed
+
+    log.error("plan JSON parse failed: no JSON object recovered")
+    # Empty but valid response (no deterministic synthesis)
+    fallback_pack = []
+    if isinstance(wx, str) and wx:
+        fallback_pack.append(wx)
+    return PlanResponse(itinerary=[], activities=[], restaurants=[], packing=fallback_pack)
+
+# Plans without a free-text ask depend only on the booking, so they can be
+# reused across page loads and pre-generated by warmer.py.
+PLAN_DRAFT_CACHE = make_cache(
+    "plan_drafts",
+    ttl_s=float(os.getenv("PLAN_DRAFT_TTL_S", str(12 * 3600))),
+    max_entries=int(os.getenv("PLAN_DRAFT_MAX", "500")),
+)
+
+def _draft_key(req: AgentPlanRequest) -> Optional[str]:
+    if (req.ask or "").strip() or req.preferences != Preferences():
+        return None
+    b = req.booking
+    return make_key(b.location.strip().lower(), str(b.start)[:10], str(b.end)[:10],
+                    int(b.guests or 1), b.partyType or "group")
+
+async def plan_with_context(req: AgentPlanRequest, ctx: Optional[Dict[str, str]] = None) -> PlanResponse:
+    """
+    Generate a full travel plan based on booking (dates, city, guests) and
+    optional free-text ask. Automatically fuses Tavily and weather context
+    (or uses `ctx` from plan_context if the caller already fetched it).
+    """
+    draft_key = _draft_key(req)
+    if draft_key:
+        draft = PLAN_DRAFT_CACHE.get(draft_key)
+        if draft is not None:
+            log.debug("plan draft cache hit")
+            return PlanResponse(**draft)
+    return await _generate_plan(req, ctx, draft_key)
+
+async def _generate_plan(req: AgentPlanRequest, ctx: Optional[Dict[str, str]], draft_key: Optional[str]) -> PlanResponse:
+    if _use_chunked(req):
+        plan = await _generate_plan_chunked(req, ctx)
+    else:
+        messages, wx = await _plan_prompt(req, ctx)
+        # --- 4. LLM call and parse ---
+        try:
+            raw = await _plan_llm("plan", messages)
+        except Exception as e:
+            log.error("Claude invocation failed: %s", e)
+            raw = ""
+        plan = _parse_plan(raw, wx)
+    # Only complete plans are reused: a day lost to a failed call should be regenerated next time
+    if draft_key and plan.itinerary and all(d.morning or d.afternoon or d.evening for d in plan.itinerary):
+        PLAN_DRAFT_CACHE.set(draft_key, plan.model_dump())
+    return plan
+
+async def _plan_llm(route: str, messages: List[Dict[str, Any]], **kwargs) -> str:
+    """One guarded, deadline-bounded planner call; returns the raw model text."""
+    resp = await _invoke(route, messages, **kwargs)
+    return resp.content if hasattr(resp, "content") else str(resp)
+
+async def plan_with_context_stream(req: AgentPlanRequest) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Streaming planner. Yields (section, item) as soon as each itinerary day,
+    activity, restaurant or packing entry is complete in the partial JSON
+    (DayBlock / Activity / str), then ("done", PlanResponse) parsed from the
+    full output.
+    """
+    messages, wx = await _plan_prompt(req)
+    parser = IncrementalPlanParser()
     try:
-        wx = weather_summary(f"{city} | {start} to {end}")
+        with span("llm_stream"):
+            async for text in _stream("plan", messages):
+                for section, item in parser.feed(text):
+                    yield section, item
     except Exception as e:
-        print("[PLAN] Weather error:", e)
-        wx = "Weather data unavailable."
-
-    print("[PLAN] Snippet lengths → POIs:", len(poi_snip), "Food:", len(food_snip))
-    print("[PLAN] Weather summary length:", len(wx) if isinstance(wx, str) else 0)
-
-    # --- 3. Strong system prompt (JSON-only) ---
-    system = (
-        "You are TripMate, an expert AI travel planner.\n"
-        "You will receive:\n"
-        "- A booking (city, dates, guests)\n"
-        "- A free-text traveler request\n"
-        "- Tavily web data with TITLE, CONTENT EXCERPTS, URL, and SCORE (as a structured text block)\n"
-        "- Weather summary\n\n"
-        "Your job:\n"
-        "1. Infer traveler preferences (budget, interests, mobility, dietary) from the free text if present.\n"
-        "2. Use Tavily 'content' excerpts to extract REAL places and restaurants (do NOT just repeat article titles).\n"
-        "3. Produce strictly valid JSON with keys:\n"
-        "{\n"
-        "  \"itinerary\": [ { \"date\": string, \"morning\": [Activity], \"afternoon\": [Activity], \"evening\": [Activity] } ],\n"
-        "  \"activities\": [Activity],\n"
-        "  \"restaurants\": [Activity],\n"
-        "  \"packing\": [string]\n"
-        "}\n"
-        "Activity = { \"title\": string, \"address\": string, \"priceTier\": \"$\"|\"$$\"|\"$$$\"|\"$$$$\", "
-        "\"duration\": string, \"tags\": [string], \"flags\": {\"wheelchair\": boolean, \"childFriendly\": boolean} }\n"
-        "Generate at least 2 itinerary days (or all between start and end), with 1–2 items per block, grounded by Tavily.\n"
-        "Weather should influence packing and indoor/outdoor timing.\n"
-        "Return ONLY the JSON — no commentary."
-    )
+        log.error("Claude stream failed: %s", e)
+    yield "done", _parse_plan(parser.buf, wx)
+
+# =========================
+# 4b) Chunked planner (long stays)
+# =========================
+# One 2200-token answer is slow for long stays and gets cut off at max_tokens
+# after ~5 days. From PLAN_CHUNKED_MIN_DAYS on, a short skeleton call gives
+# every date a theme, then each day — and the extra activity/restaurant lists —
+# is its own small call, run in parallel over the same booking/context brief.
+PLAN_CHUNKED = os.getenv("PLAN_CHUNKED", "1") == "1"
+PLAN_CHUNKED_MIN_DAYS = int(os.getenv("PLAN_CHUNKED_MIN_DAYS", "4"))
+PLAN_CHUNK_CONCURRENCY = int(os.getenv("PLAN_CHUNK_CONCURRENCY", "4"))
+PLAN_SKELETON_MAX_TOKENS = int(os.getenv("PLAN_SKELETON_MAX_TOKENS", "500"))
+PLAN_DAY_MAX_TOKENS = int(os.getenv("PLAN_DAY_MAX_TOKENS", "900"))
+
+_ACTIVITY_SHAPE = (
+    "Activity = { \"title\": string, \"address\": string, \"priceTier\": \"$\"|\"$$\"|\"$$$\"|\"$$$$\", "
+    "\"duration\": string, \"tags\": [string], \"flags\": {\"wheelchair\": boolean, \"childFriendly\": boolean} }\n"
+)
+
+# Every chunked call shares this system prompt and the booking brief, so
+# after the first call the rest read both from the prompt cache; the task
+# instructions below come after the brief.
+PLAN_CHUNK_SYSTEM_PROMPT = (
+    "You are TripMate, an expert AI travel planner.\n"
+    "You will receive a booking, the traveler's free text, Tavily web data and a weather summary, "
+    "followed by ONE task. Do only that task."
+)
+
+PLAN_SKELETON_PROMPT = (
+    "Outline a multi-day trip from the booking, traveler text, Tavily web data and weather above.\n"
+    "Give every date a distinct theme and area of the city so days do not repeat places; "
+    "put outdoor themes on the driest days.\n"
+    "Return strictly valid JSON:\n"
+    "{ \"itinerary\": [ { \"date\": string, \"theme\": string } ], \"packing\": [string] }\n"
+    "One itinerary entry per listed date, each theme under 12 words. Return ONLY the JSON — no commentary."
+)
 
-    user = (
-        f"BOOKING:\n"
-        f"City: {city}\nDates: {start} → {end}\nGuests: {guests}\nParty type: {party}\n\n"
-        f"USER TEXT:\n{ask or '(none)'}\n\n"
-        f"TAVILY – PLACES (structured lines):\n{poi_snip}\n\n"
-        f"TAVILY – RESTAURANTS (structured lines):\n{food_snip}\n\n"
-        f"WEATHER:\n{wx}\n\n"
-        "Return ONLY the JSON object."
+PLAN_DAY_PROMPT = (
+    "You plan ONE day of a longer trip. The trip outline gives every day's theme: follow this day's "
+    "theme and do not use places that fit another day's theme better.\n"
+    "Use Tavily 'content' excerpts to pick REAL places and restaurants (do NOT just repeat article titles). "
+    "Weather should influence indoor/outdoor timing.\n"
+    "Return strictly valid JSON:\n"
+    "{ \"itinerary\": [ { \"date\": string, \"morning\": [Activity], \"afternoon\": [Activity], \"evening\": [Activity] } ] }\n"
+    + _ACTIVITY_SHAPE +
+    "Exactly one itinerary entry, 1–2 items per block. Return ONLY the JSON — no commentary."
+)
+
+PLAN_EXTRAS_PROMPT = (
+    "Suggest options the traveler can swap into their itinerary: 3–5 activities and 3–5 restaurants, "
+    "grounded in the Tavily 'content' excerpts and matching any preferences in the traveler text.\n"
+    "Return strictly valid JSON:\n"
+    "{ \"activities\": [Activity], \"restaurants\": [Activity] }\n"
+    + _ACTIVITY_SHAPE +
+    "Return ONLY the JSON — no commentary."
+)
+
+def _use_chunked(req: AgentPlanRequest) -> bool:
+    _, start, end, _ = _plan_window(req)
+    return PLAN_CHUNKED and len(_date_range(start, end)) >= PLAN_CHUNKED_MIN_DAYS
+
+def _title_key(title: str) -> str:
+    return re.sub(r"^the ", "", re.sub(r"[^a-z0-9]+", " ", title.lower()).strip())
+
+def _skeleton(data: Any) -> Tuple[Dict[str, str], List[str]]:
+    """(date -> theme, packing) from a parsed skeleton; empty on anything malformed."""
+    if not isinstance(data, dict):
+        return {}, []
+    themes = {str(d.get("date"))[:10]: str(d.get("theme") or "").strip()
+              for d in data.get("itinerary") or [] if isinstance(d, dict) and d.get("date")}
+    packing = [str(p) for p in data.get("packing") or [] if isinstance(p, (str, int, float))]
+    return {k: v for k, v in themes.items() if v}, packing
+
+def _merge_chunks(days: List[DayBlock], extras: Optional[PlanResponse], packing: List[str]) -> PlanResponse:
+    """One plan from per-day blocks; a place already used earlier in the trip is dropped."""
+    seen = set()
+
+    def fresh(items):
+        out = []
+        for a in items:
+            k = _title_key(a.title)
+            if k and k not in seen:
+                seen.add(k)
+                out.append(a)
+        return out
+
+    itinerary = [DayBlock(date=d.date, morning=fresh(d.morning), afternoon=fresh(d.afternoon),
+                          evening=fresh(d.evening)) for d in days]
+    return PlanResponse(
+        itinerary=itinerary,
+        activities=fresh(extras.activities) if extras else [],
+        restaurants=fresh(extras.restaurants) if extras else [],
+        packing=packing,
     )
 
-    print("[PLAN] Prompt sizes → system:", len(system), "user:", len(user))
+async def _generate_plan_chunked(req: AgentPlanRequest, ctx: Optional[Dict[str, str]]) -> PlanResponse:
+    brief, wx = await _plan_brief(req, ctx)
+    _, start, end, _ = _plan_window(req)
+    dates = _date_range(start, end)
+    log.info("plan chunked: %d days, concurrency %d", len(dates), PLAN_CHUNK_CONCURRENCY)
 
-    # --- 4. LLM call and parse ---
-    try:
-        resp = llm.invoke(system + "\n\n" + user)
-        raw = resp.content if hasattr(resp, "content") else str(resp)
+    def _prompt(instructions: str, task: str) -> List[Dict[str, Any]]:
+        return _messages(PLAN_CHUNK_SYSTEM_PROMPT, brief,
+                         instructions + "\n\n" + task + "\n\nReturn ONLY the JSON object.", cached=1)
 
-        print("[PLAN] RAW LLM (first 1200 chars):")
-        print(raw[:1200])
-        if len(raw) > 1200:
-            print("... [truncated] ...")
+    async def _extras() -> Optional[PlanResponse]:
+        raw = await _plan_llm("plan_extras", _prompt(PLAN_EXTRAS_PROMPT, "EXTRA SUGGESTIONS"),
+                              max_tokens=PLAN_DAY_MAX_TOKENS)
+        return parse_plan(raw)
 
-        data = json.loads(raw)
+    # Extras do not depend on the outline, so they run alongside the skeleton
+    extras_task = asyncio.create_task(_extras())
+    try:
+        try:
+            raw = await _plan_llm("plan_skeleton", _prompt(PLAN_SKELETON_PROMPT, "ITINERARY SKELETON for these dates:\n"
+                                                           + "\n".join(dates)), max_tokens=PLAN_SKELETON_MAX_TOKENS)
+            themes, packing = _skeleton(repair_json(strip_wrapping(raw)))
+        except Exception as e:
+            log.error("plan skeleton failed, days planned without themes: %s", e)
+            themes, packing = {}, []
+        outline = "TRIP OUTLINE:\n" + "\n".join(f"- {d}: {themes.get(d, 'free exploration')}" for d in dates)
+        sem = asyncio.Semaphore(max(PLAN_CHUNK_CONCURRENCY, 1))
+
+        async def _day(d: str) -> Optional[DayBlock]:
+            async with sem:
+                raw = await _plan_llm("plan_day", _prompt(PLAN_DAY_PROMPT, f"{outline}\n\nPLAN THIS DAY: {d} — "
+                                                          f"{themes.get(d, 'free exploration')}"),
+                                      max_tokens=PLAN_DAY_MAX_TOKENS)
+            plan = parse_plan(raw)
+            if plan is None or not plan.itinerary:
+                return None
+            block = next((b for b in plan.itinerary if b.date[:10] == d), plan.itinerary[0])
+            return block.model_copy(update={"date": d})
+
+        with span("plan_days"):
+            results = await asyncio.gather(*(_day(d) for d in dates), return_exceptions=True)
+        try:
+            extras = await extras_task
+        except Exception as e:
+            log.error("plan extras failed: %s", e)
+            extras = None
+    finally:
+        extras_task.cancel()
+
+    days = []
+    for d, r in zip(dates, results):
+        if isinstance(r, BaseException) or r is None:
+            log.error("plan day %s failed: %s", d, r or "no JSON recovered")
+            r = DayBlock(date=d)
+        days.append(r)
+    if not any(b.morning or b.afternoon or b.evening for b in days):
+        return _parse_plan("", wx)
+    return _merge_chunks(days, extras, packing or ([wx] if wx else []))
 
-        # Light repair: if a block is string, wrap into activity object
-        for day in data.get("itinerary", []):
-            for block in ("morning", "afternoon", "evening"):
-                if isinstance(day.get(block), str):
-                    day[block] = [{"title": day[block], "address": "", "priceTier": "$$", "duration": "1-2h", "tags": [], "flags": {"wheelchair": False, "childFriendly": True}}]
+# =========================
+# 5) Batch planner
+# =========================
+PLAN_BATCH_CONCURRENCY = int(os.getenv("PLAN_BATCH_CONCURRENCY", "3"))
 
-        parsed = PlanResponse(**data)
-        print("[PLAN] Parsed PlanResponse OK.")
-        return parsed
+async def plan_batch(
+    reqs: List[AgentPlanRequest], *, concurrency: int = PLAN_BATCH_CONCURRENCY,
+) -> AsyncIterator[Tuple[int, Any]]:
+    """
+    Plan several bookings at once. Context is fetched once per distinct
+    (city, start, end, ask) window and shared by every booking in it; LLM
+    generations run at most `concurrency` at a time. Yields (index, result)
+    in completion order, where result is a PlanResponse or the Exception that
+    request failed with.
+    """
+    async def _context(window):
+        with span("context"):
+            return await plan_context(*window)
+
+    ready: List[Tuple[int, Any]] = []
+    pending: List[Tuple[int, AgentPlanRequest, Optional[str]]] = []
+    windows: Dict[Tuple[str, str, str, str], "asyncio.Task[Dict[str, str]]"] = {}
+    for i, req in enumerate(reqs):
+        draft_key = _draft_key(req)
+        draft = PLAN_DRAFT_CACHE.get(draft_key) if draft_key else None
+        if draft is not None:
+            ready.append((i, PlanResponse(**draft)))
+            continue
+        pending.append((i, req, draft_key))
+        w = _plan_window(req)
+        if w not in windows:
+            windows[w] = asyncio.create_task(_context(w))
+    log.info("plan batch: %d bookings, %d drafts cached, %d context windows",
+             len(reqs), len(ready), len(windows))
+
+    sem = asyncio.Semaphore(max(concurrency, 1))
+
+    async def _one(i: int, req: AgentPlanRequest, draft_key: Optional[str]):
+        try:
+            ctx = await windows[_plan_window(req)]
+            async with sem:
+                return i, await _generate_plan(req, ctx, draft_key)
+        except Exception as e:
+            log.warning("plan batch item %d failed: %s", i, e)
+            return i, e
 
-    except Exception as e:
-        print(f"[TripMate ERROR] JSON parse failed: {e}")
-        # Empty but valid response (no deterministic synthesis)
-        fallback_pack = []
-        if isinstance(wx, str) and wx:
-            fallback_pack.append(wx)
-        return PlanResponse(itinerary=[], activities=[], restaurants=[], packing=fallback_pack)
\ No newline at end of file
+    tasks = [asyncio.create_task(_one(*p)) for p in pending]
+    try:
+        for item in ready:
+            yield item
+        for fut in asyncio.as_completed(tasks):
+            yield await fut
+    finally:
+        for t in (*tasks, *windows.values()):
+            t.cancel()
@@ -0,0 +1,219 @@
+# agent/chat_cache.py
+"""
+Response cache for anonymous /ai/chat answers.
+
+Lookups go in two steps:
+  1. exact   — normalized question (lowercase, punctuation/whitespace folded)
+  2. similar — near-duplicate questions via a MinHash/LSH index over character
+               3-grams of the question's content words (stopwords dropped, so
+               "when is the best time to visit Lisbon" ~ "best time to visit
+               lisbon?"), confirmed with the true Jaccard similarity against
+               CHAT_CACHE_SIMILARITY. A candidate is rejected if it mentions a
+               word the new question does not (e.g. another city, month or
+               number), so "weather in Lisbon in May" never answers "weather
+               in Porto in May" and "3 days in Rome" never answers "5 days".
+
+All CPU-only and in-process; a lookup is a few dict probes.
+
+Env:
+  CHAT_CACHE_ENABLED      1 | 0            (default 1)
+  CHAT_CACHE_TTL_S        answer lifetime  (default 3600)
+  CHAT_CACHE_MAX          max entries, LRU (default 5000)
+  CHAT_CACHE_SIMILARITY   Jaccard threshold for near-duplicates, 0 disables (default 0.8)
+"""
+import os, re, time, zlib, random, logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+log = logging.getLogger(__name__)
+
+_NUM_PERM = 32
+_BANDS = 8                       # 8 bands x 4 rows: ~0.8 Jaccard has a >90% chance to collide
+_ROWS = _NUM_PERM // _BANDS
+_PRIME = (1 << 61) - 1
+_rng = random.Random(236)
+_PERMS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(_NUM_PERM)]
+
+_STOPWORDS = frozenset(
+    "a an the is are was be to of in on at for from and or what whats what's which when where how "
+    "do does can i we my our me you your it its this that like there any some good best should "
+    "would could please tell about with go visit".split()
+)
+
+
+def normalize_question(q: str) -> str:
+    return re.sub(r"\s+", " ", re.sub(r"[^\w\s]", " ", (q or "").lower())).strip()
+
+
+def _shingles(norm: str) -> FrozenSet[str]:
+    s = f" {norm} "
+    return frozenset(s[i:i + 3] for i in range(max(len(s) - 2, 1)))
+
+
+def _minhash(shingles: FrozenSet[str]) -> Tuple[int, ...]:
+    hashes = [zlib.crc32(sh.encode("utf-8")) for sh in shingles]
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMS)
+
+
+def _bands(sig: Tuple[int, ...]) -> List[Tuple[int, Tuple[int, ...]]]:
+    return [(b, sig[b * _ROWS:(b + 1) * _ROWS]) for b in range(_BANDS)]
+
+
+def _jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def _content(norm: str) -> str:
+    # Numbers stay in ("3 days" vs "5 days", "2 people" vs "8 people")
+    words = [w for w in norm.split() if (len(w) > 1 or w.isdigit()) and w not in _STOPWORDS]
+    return " ".join(words) or norm
+
+
+def _same_subject(a: Set[str], b: Set[str]) -> bool:
+    """
+    Every content word on either side has a close spelling on the other
+    (typos, plurals); numbers must match exactly.
+    """
+    for x in a ^ b:
+        if x.isdigit():
+            return False
+        others = b if x in a else a
+        if not any(_jaccard(_shingles(x), _shingles(y)) >= 0.5 for y in others):
+            return False
+    return True
+
+
+@dataclass
+class _Entry:
+    norm: str
+    answer: str
+    expires_at: float
+    shingles: FrozenSet[str]
+    words: Set[str]
+    bands: List[Tuple[int, Tuple[int, ...]]] = field(default_factory=list)
+
+
+class ChatCache:
+    def __init__(self, *, ttl_s: float, max_entries: int, similarity: float):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], Set[str]] = {}
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    # ---- lookup ----
+    def get(self, question: str) -> Optional[str]:
+        norm = normalize_question(question)
+        now = time.time()
+        entry = self._live(norm, now)
+        if entry is not None:
+            self.exact_hits += 1
+            return entry.answer
+
+        if self.similarity > 0:
+            content = _content(norm)
+            shingles = _shingles(content)
+            words = set(content.split())
+            best, best_sim = None, self.similarity
+            for key in self._candidates(_minhash(shingles)):
+                cand = self._live(key, now)
+                if cand is None:
+                    continue
+                sim = _jaccard(shingles, cand.shingles)
+                if sim >= best_sim and _same_subject(words, cand.words):
+                    best, best_sim = cand, sim
+            if best is not None:
+                self.similar_hits += 1
+                log.debug("chat cache near-duplicate (%.2f): %r ~ %r", best_sim, norm, best.norm)
+                return best.answer
+
+        self.misses += 1
+        return None
+
+    def _live(self, norm: str, now: float) -> Optional[_Entry]:
+        entry = self._entries.get(norm)
+        if entry is None:
+            return None
+        if entry.expires_at <= now:
+            self._remove(norm)
+            return None
+        self._entries.move_to_end(norm)
+        return entry
+
+    def _candidates(self, sig: Tuple[int, ...]) -> Set[str]:
+        out: Set[str] = set()
+        for band in _bands(sig):
+            out |= self._buckets.get(band, set())
+        return out
+
+    # ---- store / evict ----
+    def set(self, question: str, answer: str) -> None:
+        norm = normalize_question(question)
+        if not norm:
+            return
+        self._remove(norm)
+        content = _content(norm)
+        shingles = _shingles(content)
+        entry = _Entry(norm, answer, time.time() + self.ttl_s, shingles, set(content.split()))
+        if self.similarity > 0:
+            entry.bands = _bands(_minhash(shingles))
+            for band in entry.bands:
+                self._buckets.setdefault(band, set()).add(norm)
+        self._entries[norm] = entry
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, norm: str) -> None:
+        entry = self._entries.pop(norm, None)
+        if entry is None:
+            return
+        for band in entry.bands:
+            bucket = self._buckets.get(band)
+            if bucket is not None:
+                bucket.discard(norm)
+                if not bucket:
+                    del self._buckets[band]
+
+    def invalidate(self, city: Optional[str] = None) -> int:
+        """
+        Drop every entry whose question or answer mentions `city` (all entries
+        if None); returns the count.
+        """
+        if city is None:
+            keys = list(self._entries)
+        else:
+            pat = re.compile(rf"\b{re.escape(normalize_question(city))}\b")
+            keys = [k for k, e in self._entries.items()
+                    if pat.search(k) or pat.search(normalize_question(e.answer))]
+        for k in keys:
+            self._remove(k)
+        self.invalidations += len(keys)
+        return len(keys)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.exact_hits + self.similar_hits + self.misses
+        hits = self.exact_hits + self.similar_hits
+        return {
+            "size": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+CHAT_CACHE_ENABLED = os.getenv("CHAT_CACHE_ENABLED", "1") == "1"
+CHAT_CACHE = ChatCache(
+    ttl_s=float(os.getenv("CHAT_CACHE_TTL_S", "3600")),
+    max_entries=int(os.getenv("CHAT_CACHE_MAX", "5000")),
+    similarity=float(os.getenv("CHAT_CACHE_SIMILARITY", "0.8")),
+)
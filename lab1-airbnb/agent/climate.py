@@ -0,0 +1,306 @@
+# agent/climate.py
+"""
+Offline climate normals: typical monthly weather per grid cell.
+
+Forecast APIs only see ~2 weeks ahead, so "what's Lisbon like in May?"
+asked in January needs climatology, not a forecast. This module reads a
+compact, memory-mapped store of per-cell monthly normals and answers with
+a nearest-cell lookup in microseconds, with no network call.
+
+File layout (little-endian, built by `python climate.py build`):
+
+    header   8s magic "CLIMNRM1", u16 version, u16 n_vars, f32 res_deg,
+             u32 n_cells, u32 names_len
+    cells    i32[n_cells]                   sorted cell ids (row * ncols + col)
+    values   i16[n_cells][12][n_vars]       tmax °C×10, tmin °C×10, precip mm, wet days ×10
+    names    JSON {city key: [lat, lon]}    gazetteer, so known cities skip geocoding
+
+Env:
+  CLIMATE_NORMALS_PATH   store file (default agent/data/climate_normals.bin)
+  CLIMATE_MAX_RING       cells searched around the exact cell for the nearest
+                         populated one (default 2, ~0.5° at 0.25° resolution)
+
+    python climate.py build --points cities.csv [--res 0.25] [--years 1991-2020]
+    python climate.py build --csv normals.csv
+    python climate.py lookup "Lisbon" 5
+"""
+import os, re, sys, csv, json, mmap, math, array, bisect, struct, asyncio, logging, argparse
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+log = logging.getLogger(__name__)
+
+CLIMATE_NORMALS_PATH = os.getenv(
+    "CLIMATE_NORMALS_PATH", os.path.join(os.path.dirname(__file__), "data", "climate_normals.bin"))
+CLIMATE_MAX_RING = int(os.getenv("CLIMATE_MAX_RING", "2"))
+
+MAGIC = b"CLIMNRM1"
+VERSION = 1
+N_VARS = 4
+_HEADER = struct.Struct("<8sHHfII")
+
+MONTH_NAMES = ["January", "February", "March", "April", "May", "June", "July",
+               "August", "September", "October", "November", "December"]
+
+
+class MonthNormals(NamedTuple):
+    tmax_c: float
+    tmin_c: float
+    precip_mm: float
+    wet_days: float
+
+
+def city_key(city: str) -> str:
+    return re.sub(r"\s+", " ", city.strip().lower())
+
+
+def _cell(lat: float, lon: float, res: float) -> Tuple[int, int, int]:
+    """(row, col, ncols) of the grid cell containing lat/lon."""
+    ncols = int(round(360 / res))
+    row = min(int((lat + 90) // res), int(round(180 / res)) - 1)
+    col = int((lon + 180) // res) % ncols
+    return row, col, ncols
+
+
+# =========================
+# Reading
+# =========================
+class ClimateStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._f = open(path, "rb")
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, n_vars, res, n, names_len = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION or n_vars != N_VARS:
+            raise ValueError(f"{path}: not a v{VERSION} climate normals file")
+        self.res, self.n = round(res, 6), n   # stored as f32; match the builder's grid exactly
+        off = _HEADER.size
+        cells_mv = memoryview(self._mm)[off:off + 4 * n]
+        vals_mv = memoryview(self._mm)[off + 4 * n:off + 4 * n + 2 * n * 12 * N_VARS]
+        if sys.byteorder == "little":
+            self._cells, self._vals = cells_mv.cast("i"), vals_mv.cast("h")
+        else:  # big-endian host: byte-swapped copies instead of zero-copy views
+            self._cells, self._vals = array.array("i", cells_mv), array.array("h", vals_mv)
+            self._cells.byteswap()
+            self._vals.byteswap()
+        names_off = off + 4 * n + 2 * n * 12 * N_VARS
+        self.names: Dict[str, List[float]] = json.loads(bytes(self._mm[names_off:names_off + names_len]) or b"{}")
+
+    def _index(self, cell_id: int) -> Optional[int]:
+        i = bisect.bisect_left(self._cells, cell_id)
+        return i if i < self.n and self._cells[i] == cell_id else None
+
+    def _month(self, i: int, month: int) -> MonthNormals:
+        o = (i * 12 + month - 1) * N_VARS
+        v = self._vals
+        return MonthNormals(v[o] / 10, v[o + 1] / 10, float(v[o + 2]), v[o + 3] / 10)
+
+    def nearest(self, lat: float, lon: float, max_ring: int = CLIMATE_MAX_RING) -> Optional[int]:
+        """Index of the closest populated cell within `max_ring` cells, else None."""
+        row, col, ncols = _cell(lat, lon, self.res)
+        hit = self._index(row * ncols + col)
+        if hit is not None:
+            return hit
+        best, best_d = None, math.inf
+        coslat = math.cos(math.radians(lat))
+        # Distances weight columns by cos(lat), so the closest cell of ring k is
+        # k * min(1, coslat) away; at high latitudes an outer ring's (0, ±k) cell
+        # can beat an inner ring's corner, so stop only once a ring cannot win.
+        nearest_in_ring = min(1.0, coslat)
+        for ring in range(1, max_ring + 1):
+            if best is not None and (ring * nearest_in_ring) ** 2 >= best_d:
+                break
+            for dr in range(-ring, ring + 1):
+                for dc in range(-ring, ring + 1):
+                    if max(abs(dr), abs(dc)) != ring:
+                        continue
+                    i = self._index((row + dr) * ncols + (col + dc) % ncols)
+                    if i is None:
+                        continue
+                    d = dr * dr + (dc * coslat) ** 2
+                    if d < best_d:
+                        best, best_d = i, d
+        return best
+
+    def lookup(self, lat: float, lon: float, month: int) -> Optional[MonthNormals]:
+        i = self.nearest(lat, lon)
+        return None if i is None else self._month(i, month)
+
+    def city(self, name: str) -> Optional[Tuple[float, float]]:
+        """Coordinates from the built-in gazetteer ("Lisbon, Portugal" also tries "lisbon")."""
+        key = city_key(name)
+        hit = self.names.get(key) or self.names.get(key.split(",")[0].strip())
+        return (hit[0], hit[1]) if hit else None
+
+    def close(self) -> None:
+        for view in (self._cells, self._vals):
+            if isinstance(view, memoryview):
+                view.release()   # mmap refuses to close while views are exported
+        self._mm.close()
+        self._f.close()
+
+
+_store: Optional[ClimateStore] = None
+_store_missing = False
+
+
+def get_store() -> Optional[ClimateStore]:
+    """The process-wide store, opened on first use; None if no file is installed."""
+    global _store, _store_missing
+    if _store is None and not _store_missing:
+        try:
+            _store = ClimateStore(CLIMATE_NORMALS_PATH)
+            log.info("climate normals: %d cells at %.2f° from %s", _store.n, _store.res, CLIMATE_NORMALS_PATH)
+        except FileNotFoundError:
+            _store_missing = True
+            log.info("climate normals not installed (%s); far-off stays get no weather figures", CLIMATE_NORMALS_PATH)
+        except Exception as e:
+            _store_missing = True
+            log.warning("climate normals unreadable: %s", e)
+    return _store
+
+
+def summarize(months: Sequence[MonthNormals]) -> MonthNormals:
+    """One figure for a stay spanning several months: warmest high, coldest low, wettest month."""
+    return MonthNormals(max(m.tmax_c for m in months), min(m.tmin_c for m in months),
+                        max(m.precip_mm for m in months), max(m.wet_days for m in months))
+
+
+# =========================
+# Building
+# =========================
+def write_store(path: str, res: float, cells: Dict[int, List[List[float]]],
+                names: Optional[Dict[str, Tuple[float, float]]] = None) -> None:
+    """Write {cell_id: 12 × [tmax, tmin, precip_mm, wet_days]} atomically."""
+    ids = sorted(cells)
+    vals = array.array("h")
+    for cid in ids:
+        for tmax, tmin, precip, wet in cells[cid]:
+            vals.extend((round(tmax * 10), round(tmin * 10), min(round(precip), 32767), round(wet * 10)))
+    cell_arr = array.array("i", ids)
+    if sys.byteorder != "little":
+        cell_arr.byteswap()
+        vals.byteswap()
+    names_blob = json.dumps({k: [round(a, 4), round(b, 4)] for k, (a, b) in (names or {}).items()},
+                            separators=(",", ":")).encode()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, N_VARS, res, len(ids), len(names_blob)))
+        f.write(cell_arr.tobytes())
+        f.write(vals.tobytes())
+        f.write(names_blob)
+    os.replace(tmp, path)
+
+
+def normals_from_daily(daily: Dict[str, list]) -> List[List[float]]:
+    """12 × [mean tmax, mean tmin, mean monthly precip, mean wet (≥1 mm) days] from Open-Meteo archive data."""
+    acc = [[0.0, 0.0, 0.0, 0.0, 0, set()] for _ in range(12)]  # tmax, tmin, precip, wet, n days, years
+    for day, tmax, tmin, pr in zip(daily.get("time", []), daily.get("temperature_2m_max", []),
+                                   daily.get("temperature_2m_min", []), daily.get("precipitation_sum", [])):
+        if tmax is None or tmin is None:
+            continue
+        a = acc[int(day[5:7]) - 1]
+        a[0] += tmax
+        a[1] += tmin
+        a[2] += pr or 0.0
+        a[3] += (pr or 0.0) >= 1.0
+        a[4] += 1
+        a[5].add(day[:4])
+    out = []
+    for tmax, tmin, pr, wet, n, years in acc:
+        y = max(len(years), 1)
+        out.append([tmax / n, tmin / n, pr / y, wet / y] if n else [0.0, 0.0, 0.0, 0.0])
+    return out
+
+
+async def _fetch_point(client, lat: float, lon: float, years: Tuple[int, int]) -> List[List[float]]:
+    r = await client.get("/v1/archive", params={
+        "latitude": lat, "longitude": lon,
+        "start_date": f"{years[0]}-01-01", "end_date": f"{years[1]}-12-31",
+        "daily": "temperature_2m_max,temperature_2m_min,precipitation_sum", "timezone": "UTC",
+    })
+    r.raise_for_status()
+    return normals_from_daily(r.json().get("daily") or {})
+
+
+async def build_from_points(points: List[Tuple[str, float, float]], *, res: float, years: Tuple[int, int],
+                            concurrency: int = 4) -> Tuple[Dict[int, List[List[float]]], Dict[str, Tuple[float, float]]]:
+    """Fetch normals for each (name, lat, lon) from the Open-Meteo archive; one call per grid cell."""
+    import httpx
+    cells: Dict[int, List[List[float]]] = {}
+    names = {city_key(name): (lat, lon) for name, lat, lon in points}
+    todo: Dict[int, Tuple[float, float]] = {}
+    for _, lat, lon in points:
+        row, col, ncols = _cell(lat, lon, res)
+        todo.setdefault(row * ncols + col, (lat, lon))
+    sem = asyncio.Semaphore(concurrency)
+    base = os.getenv("OPEN_METEO_ARCHIVE_URL", "https://archive-api.open-meteo.com")
+
+    async with httpx.AsyncClient(base_url=base, timeout=120) as client:
+        async def one(cid, lat, lon):
+            async with sem:
+                try:
+                    cells[cid] = await _fetch_point(client, lat, lon, years)
+                except Exception as e:
+                    log.warning("climate: %.3f,%.3f failed: %s", lat, lon, e)
+        await asyncio.gather(*(one(cid, *ll) for cid, ll in todo.items()))
+    return cells, names
+
+
+def read_normals_csv(path: str, res: float):
+    """Rows of name,lat,lon,month,tmax,tmin,precip_mm,wet_days (normals computed elsewhere)."""
+    cells: Dict[int, List[List[float]]] = {}
+    names: Dict[str, Tuple[float, float]] = {}
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            lat, lon = float(row["lat"]), float(row["lon"])
+            r, c, ncols = _cell(lat, lon, res)
+            months = cells.setdefault(r * ncols + c, [[0.0, 0.0, 0.0, 0.0] for _ in range(12)])
+            months[int(row["month"]) - 1] = [float(row["tmax"]), float(row["tmin"]),
+                                             float(row["precip_mm"]), float(row["wet_days"])]
+            if row.get("name"):
+                names[city_key(row["name"])] = (lat, lon)
+    return cells, names
+
+
+def _main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Build or query the climate normals store.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build")
+    src = b.add_mutually_exclusive_group(required=True)
+    src.add_argument("--points", help="CSV with name,lat,lon; normals fetched from the Open-Meteo archive")
+    src.add_argument("--csv", help="CSV with name,lat,lon,month,tmax,tmin,precip_mm,wet_days")
+    b.add_argument("--res", type=float, default=0.25, help="grid resolution in degrees")
+    b.add_argument("--years", default="1991-2020")
+    b.add_argument("--concurrency", type=int, default=4)
+    b.add_argument("--out", default=CLIMATE_NORMALS_PATH)
+    q = sub.add_parser("lookup")
+    q.add_argument("city")
+    q.add_argument("month", type=int)
+    args = ap.parse_args(argv)
+
+    if args.cmd == "lookup":
+        store = get_store()
+        ll = store.city(args.city) if store else None
+        if not ll:
+            print(f"{args.city!r} not in the store gazetteer")
+            return 1
+        print(store.lookup(*ll, args.month))
+        return 0
+
+    if args.csv:
+        cells, names = read_normals_csv(args.csv, args.res)
+    else:
+        with open(args.points, newline="", encoding="utf-8") as f:
+            points = [(r["name"], float(r["lat"]), float(r["lon"])) for r in csv.DictReader(f)]
+        y0, y1 = (int(y) for y in args.years.split("-"))
+        cells, names = asyncio.run(build_from_points(points, res=args.res, years=(y0, y1),
+                                                     concurrency=args.concurrency))
+    write_store(args.out, args.res, cells, names)
+    print(f"wrote {len(cells)} cells, {len(names)} names to {args.out} ({os.path.getsize(args.out)} bytes)")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+    sys.exit(_main())
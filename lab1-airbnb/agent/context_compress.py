@@ -0,0 +1,242 @@
+# agent/context_compress.py
+"""
+Token-budgeted context builder for Tavily results.
+
+Instead of concatenating every result and cutting at a character limit, each
+section (POIs, restaurants, chat web context, weather) is packed into its own
+token budget:
+
+  1. dedupe  — same URL (scheme/www/query/fragment ignored; the longest
+               copy wins), at most
+               CONTEXT_MAX_PER_DOMAIN results per site, and results whose
+               text mostly repeats a better-ranked one (word-shingle Jaccard)
+  2. rank    — Tavily `score` blended with how many query terms the result covers
+  3. extract — split excerpts into sentences, drop boilerplate and repeats,
+               score by entity density (proper nouns, numbers, street words)
+  4. pack    — every ranked result gets its best sentence while it fits, then
+               the remaining budget goes to the best remaining sentences;
+               sentences are emitted in their original order per result
+
+Token counts are estimated at ~4 characters per token (close enough for
+English prose and no tokenizer dependency).
+
+Env (tokens):
+  CONTEXT_COMPRESS          1 | 0, 0 restores the plain concatenation (default 1)
+  CONTEXT_BUDGET_POI        planner places section      (default 380)
+  CONTEXT_BUDGET_FOOD       planner restaurants section (default 360)
+  CONTEXT_BUDGET_WEATHER    weather section             (default 120)
+  CONTEXT_BUDGET_WEB        chat web section            (default 400)
+  CONTEXT_MAX_PER_DOMAIN    results kept per site       (default 2)
+"""
+import os, re
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+CONTEXT_COMPRESS = os.getenv("CONTEXT_COMPRESS", "1") == "1"
+BUDGETS = {
+    "poi": int(os.getenv("CONTEXT_BUDGET_POI", "380")),
+    "food": int(os.getenv("CONTEXT_BUDGET_FOOD", "360")),
+    "weather": int(os.getenv("CONTEXT_BUDGET_WEATHER", "120")),
+    "web": int(os.getenv("CONTEXT_BUDGET_WEB", "400")),
+}
+MAX_PER_DOMAIN = int(os.getenv("CONTEXT_MAX_PER_DOMAIN", "2"))
+
+_NEAR_DUP = 0.5                 # word 3-shingle Jaccard above which a result is a repeat
+_SCORE_WEIGHT = 0.6             # rank = 0.6 * tavily score + 0.4 * query-term coverage
+_MAX_SENTENCE_TOKENS = 80       # run-on "sentences" (lists without punctuation) are cut here
+_MIN_SENTENCE_SCORE = 1.0       # below this a sentence names nothing concrete ("just walk around lol")
+
+_WORD = re.compile(r"[A-Za-zÀ-ÿ0-9']+")
+_SENT_SPLIT = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9“\"(])|\s*\n+\s*|\s+[•·|]\s+")
+_ABBREV = re.compile(r"\b(av|ave|st|rd|dr|mt|no|nr|sr|sra|r|lg|pç|approx|ca|vs)\.$", re.I)
+_STREET = re.compile(
+    r"\b(st|street|rd|road|ave|avenue|blvd|square|sq|pl|place|plaza|praça|rua|via|calle|"
+    r"strasse|straße|rue|lane|ln|way|district|museum|park|market|cathedral|palace|tower)\b",
+    re.I,
+)
+_BOILERPLATE = re.compile(
+    r"cookie|subscribe|newsletter|sign up|log in|click here|advertis|affiliate|"
+    r"all rights reserved|privacy policy|terms of (use|service)|read more|skip to",
+    re.I,
+)
+_STOP = frozenset(
+    "a an the is are was be to of in on at for from and or with by best top things do what "
+    "where when how between include note if relevant hints user prefer options matching".split()
+)
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + 3) // 4
+
+
+def _terms(text: str) -> FrozenSet[str]:
+    return frozenset(w for w in (m.lower() for m in _WORD.findall(text)) if len(w) > 2 and w not in _STOP)
+
+
+def _shingles(text: str) -> FrozenSet[Tuple[str, ...]]:
+    words = [w.lower() for w in _WORD.findall(text)]
+    return frozenset(tuple(words[i:i + 3]) for i in range(max(len(words) - 2, 1)))
+
+
+def _jaccard(a: FrozenSet, b: FrozenSet) -> float:
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def _clean_url(url: str) -> str:
+    """URL without query/fragment (tracking params cost tokens and mean nothing to the LLM)."""
+    parts = urlsplit(url or "")
+    return f"{parts.scheme}://{parts.netloc}{parts.path}" if parts.netloc else (url or "")
+
+
+def _url_key(url: str) -> Tuple[str, str]:
+    """(domain, domain+path) with scheme, www., query and fragment dropped."""
+    parts = urlsplit(url or "")
+    host = (parts.netloc or "").lower()
+    host = host[4:] if host.startswith("www.") else host
+    return host, host + parts.path.rstrip("/").lower()
+
+
+def sentences(text: str) -> List[str]:
+    pieces: List[str] = []
+    for s in _SENT_SPLIT.split(text or ""):
+        s = s.strip(" -–—*#\t")
+        # Re-join splits after abbreviations ("Av. Brasília") or inside parentheses
+        if pieces and (_ABBREV.search(pieces[-1]) or pieces[-1].count("(") > pieces[-1].count(")")):
+            pieces[-1] = f"{pieces[-1]} {s}"
+        elif s:
+            pieces.append(s)
+    return [fit(s, _MAX_SENTENCE_TOKENS) for s in pieces if len(s) >= 25 and not _BOILERPLATE.search(s)]
+
+
+def sentence_score(s: str, query_terms: FrozenSet[str]) -> float:
+    """Entity density: capitalised words past the first, numbers, street/venue words, query terms."""
+    words = s.split()
+    if not words:
+        return 0.0
+    caps = sum(1 for w in words[1:] if w[:1].isupper())
+    nums = len(re.findall(r"\d+", s))
+    street = len(_STREET.findall(s))
+    query = len(_terms(s) & query_terms)
+    diversity = len({w.lower() for w in words}) / len(words)     # repeated filler scores low
+    return diversity * (2.0 * caps + 1.5 * nums + 2.0 * street + 1.0 * query) / (len(words) ** 0.5)
+
+
+def select_results(results: Iterable[Dict[str, Any]], query: str) -> List[Dict[str, Any]]:
+    """Dedupe and rank raw Tavily results (best first)."""
+    qterms = _terms(query)
+    # Same page under different tracking params: keep the copy with the most text
+    by_url: Dict[str, Dict[str, Any]] = {}
+    for i, r in enumerate(results):
+        path = _url_key(r.get("url") or "")[1] or f"#{i}"
+        if path not in by_url or len(r.get("content") or "") > len(by_url[path].get("content") or ""):
+            by_url[path] = r
+
+    scored = []
+    for r in by_url.values():
+        text = f"{r.get('title') or ''} {r.get('content') or ''}"
+        tav = r.get("score")
+        tav = float(tav) if isinstance(tav, (int, float)) else 0.5
+        coverage = len(_terms(text) & qterms) / len(qterms) if qterms else 0.0
+        scored.append((_SCORE_WEIGHT * tav + (1 - _SCORE_WEIGHT) * coverage, r))
+    scored.sort(key=lambda x: -x[0])
+
+    kept: List[Dict[str, Any]] = []
+    per_domain: Dict[str, int] = {}
+    kept_shingles: List[FrozenSet] = []
+    for _, r in scored:
+        domain = _url_key(r.get("url") or "")[0]
+        if domain and per_domain.get(domain, 0) >= MAX_PER_DOMAIN:
+            continue
+        sh = _shingles(r.get("content") or "")
+        if any(_jaccard(sh, other) >= _NEAR_DUP for other in kept_shingles):
+            continue
+        per_domain[domain] = per_domain.get(domain, 0) + 1
+        kept_shingles.append(sh)
+        kept.append(r)
+    return kept
+
+
+def fit(text: str, budget_tokens: int) -> str:
+    """Trim free text to the budget at a sentence (else word) boundary."""
+    if estimate_tokens(text) <= budget_tokens:
+        return text
+    limit = budget_tokens * 4
+    cut = text[:limit]
+    end = max(cut.rfind(". "), cut.rfind("\n"))
+    if end > limit // 2:
+        return cut[:end + 1].rstrip()
+    return cut.rsplit(" ", 1)[0] + "…"
+
+
+def compress_results(
+    query: str,
+    results: List[Dict[str, Any]],
+    *,
+    budget_tokens: int,
+    answer: str = "",
+) -> str:
+    """
+    Pack deduped, ranked Tavily results into `budget_tokens`, keeping the
+    TITLE / SCORE / EXCERPT / SOURCE layout the planner prompt describes.
+    """
+    qterms = _terms(query)
+    ranked = select_results(results, query)
+
+    lines_budget = budget_tokens
+    head = ""
+    if answer:
+        head = "Summary from Tavily: " + fit(answer.strip(), max(budget_tokens // 4, 20))
+        lines_budget -= estimate_tokens(head) + 1
+
+    # Per result: header cost + candidate sentences (text, score, original position)
+    entries = []
+    seen_sents = set()
+    for r in ranked:
+        score = r.get("score")
+        header = (f"- TITLE: {(r.get('title') or '').strip()}"
+                  + (f" | SCORE: {score:.2f}" if isinstance(score, (int, float)) else ""))
+        source = f"  SOURCE: {_clean_url(r.get('url') or '')}"
+        cands = []
+        for pos, s in enumerate(sentences(r.get("content") or "")):
+            key = s.lower()[:80]
+            if key in seen_sents:
+                continue
+            seen_sents.add(key)
+            score = sentence_score(s, qterms)
+            if score >= _MIN_SENTENCE_SCORE:
+                cands.append((score, pos, s))
+        if cands:
+            cands.sort(key=lambda c: -c[0])
+            entries.append({"header": header, "source": source, "cands": cands, "picked": []})
+
+    def overhead(e) -> int:
+        return estimate_tokens(e["header"]) + estimate_tokens(e["source"]) + 4
+
+    used = 0
+    # Pass 1: best sentence of each result, in rank order, while it fits
+    for e in entries:
+        cost = overhead(e) + estimate_tokens(e["cands"][0][2]) + 1
+        if used + cost <= lines_budget:
+            e["picked"].append(e["cands"].pop(0))
+            used += cost
+    # Pass 2: remaining budget to the best remaining sentences of included results
+    rest = sorted(
+        ((c, e) for e in entries if e["picked"] for c in e["cands"]),
+        key=lambda ce: -ce[0][0],
+    )
+    for (sc, pos, s), e in rest:
+        cost = estimate_tokens(s) + 1
+        if used + cost <= lines_budget:
+            e["picked"].append((sc, pos, s))
+            used += cost
+
+    lines = [head] if head else []
+    for e in entries:
+        if e["picked"]:
+            excerpt = " ".join(s for _, _, s in sorted(e["picked"], key=lambda c: c[1]))
+            lines.append(f"{e['header']}\n  EXCERPT: {excerpt}\n{e['source']}")
+    return "\n".join(lines)
+
+
+def section_budget(section: str, default: Optional[int] = None) -> int:
+    return BUDGETS.get(section, default if default is not None else BUDGETS["web"])
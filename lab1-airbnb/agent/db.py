@@ -1,6 +1,8 @@
-import os
-from sqlalchemy import create_engine, text
-from sqlalchemy.exc import ProgrammingError
+import os, asyncio
+from typing import Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncEngine
 
 def _dsn():
     host = os.getenv("MYSQL_HOST", "localhost")
@@ -10,67 +12,43 @@ def _dsn():
     db   = os.getenv("MYSQL_DATABASE")
     if not all([user, pwd, db]):
         raise RuntimeError("MYSQL_USER, MYSQL_PASSWORD, and MYSQL_DATABASE must be set")
-    return f"mysql+pymysql://{user}:{pwd}@{host}:{port}/{db}"
-
-engine = create_engine(_dsn(), pool_pre_ping=True)
-
-def _date_columns():
-    """
-    Detect whether bookings has start_date/end_date or start/end.
-    Returns a tuple: (start_col, end_col)
-    """
-    with engine.connect() as conn:
-        cols = {row[0] for row in conn.execute(text("SHOW COLUMNS FROM bookings"))}
-    if {"start_date", "end_date"}.issubset(cols):
-        return "start_date", "end_date"
-    elif {"start", "end"}.issubset(cols):
-        return "start", "end"
-    # last resort: try start_date/end_date first, then start/end at runtime
-    return None, None
-
-def fetch_upcoming_bookings(user_id: int):
-    """
-    Fetch upcoming (future or ongoing) bookings for a traveler.
-    - Includes PENDING, ACCEPTED, CONFIRMED
-    - Upcoming = starts today or ends today/later
-    - Handles both (start_date/end_date) and (start/end) schemas
-    """
-    start_col, end_col = _date_columns()
-
-    def _sql(sc: str, ec: str):
-        # Use DATE() to ignore time-of-day and reduce TZ surprises.
-        # Include ongoing stays (ec >= today) and future starts (sc >= today).
-        # Use COALESCE to build a location when p.location is null.
-        return text(f"""
-            SELECT  b.id,
-                    COALESCE(p.location, CONCAT_WS(', ', p.city, p.state, p.country)) AS location,
-                    p.name AS property_name,
-                    b.{sc} AS start,
-                    b.{ec} AS end,
-                    b.guests
-            FROM bookings b
-            JOIN properties p ON p.id = b.property_id
-            WHERE b.traveler_id = :uid
-              AND b.status IN ('PENDING','ACCEPTED','CONFIRMED')
-              AND (DATE(b.{sc}) >= CURDATE() OR DATE(b.{ec}) >= CURDATE())
-            ORDER BY b.{sc} ASC
-            LIMIT 25
-        """)
-
-    with engine.connect() as conn:
-        # Preferred path: use detected columns if we found them
-        if start_col and end_col:
-            rows = conn.execute(_sql(start_col, end_col), {"uid": user_id}).mappings().all()
-            return [dict(r) for r in rows]
-
-        # Fallback path: try start_date/end_date, then start/end
-        for sc, ec in (("start_date","end_date"), ("start","end")):
-            try:
-                rows = conn.execute(_sql(sc, ec), {"uid": user_id}).mappings().all()
-                if rows:  # return first successful non-empty query
-                    return [dict(r) for r in rows]
-            except ProgrammingError:
-                continue
-
-        # If all attempts fail or return empty, return an empty list
-        return []
\ No newline at end of file
+    return f"mysql+aiomysql://{user}:{pwd}@{host}:{port}/{db}"
+
+# Pool sizing (env overridable):
+#   DB_POOL_SIZE        persistent connections kept open   (default 10)
+#   DB_MAX_OVERFLOW     extra connections under burst load (default 10)
+#   DB_POOL_TIMEOUT_S   wait for a free connection before failing (default 5)
+#   DB_POOL_RECYCLE_S   recycle connections before MySQL's wait_timeout drops them (default 1800)
+#
+# The engine is built on first use (app lifespan, or the first query from a
+# script) so importing this module needs neither MySQL settings nor the driver.
+_engine: Optional["AsyncEngine"] = None
+
+def get_engine() -> "AsyncEngine":
+    global _engine
+    if _engine is None:
+        from sqlalchemy.ext.asyncio import create_async_engine
+        _engine = create_async_engine(
+            _dsn(),
+            pool_pre_ping=True,
+            pool_size=int(os.getenv("DB_POOL_SIZE", "10")),
+            max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+            pool_timeout=float(os.getenv("DB_POOL_TIMEOUT_S", "5")),
+            pool_recycle=int(os.getenv("DB_POOL_RECYCLE_S", "1800")),
+        )
+    return _engine
+
+async def dispose() -> None:
+    """Close pooled connections (app shutdown); the next get_engine() starts fresh."""
+    global _engine
+    if _engine is not None:
+        await _engine.dispose()
+        _engine = None
+
+async def ping(timeout_s: float = 1.0) -> None:
+    """SELECT 1 on a pooled connection; raises if MySQL is unreachable (used by /ready)."""
+    from sqlalchemy import text
+    async def _ping():
+        async with get_engine().connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    await asyncio.wait_for(_ping(), timeout_s)
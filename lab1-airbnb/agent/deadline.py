@@ -0,0 +1,158 @@
+# agent/deadline.py
+"""
+Request-scoped deadlines.
+
+`DeadlineMiddleware` gives every /ai/* request a time budget (per endpoint,
+from env) that a client can shorten or extend with the `X-Request-Deadline`
+header (seconds from now, capped at DEADLINE_MAX_S; values that are not a
+positive finite number fall back to the endpoint budget). The absolute deadline
+lives in a contextvar, so everything the request runs — including tasks it
+spawns — sees the same clock:
+
+    deadline.remaining()          seconds left, or None when no deadline is set
+    deadline.budget(12, reserve=15)
+                                  what a stage may spend: min(cap, remaining - reserve)
+    deadline.timeout(20)          per-call timeout: min(default, remaining)
+    await deadline.within(coro)   run coro, DeadlineExceeded when time runs out
+    deadline.aiter_within(it)     same for each item of a stream
+    deadline.detached(coro)       task for work shared by several requests
+                                  (single-flight): runs under no caller's deadline
+
+Env (seconds):
+  DEADLINE_CHAT_S        /ai/chat, /ai/chat/stream   (default 25)
+  DEADLINE_PLAN_S        /ai/plan, /ai/plan/stream   (default 60)
+  DEADLINE_PLAN_BATCH_S  /ai/plan/batch              (default 120)
+  DEADLINE_MAX_S         upper bound for the header  (default 180)
+"""
+import os, math, time, asyncio, logging
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from typing import Any, AsyncIterator, Awaitable, Dict, Optional, TypeVar
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+HEADER = "x-request-deadline"
+DEADLINE_MAX_S = float(os.getenv("DEADLINE_MAX_S", "180"))
+ENDPOINT_BUDGETS: Dict[str, float] = {
+    "/ai/chat": float(os.getenv("DEADLINE_CHAT_S", "25")),
+    "/ai/chat/stream": float(os.getenv("DEADLINE_CHAT_S", "25")),
+    "/ai/plan": float(os.getenv("DEADLINE_PLAN_S", "60")),
+    "/ai/plan/stream": float(os.getenv("DEADLINE_PLAN_S", "60")),
+    "/ai/plan/batch": float(os.getenv("DEADLINE_PLAN_BATCH_S", "120")),
+}
+
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+# =========================
+# Reading the budget
+# =========================
+def remaining() -> Optional[float]:
+    d = _deadline.get()
+    return None if d is None else d - time.monotonic()
+
+
+def budget(cap: float, *, reserve: float = 0.0) -> float:
+    """Time a stage may spend: `cap`, shortened so `reserve` is left for later stages."""
+    left = remaining()
+    return cap if left is None else max(min(cap, left - reserve), 0.0)
+
+
+def timeout(default: float, *, floor: float = 0.05) -> float:
+    """Per-call timeout bounded by what is left of the request."""
+    left = remaining()
+    return default if left is None else max(min(default, left), floor)
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+async def within(aw: Awaitable[T]) -> T:
+    left = remaining()
+    if left is None:
+        return await aw
+    if left <= 0:
+        if asyncio.iscoroutine(aw):
+            aw.close()
+        raise DeadlineExceeded("request deadline already passed")
+    try:
+        return await asyncio.wait_for(aw, left)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(f"request deadline hit after waiting {left:.1f}s") from None
+
+
+async def aiter_within(it: AsyncIterator[T]) -> AsyncIterator[T]:
+    """Re-yield `it`, giving up (DeadlineExceeded) when the request deadline passes."""
+    ait = it.__aiter__()
+    while True:
+        try:
+            item = await within(ait.__anext__())
+        except StopAsyncIteration:
+            return
+        yield item
+
+
+def detached(coro: Awaitable[T]) -> "asyncio.Future[T]":
+    """
+    Schedule `coro` as a task with no request deadline, for a call whose result
+    other requests share: each of them bounds its own wait with within().
+    """
+    ctx = copy_context()
+    ctx.run(_deadline.set, None)
+    return ctx.run(asyncio.ensure_future, coro)
+
+
+# =========================
+# Setting the budget
+# =========================
+@contextmanager
+def scope(budget_s: Optional[float]):
+    """Run a block under `budget_s` (never extends an outer, earlier deadline)."""
+    if budget_s is None:
+        yield
+        return
+    d = time.monotonic() + budget_s
+    outer = _deadline.get()
+    token = _deadline.set(d if outer is None else min(outer, d))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def _header_budget(scope_: Dict[str, Any]) -> Optional[float]:
+    for k, v in scope_.get("headers") or []:
+        if k.decode("latin-1").lower() == HEADER:
+            try:
+                secs = float(v.decode("latin-1").strip())
+            except ValueError:
+                secs = None
+            if secs is not None and math.isfinite(secs) and secs > 0:
+                return min(secs, DEADLINE_MAX_S)
+            log.debug("ignoring bad %s header %r", HEADER, v)
+    return None
+
+
+class DeadlineMiddleware:
+    """Pure ASGI, so streamed bodies and spawned tasks run under the deadline too."""
+
+    def __init__(self, app, budgets: Optional[Dict[str, float]] = None):
+        self.app = app
+        self.budgets = ENDPOINT_BUDGETS if budgets is None else budgets
+
+    async def __call__(self, scope_, receive, send):
+        if scope_["type"] != "http":
+            return await self.app(scope_, receive, send)
+        budget_s = _header_budget(scope_)
+        if budget_s is None:
+            budget_s = self.budgets.get(scope_.get("path", ""))
+        with scope(budget_s):
+            await self.app(scope_, receive, send)
@@ -0,0 +1,84 @@
+# agent/fanout.py
+"""
+Concurrent context gathering for the chains.
+
+The planner and the anonymous chat both need several independent lookups
+(Tavily POIs, Tavily restaurants, weather) before the LLM call can start.
+`gather_context` runs them side by side under one shared deadline and returns
+whatever arrived in time; anything that failed or missed the deadline is
+replaced by its fallback text so the prompt still reads naturally.
+
+Jobs are awaitables (the async Tavily/weather lookups); each runs as a task.
+
+The wait is also bounded by the request deadline (see deadline.py): callers
+pass `reserve_s` for what must be left for the LLM afterwards, and jobs
+named in `optional` are not started at all when the remaining context
+budget is below OPTIONAL_CONTEXT_MIN_S.
+"""
+import os, time, asyncio, logging
+from typing import Any, Awaitable, Collection, Dict, Optional
+
+import deadline
+
+CONTEXT_DEADLINE_S = float(os.getenv("CONTEXT_DEADLINE_S", "12"))
+OPTIONAL_CONTEXT_MIN_S = float(os.getenv("OPTIONAL_CONTEXT_MIN_S", "3"))
+
+UNAVAILABLE = "Context unavailable."
+
+log = logging.getLogger(__name__)
+
+Job = Awaitable[Any]
+
+
+def _discard(job: Job) -> None:
+    if asyncio.iscoroutine(job):
+        job.close()   # never awaited: close it so Python does not warn
+
+
+async def gather_context(
+    jobs: Dict[str, Job],
+    *,
+    deadline_s: Optional[float] = None,
+    fallbacks: Optional[Dict[str, str]] = None,
+    reserve_s: float = 0.0,
+    optional: Collection[str] = (),
+) -> Dict[str, Any]:
+    """
+    Run every job concurrently and wait at most `deadline_s` (further capped
+    by the request deadline minus `reserve_s`) for all of them.
+    Returns {name: result} with a fallback for every job that raised,
+    returned nothing, was skipped for lack of budget, or was still running
+    at the deadline.
+    """
+    deadline_s = deadline.budget(CONTEXT_DEADLINE_S if deadline_s is None else deadline_s, reserve=reserve_s)
+    fallbacks = fallbacks or {}
+    t0 = time.perf_counter()
+
+    skipped = set()
+    for name, job in jobs.items():
+        if deadline_s <= 0 or (name in optional and deadline_s < OPTIONAL_CONTEXT_MIN_S):
+            skipped.add(name)
+            _discard(job)
+    if skipped:
+        log.info("context budget %.1fs: skipping %s", deadline_s, ", ".join(sorted(skipped)))
+
+    tasks = {name: asyncio.ensure_future(job) for name, job in jobs.items() if name not in skipped}
+    done, pending = await asyncio.wait(tasks.values(), timeout=deadline_s) if tasks else (set(), set())
+    for t in pending:
+        t.cancel()
+
+    out: Dict[str, Any] = {name: fallbacks.get(name, UNAVAILABLE) for name in skipped}
+    for name, task in tasks.items():
+        fallback = fallbacks.get(name, UNAVAILABLE)
+        if task in pending:
+            log.warning("context %s missed %.1fs deadline", name, deadline_s)
+            out[name] = fallback
+        elif task.exception() is not None:
+            log.warning("context %s failed: %s", name, task.exception())
+            out[name] = fallback
+        else:
+            out[name] = task.result() or fallback
+
+    log.debug("context %d/%d blocks in %.2fs", len(done), len(tasks), time.perf_counter() - t0)
+    return out
+
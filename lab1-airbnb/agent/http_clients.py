@@ -0,0 +1,101 @@
+# agent/http_clients.py
+"""
+Process-wide pooled HTTP clients for every outbound call the agent makes.
+
+One `httpx.AsyncClient` per upstream service, created on FastAPI startup and
+closed on shutdown (see app.py lifespan). Keeping the clients alive means
+connections are reused across requests instead of paying DNS + TCP + TLS on
+every Tavily / Nominatim / Open-Meteo call.
+
+Per service (env overridable):
+  <SERVICE>_BASE_URL       upstream base URL
+  <SERVICE>_TIMEOUT_S      overall request timeout (cut to the request deadline
+                           by request_timeout(), see deadline.py)
+Shared:
+  HTTP_MAX_CONNECTIONS     connections per service/host (default 20)
+  HTTP_MAX_KEEPALIVE       idle keep-alive connections kept per host (default 10)
+  HTTP_KEEPALIVE_EXPIRY_S  idle connection lifetime (default 30)
+HTTP/2 is enabled automatically when the optional `h2` package is installed.
+"""
+import os, logging
+from typing import Dict, Optional
+
+import httpx
+
+import deadline
+
+try:  # HTTP/2 needs the optional h2 dependency (pip install "httpx[http2]")
+    import h2  # noqa: F401
+    _HTTP2 = True
+except ImportError:
+    _HTTP2 = False
+
+log = logging.getLogger(__name__)
+
+USER_AGENT = "StayBnB-Agent/1.0"
+
+SERVICES: Dict[str, Dict] = {
+    "tavily": {
+        "base_url": os.getenv("TAVILY_BASE_URL", "https://api.tavily.com"),
+        "timeout_s": float(os.getenv("TAVILY_TIMEOUT_S", "20")),
+    },
+    "nominatim": {
+        "base_url": os.getenv("NOMINATIM_BASE_URL", "https://nominatim.openstreetmap.org"),
+        "timeout_s": float(os.getenv("NOMINATIM_TIMEOUT_S", "10")),
+    },
+    "open_meteo": {
+        "base_url": os.getenv("OPEN_METEO_BASE_URL", "https://api.open-meteo.com"),
+        "timeout_s": float(os.getenv("OPEN_METEO_TIMEOUT_S", "10")),
+    },
+}
+
+_LIMITS = httpx.Limits(
+    max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "20")),
+    max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE", "10")),
+    keepalive_expiry=float(os.getenv("HTTP_KEEPALIVE_EXPIRY_S", "30")),
+)
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+def _build(name: str) -> httpx.AsyncClient:
+    cfg = SERVICES[name]
+    return httpx.AsyncClient(
+        base_url=cfg["base_url"],
+        timeout=httpx.Timeout(cfg["timeout_s"], connect=min(5.0, cfg["timeout_s"])),
+        limits=_LIMITS,
+        http2=_HTTP2,
+        headers={"User-Agent": USER_AGENT},
+    )
+
+
+def request_timeout(name: str) -> float:
+    """`name`'s configured timeout, cut to what is left of the request deadline."""
+    return deadline.timeout(SERVICES[name]["timeout_s"])
+
+
+def get_client(name: str) -> httpx.AsyncClient:
+    """
+    Return the shared client for `name`. Built lazily if startup() has not
+    run (scripts, REPL), so callers never need to care about the lifecycle.
+    """
+    client: Optional[httpx.AsyncClient] = _clients.get(name)
+    if client is None or client.is_closed:
+        client = _clients[name] = _build(name)
+    return client
+
+
+async def startup() -> None:
+    for name in SERVICES:
+        get_client(name)
+    log.info("HTTP clients ready: %s (http2=%s)", ", ".join(SERVICES), _HTTP2)
+
+
+def started() -> bool:
+    return all(name in _clients and not _clients[name].is_closed for name in SERVICES)
+
+
+async def shutdown() -> None:
+    while _clients:
+        _, client = _clients.popitem()
+        await client.aclose()
@@ -0,0 +1,324 @@
+# agent/listings_index.py
+"""
+In-process index over StayBnB `properties`, so chat (and the planner) can
+ground answers in our own inventory without a MySQL query per request.
+
+Rows live in columnar arrays (ids, price, max_guests, bedrooms, type and
+country ids, a 64-bit amenity mask) plus name/location strings. Rows are
+grouped by place (distinct location + country), each group kept sorted by
+price, and an inverted index maps location/country tokens ("new", "york",
+"ny", "us") to places. A lookup intersects a few small place sets and walks
+the matching groups cheapest-first until it has `limit` rows that fit the
+budget, party size and amenities — microseconds, never the database.
+
+Refresh (app.py lifespan, background task):
+  - incremental every LISTINGS_REFRESH_S: only rows with id > the highest id
+    seen (the AUTO_INCREMENT id is the watermark; created_at can tie and is
+    not indexed), paged by primary key
+  - full every LISTINGS_FULL_REFRESH_S: rebuilds a fresh index and swaps it
+    in, picking up owner edits (PUT /properties/:id) and deletions
+
+Until the first load finishes (or with MySQL down) searches return nothing
+and prompts simply go without a listings block.
+
+Env:
+  LISTINGS_REFRESH_S        incremental refresh interval, 0 disables the index (default 60)
+  LISTINGS_FULL_REFRESH_S   full rebuild interval (default 900)
+  LISTINGS_PAGE_SIZE        rows per keyset page (default 5000)
+"""
+import os, json, time, heapq, bisect, asyncio, logging
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set
+
+from metrics import span, register_collector
+from places import place_tokens, tokens as _tokens
+
+log = logging.getLogger(__name__)
+
+LISTINGS_REFRESH_S = float(os.getenv("LISTINGS_REFRESH_S", "60"))
+LISTINGS_FULL_REFRESH_S = float(os.getenv("LISTINGS_FULL_REFRESH_S", "900"))
+LISTINGS_PAGE_SIZE = int(os.getenv("LISTINGS_PAGE_SIZE", "5000"))
+
+_MAX_AMENITIES = 64   # one bit each in the mask; rarer ones past this are not filterable
+
+
+def _amenity_names(raw: Any) -> List[str]:
+    """amenities JSON as stored by the backend: a list of names, or {name: bool}."""
+    if isinstance(raw, (bytes, str)):
+        try:
+            raw = json.loads(raw)
+        except ValueError:
+            return []
+    if isinstance(raw, dict):
+        raw = [k for k, v in raw.items() if v]
+    if not isinstance(raw, list):
+        return []
+    return [str(a).strip().lower() for a in raw if str(a).strip()]
+
+
+# =========================
+# Index
+# =========================
+class ListingsIndex:
+    """Append-only columnar store; a full refresh builds a new one and swaps it in."""
+
+    def __init__(self) -> None:
+        self.ids = array("i")
+        self.price = array("f")
+        self.max_guests = array("H")
+        self.bedrooms = array("B")
+        self.kind = array("B")          # -> self._kinds
+        self.country = array("H")       # -> self._countries
+        self.amenity_mask = array("Q")
+        self.names: List[str] = []
+        self.locations: List[str] = []
+        self._kinds: List[str] = []
+        self._kind_ids: Dict[str, int] = {}
+        self._countries: List[str] = []
+        self._country_ids: Dict[str, int] = {}
+        self._amenities: List[str] = []
+        self._amenity_bits: Dict[str, int] = {}
+        self._place_ids: Dict[str, int] = {}
+        self._place_rows: List[array] = []     # per place: row positions, cheapest first
+        self._place_prices: List[array] = []   # per place: their prices (bisect key)
+        self._postings: Dict[str, Set[int]] = {}   # token -> place ids
+        self._place_names: Set[str] = set()        # "san diego", "portugal": what has_place accepts
+        self.watermark = 0              # highest properties.id loaded
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @staticmethod
+    def _intern(value: str, table: List[str], ids: Dict[str, int], limit: int) -> int:
+        i = ids.get(value)
+        if i is None:
+            if len(table) >= limit:
+                return 0
+            i = ids[value] = len(table)
+            table.append(value)
+        return i
+
+    def add(self, rows: Iterable[Dict[str, Any]]) -> int:
+        """Append rows (ascending id, all above the watermark). Returns rows added."""
+        n0 = len(self.ids)
+        for r in rows:
+            rid = int(r["id"])
+            if rid <= self.watermark:
+                continue
+            pos = len(self.ids)
+            location = str(r.get("location") or "")
+            country = str(r.get("country") or "").strip()
+            mask = 0
+            for a in _amenity_names(r.get("amenities")):
+                bit = self._amenity_bits.get(a)
+                if bit is None and len(self._amenities) < _MAX_AMENITIES:
+                    bit = self._amenity_bits[a] = len(self._amenities)
+                    self._amenities.append(a)
+                if bit is not None:
+                    mask |= 1 << bit
+            self.ids.append(rid)
+            self.price.append(float(r.get("price_per_night") or 0))
+            self.max_guests.append(min(int(r.get("max_guests") or 0), 0xFFFF))
+            self.bedrooms.append(min(int(r.get("bedrooms") or 0), 0xFF))
+            self.kind.append(self._intern(str(r.get("type") or ""), self._kinds, self._kind_ids, 0xFF))
+            self.country.append(self._intern(country, self._countries, self._country_ids, 0xFFFF))
+            self.amenity_mask.append(mask)
+            self.names.append(str(r.get("name") or ""))
+            self.locations.append(location)
+            self._add_to_place(pos, location, country)
+            self.watermark = rid
+        return len(self.ids) - n0
+
+    def _add_to_place(self, pos: int, location: str, country: str) -> None:
+        key = f"{location.strip().lower()}|{country.lower()}"
+        pid = self._place_ids.get(key)
+        if pid is None:
+            pid = self._place_ids[key] = len(self._place_rows)
+            self._place_rows.append(array("I"))
+            self._place_prices.append(array("f"))
+            for tok in set(_tokens(location) + _tokens(country)):
+                self._postings.setdefault(tok, set()).add(pid)
+            for name in (location.split(",")[0], country):
+                if name.strip():
+                    self._place_names.add(" ".join(_tokens(name)))
+        prices, price = self._place_prices[pid], self.price[pos]
+        at = bisect.bisect_right(prices, price)
+        prices.insert(at, price)
+        self._place_rows[pid].insert(at, pos)
+
+    def match_places(self, where: str) -> Set[int]:
+        """
+        Places whose location/country contain every token of the place phrase
+        at the start of `where` ("San Diego in July" -> san, diego).
+        """
+        places: Optional[Set[int]] = None
+        for tok in place_tokens(where):
+            post = self._postings.get(tok)
+            if not post:
+                return set()
+            places = set(post) if places is None else places & post
+        return places or set()
+
+    def has_place(self, name: str) -> bool:
+        """True if `name` is a whole city or country name in the index ("san diego", not "san")."""
+        return " ".join(_tokens(name)) in self._place_names
+
+    def _cheapest_first(self, places: Set[int]) -> Iterator[int]:
+        if len(places) == 1:
+            return iter(self._place_rows[next(iter(places))])
+        price = self.price
+        return heapq.merge(*(self._place_rows[p] for p in places), key=price.__getitem__)
+
+    def amenities_in(self, text: str) -> List[str]:
+        """Known amenity names mentioned in free text ("with a pool" -> ["pool"])."""
+        norm = " " + " ".join(_tokens(text)) + " "
+        return [a for a in self._amenities if f" {a} " in norm]
+
+    def search(
+        self,
+        where: str,
+        *,
+        max_price: Optional[float] = None,
+        guests: Optional[int] = None,
+        amenities: Sequence[str] = (),
+        limit: int = 5,
+    ) -> List[Dict[str, Any]]:
+        """Cheapest listings in `where` that fit the budget, party size and amenities."""
+        places = self.match_places(where)
+        if not places:
+            return []
+        need = 0
+        for a in amenities:
+            bit = self._amenity_bits.get(a.lower())
+            if bit is None:
+                return []
+            need |= 1 << bit
+        price, max_guests, mask = self.price, self.max_guests, self.amenity_mask
+        hits: List[int] = []
+        for i in self._cheapest_first(places):
+            if max_price is not None and price[i] > max_price:
+                break
+            if (not guests or max_guests[i] >= guests) and (mask[i] & need) == need:
+                hits.append(i)
+                if len(hits) >= limit:
+                    break
+        return [self._row(i) for i in hits]
+
+    def _row(self, i: int) -> Dict[str, Any]:
+        m = self.amenity_mask[i]
+        return {
+            "id": self.ids[i],
+            "name": self.names[i],
+            "type": self._kinds[self.kind[i]],
+            "location": self.locations[i],
+            "country": self._countries[self.country[i]],
+            "price_per_night": round(self.price[i], 2),
+            "max_guests": self.max_guests[i],
+            "bedrooms": self.bedrooms[i],
+            "amenities": [a for b, a in enumerate(self._amenities) if m >> b & 1],
+        }
+
+    def nbytes(self) -> int:
+        """Bytes held by the numeric columns and place groups (strings not counted)."""
+        cols = (self.ids, self.price, self.max_guests, self.bedrooms, self.kind, self.country, self.amenity_mask)
+        groups = self._place_rows + self._place_prices
+        return sum(c.itemsize * len(c) for c in (*cols, *groups))
+
+
+_index = ListingsIndex()
+_stats = {"loaded_at": None, "full_refreshes": 0, "incremental_refreshes": 0, "errors": 0, "last_refresh_s": None}
+
+
+def get_index() -> ListingsIndex:
+    return _index
+
+
+def search(where: str, **kwargs) -> List[Dict[str, Any]]:
+    return _index.search(where, **kwargs)
+
+
+def format_listings(rows: List[Dict[str, Any]]) -> str:
+    """One prompt line per listing."""
+    lines = []
+    for r in rows:
+        extras = f"; {', '.join(r['amenities'])}" if r["amenities"] else ""
+        lines.append(
+            f"- {r['name']} ({r['type'] or 'stay'}, {r['location']}) — ${r['price_per_night']:.0f}/night, "
+            f"sleeps {r['max_guests']}, {r['bedrooms']} bd{extras}"
+        )
+    return "\n".join(lines)
+
+
+# =========================
+# Refresh (MySQL)
+# =========================
+_COLUMNS = "id, name, type, location, country, amenities, price_per_night, bedrooms, max_guests"
+
+
+async def _load_into(index: ListingsIndex) -> int:
+    """Keyset-page every row above the index watermark into it."""
+    from sqlalchemy import text
+    from db import get_engine
+    sql = text(f"SELECT {_COLUMNS} FROM properties WHERE id > :after ORDER BY id LIMIT :n")
+    added = 0
+    async with get_engine().connect() as conn:
+        while True:
+            res = await conn.execute(sql, {"after": index.watermark, "n": LISTINGS_PAGE_SIZE})
+            rows = [dict(r._mapping) for r in res]
+            added += index.add(rows)
+            if len(rows) < LISTINGS_PAGE_SIZE:
+                return added
+
+
+async def refresh(full: bool = False) -> int:
+    """Load new rows (or everything, with full=True). Returns rows added."""
+    global _index
+    t0 = time.perf_counter()
+    with span("listings_refresh"):
+        if full:
+            fresh = ListingsIndex()
+            added = await _load_into(fresh)
+            _index = fresh
+            _stats["full_refreshes"] += 1
+        else:
+            added = await _load_into(_index)
+            _stats["incremental_refreshes"] += 1
+    _stats.update(loaded_at=time.time(), last_refresh_s=round(time.perf_counter() - t0, 4))
+    if added:
+        log.info("listings index %s refresh: +%d rows (%d total)", "full" if full else "incremental",
+                 added, len(_index))
+    return added
+
+
+async def run_forever(interval_s: float = LISTINGS_REFRESH_S, full_every_s: float = LISTINGS_FULL_REFRESH_S) -> None:
+    """Background loop started from the FastAPI lifespan; cancelled on shutdown."""
+    last_full = 0.0
+    while True:
+        full = time.monotonic() - last_full >= full_every_s
+        try:
+            await refresh(full=full)
+            if full:
+                last_full = time.monotonic()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            _stats["errors"] += 1
+            log.warning("listings refresh failed: %s", e)
+        await asyncio.sleep(interval_s)
+
+
+def stats() -> Dict[str, Any]:
+    idx = _index
+    return {"rows": len(idx), "watermark": idx.watermark, "places": len(idx._place_rows),
+            "amenities": len(idx._amenities), "column_bytes": idx.nbytes(), **_stats}
+
+
+def _collect():
+    st = stats()
+    yield ("agent_listings_indexed", "gauge", "Listings in the in-process index", {}, st["rows"])
+    yield ("agent_listings_refresh_errors_total", "counter", "Failed listings index refreshes", {}, st["errors"])
+    if st["loaded_at"] is not None:
+        yield ("agent_listings_age_seconds", "gauge", "Seconds since the last index refresh", {},
+               time.time() - st["loaded_at"])
+
+register_collector(_collect)
@@ -0,0 +1,209 @@
+# agent/metrics.py
+"""
+Small in-process metrics registry with Prometheus text exposition.
+
+    from metrics import span, Counter
+    with span("tavily"):
+        ...                                   # -> agent_stage_seconds{stage="tavily",outcome="ok"}
+
+Counters and histograms are plain Python objects (a dict update per event),
+so instrumentation costs next to nothing and needs no extra dependency.
+Anything that already keeps its own counters (caches, single-flight,
+chat cache) is exported through `register_collector` at scrape time.
+GET /metrics in app.py serves `render()`.
+"""
+import time, bisect, threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+_METRICS: List["_Metric"] = []
+_COLLECTORS: List[Callable[[], Iterable[Tuple[str, str, str, Dict[str, str], float]]]] = []
+
+
+def _key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(v: str) -> str:
+    # Prometheus text format: backslash, double quote and newline in label values
+    return v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(key: Iterable[Tuple[str, str]]) -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in key]
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+        _METRICS.append(self)
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        super().__init__(name, help)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        k = _key(labels)
+        with self._lock:
+            self._values[k] = self._values.get(k, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_fmt_labels(k)} {v:g}" for k, v in sorted(self._values.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelKey, List[float]] = {}   # [bucket counts..., +Inf, sum]
+
+    def observe(self, value: float, **labels) -> None:
+        k = _key(labels)
+        with self._lock:
+            s = self._series.get(k)
+            if s is None:
+                s = self._series[k] = [0.0] * (len(self.buckets) + 2)
+            s[bisect.bisect_left(self.buckets, value)] += 1
+            s[-1] += value
+
+    def count(self, **labels) -> int:
+        s = self._series.get(_key(labels))
+        return int(sum(s[:-1])) if s else 0
+
+    def quantile(self, q: float, **labels) -> Optional[float]:
+        """Bucket-interpolated quantile for one label set (None if no data)."""
+        s = self._series.get(_key(labels))
+        if not s:
+            return None
+        counts = s[:-1]
+        total = sum(counts)
+        if not total:
+            return None
+        rank, seen, lower = q * total, 0.0, 0.0
+        for i, c in enumerate(counts):
+            upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+            if seen + c >= rank and c:
+                return lower + (upper - lower) * (rank - seen) / c
+            seen += c
+            lower = upper
+        return self.buckets[-1]
+
+    def render(self) -> List[str]:
+        out = []
+        for k, s in sorted(self._series.items()):
+            cum = 0.0
+            for i, le in enumerate(self.buckets):
+                cum += s[i]
+                out.append(f"{self.name}_bucket{_fmt_labels(k + (('le', f'{le:g}'),))} {cum:g}")
+            cum += s[len(self.buckets)]
+            out.append(f"{self.name}_bucket{_fmt_labels(k + (('le', '+Inf'),))} {cum:g}")
+            out.append(f"{self.name}_sum{_fmt_labels(k)} {s[-1]:.6f}")
+            out.append(f"{self.name}_count{_fmt_labels(k)} {cum:g}")
+        return out
+
+
+def register_collector(fn: Callable[[], Iterable[Tuple[str, str, str, Dict[str, str], float]]]) -> None:
+    """`fn()` yields (name, type, help, labels, value) samples at scrape time."""
+    _COLLECTORS.append(fn)
+
+
+def render() -> str:
+    lines: List[str] = []
+    for m in _METRICS:
+        lines.append(f"# HELP {m.name} {m.help}")
+        lines.append(f"# TYPE {m.name} {m.kind}")
+        lines.extend(m.render())
+    declared = set()
+    for fn in _COLLECTORS:
+        for name, kind, help, labels, value in fn():
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name}{_fmt_labels(_key(labels))} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+# =========================
+# Agent metrics
+# =========================
+STAGE_SECONDS = Histogram("agent_stage_seconds", "Latency of each pipeline stage")
+HTTP_SECONDS = Histogram("agent_http_request_seconds", "End-to-end latency per endpoint")
+PROMPT_CHARS = Counter("agent_prompt_chars_total", "Characters sent to the LLM")
+RESPONSE_CHARS = Counter("agent_response_chars_total", "Characters received from the LLM")
+LLM_TOKENS = Counter("agent_llm_tokens_total", "LLM token usage reported by the provider")
+LLM_CALLS = Counter("agent_llm_calls_total", "LLM calls")
+LLM_SECONDS = Histogram("agent_llm_seconds", "LLM call latency per route and model")
+LLM_TTFT_SECONDS = Histogram("agent_llm_ttft_seconds", "Time to first streamed token per route and model")
+
+
+@contextmanager
+def span(stage: str):
+    """Time a block into agent_stage_seconds{stage, outcome}."""
+    t0 = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - t0, stage=stage, outcome=outcome)
+
+
+def _prompt_chars(prompt) -> int:
+    """Length of a prompt string, or of the text blocks in a list of chat messages."""
+    if isinstance(prompt, str):
+        return len(prompt)
+    n = 0
+    for m in prompt:
+        content = m.get("content", "") if isinstance(m, dict) else getattr(m, "content", "")
+        blocks = [content] if isinstance(content, str) else content
+        n += sum(len(b if isinstance(b, str) else b.get("text", "")) for b in blocks)
+    return n
+
+
+def record_llm(route: str, prompt, resp, *, model: str = "", seconds: Optional[float] = None) -> None:
+    """
+    Prompt/response size, latency and token usage for one LLM call on `route`
+    (`resp` is the model message, or a stream's chunks added together).
+    Tokens are split by kind: input, output, and the prompt-cache
+    cache_read / cache_creation input tokens Anthropic reports.
+    """
+    LLM_CALLS.inc(route=route, model=model)
+    PROMPT_CHARS.inc(_prompt_chars(prompt), route=route)
+    content = resp if isinstance(resp, str) else getattr(resp, "content", "")
+    RESPONSE_CHARS.inc(len(content) if isinstance(content, str) else 0, route=route)
+    if seconds is not None:
+        LLM_SECONDS.observe(seconds, route=route, model=model)
+    usage = getattr(resp, "usage_metadata", None) or {}
+    for kind in ("input_tokens", "output_tokens"):
+        if usage.get(kind):
+            LLM_TOKENS.inc(usage[kind], route=route, model=model, kind=kind.split("_")[0])
+    raw = (getattr(resp, "response_metadata", None) or {}).get("usage") or {}
+    for kind in ("cache_read", "cache_creation"):
+        if raw.get(f"{kind}_input_tokens"):
+            LLM_TOKENS.inc(raw[f"{kind}_input_tokens"], route=route, model=model, kind=kind)
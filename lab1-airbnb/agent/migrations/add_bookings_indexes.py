@@ -0,0 +1,50 @@
+# agent/migrations/add_bookings_indexes.py
+"""
+Add the composite indexes bookings_repo's queries rely on (idempotent).
+
+    cd agent && python migrations/add_bookings_indexes.py [--dry-run]
+
+Existing indexes (checked in information_schema.statistics) are left alone,
+so this is safe to run on every deploy. On a large table run it off-peak:
+InnoDB builds secondary indexes online, but it still costs I/O.
+"""
+import os, sys, asyncio, argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from dotenv import load_dotenv  # noqa: E402
+load_dotenv()
+
+from sqlalchemy import text  # noqa: E402
+
+import db  # noqa: E402
+from bookings_repo import load_schema, index_ddl  # noqa: E402
+
+
+async def migrate(dry_run: bool) -> int:
+    schema = await load_schema()
+    if schema is None:
+        print("bookings has no start_date/end_date or start/end columns; nothing to do")
+        return 1
+    try:
+        async with db.get_engine().begin() as conn:
+            existing = {row[0] for row in await conn.execute(text(
+                "SELECT DISTINCT index_name FROM information_schema.statistics "
+                "WHERE table_schema = DATABASE() AND table_name = 'bookings'"
+            ))}
+            for name, ddl in index_ddl(*schema).items():
+                if name in existing:
+                    print(f"= {name} (exists)")
+                    continue
+                print(f"+ {ddl}")
+                if not dry_run:
+                    await conn.execute(text(ddl))
+    finally:
+        await db.dispose()
+    return 0
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--dry-run", action="store_true", help="print the DDL without running it")
+    sys.exit(asyncio.run(migrate(ap.parse_args().dry_run)))
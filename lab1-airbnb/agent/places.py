@@ -0,0 +1,96 @@
+# agent/places.py
+"""
+Place names in free text, shared by the chat weather lookup (tools/weather.py
+via chains._chat_prompt) and the listings index (listings_index.py).
+
+    extract_place("What is the weather like in Lisbon in May?")   -> "Lisbon"
+    extract_place("Is Porto good for a family trip in July?")     -> "Porto"
+    extract_place("Weather Berlin in May")                        -> "Berlin"
+    extract_place("Where should we stay in San Diego, CA?")       -> "San Diego, CA"
+
+A place is a run of capitalised words ("Rio de Janeiro", "Miami, FL"),
+preferably right after "in" / "for" / "to" / "visit"; otherwise the first
+such run anywhere, with question words and months trimmed off. Lowercase
+questions ("what's the weather in rome next week") fall back to the words
+after "in" / "to" / "near" / "at", accepted only if the caller's `is_known`
+recognises them (chains checks the listings index and the climate
+gazetteer). Nothing is fetched, so a miss costs no network call.
+"""
+import re
+from typing import Callable, List, Optional
+
+MONTH_WORDS = frozenset(
+    "january february march april may june july august september october november december "
+    "jan feb mar apr jun jul aug sep sept oct nov dec".split()
+)
+
+# A place phrase ends at the first of these ("Miami in May with kids" -> miami)
+PLACE_STOP = frozenset(
+    "in on at for from to with during this next over around near and or under below "
+    "a an the my our me we i is are be what when how where which".split()
+) | MONTH_WORDS
+
+# Capitalised words that start questions rather than name places
+_LEADING = PLACE_STOP | frozenset(
+    "weather best should can could would do does tell give any top things plan "
+    "planning trip travel visiting visit going".split()
+)
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+_CONNECTORS = ("de", "da", "do", "del", "di", "la", "le", "of", "upon", "am", "an")
+_CAP = r"[A-ZÀ-Þ][\w'\-]*"
+_PHRASE = rf"{_CAP}(?:\s+(?:(?:{'|'.join(_CONNECTORS)})\s+)?{_CAP})*(?:,\s*{_CAP})?"
+_AFTER_PREP_RE = re.compile(rf"\b(?:in|for|to|visit(?:ing)?|around|near)\s+({_PHRASE})")
+_PHRASE_RE = re.compile(_PHRASE)
+# Lookahead, so "to stay in san diego" still tries the words after "in"
+_LOWER_AFTER_PREP_RE = re.compile(r"\b(?:in|to|near|at)\s+(?=((?:[\w'\-]+\s*){1,4}))", re.I)
+
+
+def tokens(text: str) -> List[str]:
+    return _TOKEN_RE.findall((text or "").lower())
+
+
+def place_tokens(where: str) -> List[str]:
+    """Lowercase tokens of the place phrase at the start of `where` ("San Diego in July" -> san, diego)."""
+    out = []
+    for tok in tokens(where):
+        if tok in PLACE_STOP or tok.isdigit():
+            break
+        out.append(tok)
+    return out
+
+
+def _trim(phrase: str) -> str:
+    words = phrase.split()
+    while words and words[0].strip(",").lower() in _LEADING:
+        words.pop(0)
+    for i, w in enumerate(words):
+        if w.strip(",").lower() in PLACE_STOP:
+            words = words[:i]
+            break
+    return " ".join(words).strip(" ,")
+
+
+def _title(words: List[str]) -> str:
+    return " ".join(w if i and w in _CONNECTORS else w.capitalize() for i, w in enumerate(words))
+
+
+def extract_place(text: str, is_known: Optional[Callable[[str], bool]] = None) -> Optional[str]:
+    """
+    The place a question is about, or None. `is_known(phrase)` enables the
+    lowercase fallback: the longest run of words after a preposition it
+    accepts ("in san diego in july" tries "san diego", then "san").
+    """
+    for rx in (_AFTER_PREP_RE, _PHRASE_RE):
+        for m in rx.finditer(text or ""):
+            place = _trim(m.group(1) if m.groups() else m.group(0))
+            if place:
+                return place
+    if is_known is not None:
+        for m in _LOWER_AFTER_PREP_RE.finditer(text or ""):
+            words = place_tokens(m.group(1))
+            for n in range(len(words), 0, -1):
+                if is_known(" ".join(words[:n])):
+                    return _title(words[:n])
+    return None
@@ -0,0 +1,341 @@
+# agent/plan_parser.py
+"""
+Tolerant, incremental parsing of the planner's JSON output.
+
+The planner returns one object:
+    {"itinerary": [DayBlock...], "activities": [Activity...],
+     "restaurants": [Activity...], "packing": [string...]}
+
+LLM output is rarely that clean: it arrives wrapped in code fences or a
+preamble, cut off at max_tokens, with trailing commas, or with an Activity
+given as a bare string. Discarding the whole (expensive) generation for one
+bad field is the worst option, so:
+
+  parse_plan(raw)         full text -> PlanResponse keeping every valid part,
+                          or None if nothing is salvageable
+  IncrementalPlanParser   chunk-by-chunk; feed() returns each (section, item)
+                          the moment it closes, result() parses what was seen
+
+Items are validated one by one into schemas.DayBlock / Activity, so a single
+invalid activity drops only that activity.
+"""
+import re, json, logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from schemas import Activity, DayBlock, PlanResponse
+from metrics import span
+
+log = logging.getLogger(__name__)
+
+SECTIONS = ("itinerary", "activities", "restaurants", "packing")
+BLOCKS = ("morning", "afternoon", "evening")
+
+_FENCE = re.compile(r"```(?:json|JSON)?")
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_SMART_QUOTES = str.maketrans({"\u201c": '"', "\u201d": '"'})
+
+
+# =========================
+# Text repair
+# =========================
+def strip_wrapping(raw: str) -> str:
+    """Drop code fences and any preamble/epilogue around the outermost object."""
+    text = _FENCE.sub("", raw or "")
+    start = text.find("{")
+    if start < 0:
+        return ""
+    end = text.rfind("}")
+    # If the object never closed (truncation) keep everything after '{'
+    return text[start:end + 1] if end > start and _balanced(text[start:end + 1]) else text[start:]
+
+
+def _scan(text: str):
+    """
+    Yield (index, char, stack, in_string) for every char, tracking JSON
+    strings and container depth. The stack is shared — copy it if kept.
+    """
+    stack: List[str] = []
+    in_str = esc = False
+    for i, ch in enumerate(text):
+        if in_str:
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                in_str = False
+        elif ch == '"':
+            in_str = True
+        elif ch in "{[":
+            stack.append(ch)
+        elif ch in "}]" and stack:
+            stack.pop()
+        yield i, ch, stack, in_str
+
+
+def _balanced(text: str) -> bool:
+    last = None
+    for last in _scan(text):
+        pass
+    return last is not None and not last[2] and not last[3]
+
+
+def _closers(stack: List[str]) -> str:
+    return "".join("}" if c == "{" else "]" for c in reversed(stack))
+
+
+def _loads(text: str) -> Optional[Any]:
+    for candidate in (text, _TRAILING_COMMA.sub(r"\1", text)):
+        try:
+            return json.loads(candidate, strict=False)
+        except ValueError:
+            continue
+    return None
+
+
+def repair_json(text: str, max_attempts: int = 200) -> Optional[Any]:
+    """
+    Parse `text`, fixing trailing commas, smart quotes and truncation.
+    For truncated output, cut back to the last structural boundary (a ',' or
+    an opening bracket) and close every open container; the longest prefix
+    that parses wins, so at most one partial element is lost.
+    """
+    if not text:
+        return None
+    data = _loads(text)
+    if data is not None:
+        return data
+    if "\u201c" in text or "\u201d" in text:
+        text = text.translate(_SMART_QUOTES)
+        data = _loads(text)
+        if data is not None:
+            return data
+
+    cuts: List[Tuple[int, str]] = []
+    last_stack: List[str] = []
+    ended_in_str = False
+    for i, ch, stack, in_str in _scan(text):
+        last_stack, ended_in_str = stack, in_str
+        if in_str:
+            continue
+        if ch == ",":
+            cuts.append((i, _closers(stack)))          # drop the comma itself
+        elif ch in "{[":
+            cuts.append((i + 1, _closers(stack)))      # keep the empty container
+
+    # Cheapest fix first: just close what is open (string included)
+    data = _loads(text + ('"' if ended_in_str else "") + _closers(last_stack))
+    if data is not None:
+        return data
+    for pos, closers in reversed(cuts[-max_attempts:]):
+        data = _loads(text[:pos] + closers)
+        if data is not None:
+            return data
+    return None
+
+
+# =========================
+# Section-by-section validation
+# =========================
+_TIER_WORDS = {"free": "$", "cheap": "$", "budget": "$", "low": "$", "inexpensive": "$",
+               "moderate": "$$", "mid": "$$", "medium": "$$",
+               "expensive": "$$$", "high": "$$$", "upscale": "$$$",
+               "luxury": "$$$$", "fine dining": "$$$$"}
+
+
+def _price_tier(v: Any) -> str:
+    if isinstance(v, (int, float)) and 1 <= v <= 4:
+        return "$" * int(v)
+    s = str(v or "").strip().lower()
+    m = re.match(r"\$+", s)
+    if m:
+        return m.group(0)[:4]
+    for word, tier in _TIER_WORDS.items():
+        if word in s:
+            return tier
+    return "$$"
+
+
+def coerce_activity(obj: Any) -> Optional[Activity]:
+    """Best-effort Activity from a dict (or bare title string); None if unusable."""
+    if isinstance(obj, str):
+        obj = {"title": obj}
+    if not isinstance(obj, dict):
+        return None
+    title = obj.get("title") or obj.get("name")
+    if not isinstance(title, str) or not title.strip():
+        return None
+    d: Dict[str, Any] = {"title": title.strip()}
+    if isinstance(obj.get("address"), str):
+        d["address"] = obj["address"]
+    if "priceTier" in obj:
+        d["priceTier"] = _price_tier(obj["priceTier"])
+    if obj.get("duration") is not None:
+        d["duration"] = str(obj["duration"])
+    tags = obj.get("tags")
+    if isinstance(tags, str):
+        tags = [t.strip() for t in tags.split(",") if t.strip()]
+    if isinstance(tags, list):
+        d["tags"] = [str(t) for t in tags if t is not None]
+    flags = obj.get("flags")
+    if isinstance(flags, dict):
+        d["flags"] = {k: bool(flags[k]) for k in ("wheelchair", "childFriendly") if k in flags}
+    try:
+        return Activity(**d)
+    except ValidationError:
+        return Activity(title=d["title"])
+
+
+def coerce_day(obj: Any) -> Optional[DayBlock]:
+    if not isinstance(obj, dict) or not obj.get("date"):
+        return None
+    d: Dict[str, Any] = {"date": str(obj["date"])}
+    for block in BLOCKS:
+        items = obj.get(block)
+        if items is None:
+            continue
+        if not isinstance(items, list):
+            items = [items]                 # "morning": "Walk the old town"
+        d[block] = [a for a in map(coerce_activity, items) if a is not None]
+    try:
+        return DayBlock(**d)
+    except ValidationError:
+        return None
+
+
+def coerce_item(section: str, item: Any) -> Optional[Any]:
+    """Validate one element of a top-level section; None if it has to be dropped."""
+    if section == "itinerary":
+        return coerce_day(item)
+    if section in ("activities", "restaurants"):
+        return coerce_activity(item)
+    if section == "packing":
+        if isinstance(item, (str, int, float)) and str(item).strip():
+            return str(item).strip()
+        if isinstance(item, dict) and item.get("item"):
+            return str(item["item"])
+    return None
+
+
+def validate_plan(data: Any) -> Tuple[PlanResponse, int]:
+    """Build a PlanResponse from whatever parsed; returns (plan, dropped_items)."""
+    if not isinstance(data, dict):
+        return PlanResponse(), 0
+    out: Dict[str, List[Any]] = {}
+    dropped = 0
+    for section in SECTIONS:
+        items = data.get(section) or []
+        if not isinstance(items, list):
+            items = [items]
+        kept = [x for x in (coerce_item(section, i) for i in items) if x is not None]
+        dropped += len(items) - len(kept)
+        out[section] = kept
+    return PlanResponse(**out), dropped
+
+
+def parse_plan(raw: str) -> Optional[PlanResponse]:
+    """
+    Tolerant one-shot parse of a complete (or truncated) model output.
+    None only if no JSON object could be recovered at all.
+    """
+    with span("json_parse"):
+        data = repair_json(strip_wrapping(raw))
+    if not isinstance(data, dict):
+        return None
+    with span("validation"):
+        plan, dropped = validate_plan(data)
+    if dropped:
+        log.info("plan parser dropped %d invalid item(s)", dropped)
+    return plan
+
+
+# =========================
+# Streaming
+# =========================
+class IncrementalPlanParser:
+    """
+    Emits validated DayBlock / Activity / str items as they close.
+    Character-level scanner that tracks string/escape state and container
+    depth across chunk boundaries. Text before the first '{' (code fences,
+    "Here is your plan:") is skipped.
+    """
+
+    def __init__(self):
+        self.buf = ""
+        self._pos = 0
+        self._stack: List[str] = []
+        self._in_str = False
+        self._esc = False
+        self._str_start = 0
+        self._expect_key = False
+        self._key: Optional[str] = None
+        self._elem_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        self.buf += chunk
+        out: List[Tuple[str, Any]] = []
+        buf, stack = self.buf, self._stack
+        i = self._pos
+        while i < len(buf):
+            ch = buf[i]
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif ch == "\\":
+                    self._esc = True
+                elif ch == '"':
+                    self._in_str = False
+                    self._close_string(i, out)
+            elif not stack:
+                if ch == "{":
+                    stack.append("{")
+                    self._expect_key = True
+            elif ch == '"':
+                self._in_str = True
+                self._str_start = i
+                if self._in_section_array():
+                    self._elem_start = i
+            elif ch in "{[":
+                if self._in_section_array():
+                    self._elem_start = i
+                stack.append(ch)
+            elif ch in "}]":
+                stack.pop()
+                if ch == "}" and self._in_section_array():
+                    self._emit(buf[self._elem_start:i + 1], out)
+                elif len(stack) == 1:
+                    self._key = None
+            elif ch == "," and len(stack) == 1:
+                self._expect_key = True
+            i += 1
+        self._pos = i
+        return out
+
+    # ---- internals ----
+    def _in_section_array(self) -> bool:
+        return len(self._stack) == 2 and self._stack[1] == "[" and self._key in SECTIONS
+
+    def _close_string(self, i: int, out: List[Tuple[str, Any]]) -> None:
+        if len(self._stack) == 1 and self._expect_key:
+            try:
+                self._key = json.loads(self.buf[self._str_start:i + 1])
+            except ValueError:
+                self._key = None
+            self._expect_key = False
+        elif self._in_section_array():
+            # packing: bare strings are complete elements on their own
+            self._emit(self.buf[self._elem_start:i + 1], out)
+
+    def _emit(self, text: str, out: List[Tuple[str, Any]]) -> None:
+        item = _loads(text)
+        if item is not None:
+            item = coerce_item(self._key, item)
+        if item is not None:
+            out.append((self._key, item))
+        self._elem_start = None
+
+    def result(self) -> Optional[PlanResponse]:
+        """Tolerant parse of everything fed so far (see parse_plan)."""
+        return parse_plan(self.buf)
@@ -0,0 +1,38 @@
+# agent/ratelimit.py
+"""
+Async pacing helpers for upstreams with published usage policies.
+
+`IntervalLimiter` serialises callers and spaces them at least
+`min_interval_s` apart (e.g. Nominatim asks for max 1 request/second):
+
+    async with NOMINATIM_LIMIT:
+        ... one upstream call ...
+"""
+import time, asyncio
+
+
+class IntervalLimiter:
+    def __init__(self, min_interval_s: float):
+        self.min_interval_s = min_interval_s
+        self._lock = asyncio.Lock()
+        self._last = 0.0
+        self.waits = 0
+
+    async def __aenter__(self):
+        await self._lock.acquire()
+        delay = self._last + self.min_interval_s - time.monotonic()
+        if delay > 0:
+            self.waits += 1
+            try:
+                await asyncio.sleep(delay)
+            except BaseException:
+                # Cancelled while pacing (deadline, client gone): never entered, so __aexit__ won't run
+                self._lock.release()
+                raise
+        return self
+
+    async def __aexit__(self, *exc):
+        # Measured from when the call finished, so slow responses never bunch up
+        self._last = time.monotonic()
+        self._lock.release()
+        return False
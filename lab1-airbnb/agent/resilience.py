@@ -0,0 +1,379 @@
+# agent/resilience.py
+"""
+Failure isolation for upstream calls and for the server itself.
+
+Per upstream (tavily, nominatim, open_meteo, anthropic) an `Upstream` guard
+combines, in this order:
+
+  circuit breaker  after N consecutive failures the circuit opens and calls
+                   fail immediately for RESET_S; then one trial call is let
+                   through (half-open) and its outcome closes or re-opens it
+  token bucket     at most RATE_PER_S calls/second with BURST headroom
+  bulkhead         at most MAX_CONCURRENCY calls in flight
+
+A caller that would wait longer than QUEUE_TIMEOUT_S for the bucket or the
+bulkhead is rejected instead. Every rejection raises `UpstreamUnavailable`,
+which the context fan-out turns into the usual "unavailable" fallback text,
+so a slow upstream costs a request one fast miss instead of a 20 s timeout.
+
+    async with UPSTREAMS["tavily"].guard():
+        r = await client.post(...)
+
+`AdmissionMiddleware` bounds concurrent /ai/* requests server-wide. Over
+the limit, a request waits at most ADMISSION_QUEUE_TIMEOUT_S for a slot and
+is then shed with 503 + Retry-After, so /health, /metrics, /ai/stats and
+/ai/admin/* (exempt) and the requests already admitted stay fast.
+
+`hedged(stage, attempt)` trims tail latency for idempotent lookups (Tavily,
+geocoding): when the first attempt is slower than the stage's observed p95
+(agent_stage_seconds), a second one is started and the first to succeed wins.
+
+Sizing: an admitted request is one coroutine mostly waiting on I/O, so a
+worker admits hundreds of concurrent chats (ADMISSION_MAX_INFLIGHT 256);
+many of them are answered from the chat cache or share a coalesced call.
+What actually reaches Anthropic is capped lower (ANTHROPIC_MAX_CONCURRENCY
+64) because the account's rate limits, not the worker, are the ceiling;
+raise both together with the account tier and the number of workers.
+
+Env (per upstream, NAME = TAVILY | NOMINATIM | OPEN_METEO | ANTHROPIC):
+  <NAME>_MAX_CONCURRENCY     in-flight calls            (0 = unlimited)
+  <NAME>_RATE_PER_S          token refill rate          (0 = unlimited)
+  <NAME>_BURST               bucket size
+  <NAME>_QUEUE_TIMEOUT_S     max wait for bucket/bulkhead before rejecting
+  <NAME>_BREAKER_FAILURES    consecutive failures that open the circuit (0 = off)
+  <NAME>_BREAKER_RESET_S     open -> half-open after this long
+Server:
+  ADMISSION_MAX_INFLIGHT     concurrent /ai/* requests (default 256, 0 = off)
+  ADMISSION_QUEUE_TIMEOUT_S  wait for a slot before shedding (default 0.25)
+  ADMISSION_RETRY_AFTER_S    Retry-After on 503 (default 2)
+Hedging:
+  HEDGE_ENABLED              1 (default) / 0
+  HEDGE_QUANTILE             latency quantile that triggers the hedge (default 0.95)
+  HEDGE_MIN_SAMPLES          successful calls needed before the quantile is trusted (default 20)
+"""
+import os, json, time, asyncio, logging
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+import deadline
+from metrics import Counter, STAGE_SECONDS, register_collector
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "1") == "1"
+HEDGE_QUANTILE = float(os.getenv("HEDGE_QUANTILE", "0.95"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+
+REJECTIONS = Counter("agent_upstream_rejections_total", "Upstream calls refused by the resilience layer")
+SHED = Counter("agent_admission_shed_total", "Requests shed with 503 by admission control")
+HEDGES = Counter("agent_hedged_requests_total", "Hedged second attempts (sent, and whether they won)")
+
+
+class UpstreamUnavailable(Exception):
+    """Raised instead of calling an upstream that is failing or saturated."""
+
+    def __init__(self, upstream: str, reason: str):
+        super().__init__(f"{upstream} unavailable ({reason})")
+        self.upstream = upstream
+        self.reason = reason
+
+
+# =========================
+# Building blocks
+# =========================
+class TokenBucket:
+    def __init__(self, rate_per_s: float, burst: float):
+        self.rate = rate_per_s
+        self.capacity = max(burst, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, max_wait_s: float) -> bool:
+        """Take one token, waiting up to `max_wait_s`; False if that is not enough."""
+        if self.rate <= 0:
+            return True
+        async with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            wait = (1.0 - self._tokens) / self.rate if self._tokens < 1.0 else 0.0
+            if wait > max_wait_s:
+                return False
+            self._tokens -= 1.0    # reserve now; later callers see the debt and wait longer
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return True
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int, reset_s: float):
+        self.failure_threshold = failure_threshold
+        self.reset_s = reset_s
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self._trial_inflight = False
+
+    def allow(self) -> bool:
+        if self.failure_threshold <= 0 or self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_s:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN and not self._trial_inflight:
+            self._trial_inflight = True
+            return True
+        return False
+
+    def release_trial(self) -> None:
+        self._trial_inflight = False
+
+    def record_success(self) -> None:
+        self._trial_inflight = False
+        self.failures = 0
+        self.state = self.CLOSED
+
+    def record_failure(self) -> None:
+        self._trial_inflight = False
+        self.failures += 1
+        if self.state == self.HALF_OPEN or (0 < self.failure_threshold <= self.failures):
+            if self.state != self.OPEN:
+                self.opens += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+def _env(name: str, key: str, default: float) -> float:
+    return float(os.getenv(f"{name.upper()}_{key}", str(default)))
+
+
+class Upstream:
+    def __init__(self, name: str, *, max_concurrency: int, rate_per_s: float, burst: float,
+                 queue_timeout_s: float, breaker_failures: int, breaker_reset_s: float):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.queue_timeout_s = queue_timeout_s
+        self._sem = asyncio.Semaphore(max_concurrency) if max_concurrency > 0 else None
+        self.bucket = TokenBucket(rate_per_s, burst)
+        self.breaker = CircuitBreaker(breaker_failures, breaker_reset_s)
+        self.inflight = 0
+        self.calls = 0
+        self.failures = 0
+
+    @classmethod
+    def from_env(cls, name: str, **defaults) -> "Upstream":
+        return cls(name, **{
+            "max_concurrency": int(_env(name, "MAX_CONCURRENCY", defaults.get("max_concurrency", 8))),
+            "rate_per_s": _env(name, "RATE_PER_S", defaults.get("rate_per_s", 0)),
+            "burst": _env(name, "BURST", defaults.get("burst", 10)),
+            "queue_timeout_s": _env(name, "QUEUE_TIMEOUT_S", defaults.get("queue_timeout_s", 2.0)),
+            "breaker_failures": int(_env(name, "BREAKER_FAILURES", defaults.get("breaker_failures", 5))),
+            "breaker_reset_s": _env(name, "BREAKER_RESET_S", defaults.get("breaker_reset_s", 30)),
+        })
+
+    def _reject(self, reason: str) -> UpstreamUnavailable:
+        REJECTIONS.inc(upstream=self.name, reason=reason)
+        return UpstreamUnavailable(self.name, reason)
+
+    @asynccontextmanager
+    async def guard(self):
+        if not self.breaker.allow():
+            raise self._reject("circuit_open")
+        settled = False
+        # Never queue past the request deadline
+        queue_timeout_s = deadline.timeout(self.queue_timeout_s)
+        try:
+            if not await self.bucket.acquire(queue_timeout_s):
+                raise self._reject("rate_limited")
+            if self._sem is not None:
+                try:
+                    await asyncio.wait_for(self._sem.acquire(), queue_timeout_s)
+                except asyncio.TimeoutError:
+                    raise self._reject("bulkhead_full") from None
+            self.inflight += 1
+            self.calls += 1
+            try:
+                yield
+            except deadline.DeadlineExceeded:
+                raise  # our budget ran out, not the upstream's fault
+            except Exception:
+                settled = True
+                self.failures += 1
+                opens = self.breaker.opens
+                self.breaker.record_failure()
+                if self.breaker.opens != opens:
+                    log.warning("%s circuit open after %d failures", self.name, self.breaker.failures)
+                raise
+            else:
+                settled = True
+                self.breaker.record_success()
+            finally:
+                self.inflight -= 1
+                if self._sem is not None:
+                    self._sem.release()
+        finally:
+            # Rejected, cancelled or out of time without an outcome: free a half-open trial slot for the next caller
+            if not settled:
+                self.breaker.release_trial()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.breaker.state,
+            "inflight": self.inflight,
+            "max_concurrency": self.max_concurrency,
+            "calls": self.calls,
+            "failures": self.failures,
+            "circuit_opens": self.breaker.opens,
+        }
+
+
+UPSTREAMS: Dict[str, Upstream] = {
+    "tavily": Upstream.from_env("tavily", max_concurrency=8, rate_per_s=5, burst=10, queue_timeout_s=2.0),
+    # Nominatim is additionally paced to 1 req/s by ratelimit.IntervalLimiter
+    "nominatim": Upstream.from_env("nominatim", max_concurrency=2, queue_timeout_s=5.0),
+    "open_meteo": Upstream.from_env("open_meteo", max_concurrency=8, rate_per_s=10, burst=20),
+    "anthropic": Upstream.from_env("anthropic", max_concurrency=64, queue_timeout_s=10.0,
+                                   breaker_failures=8, breaker_reset_s=20),
+}
+
+
+def all_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: u.stats() for name, u in UPSTREAMS.items()}
+
+
+# =========================
+# Hedged requests
+# =========================
+def hedge_delay(stage: str, *, default_s: float, min_s: float = 0.0) -> float:
+    """HEDGE_QUANTILE of the stage's successful latencies, once there are enough samples."""
+    q = None
+    if STAGE_SECONDS.count(stage=stage, outcome="ok") >= HEDGE_MIN_SAMPLES:
+        q = STAGE_SECONDS.quantile(HEDGE_QUANTILE, stage=stage, outcome="ok")
+    return max(q if q is not None else default_s, min_s)
+
+
+async def hedged(stage: str, attempt: Callable[[], Awaitable[T]], *,
+                 default_delay_s: float, min_delay_s: float = 0.0) -> T:
+    """
+    Run `attempt()`; if it has not finished after the stage's p95 latency,
+    start a second one and return whichever succeeds first (the other is
+    cancelled). Fast failures are not retried — that is the breaker's job —
+    and no hedge is sent when the request deadline would not leave room for it.
+    """
+    delay = hedge_delay(stage, default_s=default_delay_s, min_s=min_delay_s)
+    left = deadline.remaining()
+    if not HEDGE_ENABLED or (left is not None and left <= delay):
+        return await attempt()
+
+    first = asyncio.ensure_future(attempt())
+    second: Optional["asyncio.Future[T]"] = None
+    try:
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+
+        HEDGES.inc(stage=stage, result="sent")
+        second = asyncio.ensure_future(attempt())
+        pending = {first, second}
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                if t.exception() is None:
+                    HEDGES.inc(stage=stage, result="won" if t is second else "lost")
+                    return t.result()
+                error = t.exception()
+        raise error
+    finally:   # also when the caller is cancelled while waiting on the first attempt
+        for t in (first, second):
+            if t is not None:
+                t.cancel()
+
+
+_STATE_VALUE = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}
+
+
+def _collect():
+    for name, u in UPSTREAMS.items():
+        yield ("agent_upstream_circuit_state", "gauge", "Circuit state (0 closed, 1 half-open, 2 open)",
+               {"upstream": name}, _STATE_VALUE[u.breaker.state])
+        yield ("agent_upstream_inflight", "gauge", "Upstream calls in flight", {"upstream": name}, u.inflight)
+    yield ("agent_admission_inflight", "gauge", "Admitted /ai/* requests in flight", {}, ADMISSION.inflight)
+
+
+# =========================
+# Server admission control
+# =========================
+class _Admission:
+    def __init__(self, max_inflight: int, queue_timeout_s: float, retry_after_s: float):
+        self.max_inflight = max_inflight
+        self.queue_timeout_s = queue_timeout_s
+        self.retry_after_s = retry_after_s
+        self._sem = asyncio.Semaphore(max_inflight) if max_inflight > 0 else None
+        self.inflight = 0
+
+    async def acquire(self) -> bool:
+        if self._sem is None:
+            return True
+        try:
+            await asyncio.wait_for(self._sem.acquire(), self.queue_timeout_s)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def release(self) -> None:
+        if self._sem is not None:
+            self._sem.release()
+
+
+ADMISSION = _Admission(
+    int(os.getenv("ADMISSION_MAX_INFLIGHT", "256")),
+    float(os.getenv("ADMISSION_QUEUE_TIMEOUT_S", "0.25")),
+    float(os.getenv("ADMISSION_RETRY_AFTER_S", "2")),
+)
+
+register_collector(_collect)
+
+
+class AdmissionMiddleware:
+    """
+    Pure ASGI middleware (the slot is held until a streamed body finishes,
+    which BaseHTTPMiddleware would not do). Only paths under `prefix` count.
+    """
+
+    def __init__(self, app, prefix: str = "/ai/", exempt: Tuple[str, ...] = ("/ai/stats", "/ai/admin/"),
+                 admission: Optional[_Admission] = None):
+        self.app = app
+        self.prefix = prefix
+        self.exempt = exempt
+        self.admission = admission or ADMISSION
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if scope["type"] != "http" or not path.startswith(self.prefix) or path.startswith(self.exempt):
+            return await self.app(scope, receive, send)
+        if not await self.admission.acquire():
+            # Known endpoints only: the raw client path would be an unbounded label
+            SHED.inc(path=path if path in deadline.ENDPOINT_BUDGETS else "other")
+            body = json.dumps({"detail": "Server busy, retry shortly"}).encode()
+            await send({"type": "http.response.start", "status": 503, "headers": [
+                (b"content-type", b"application/json"),
+                (b"retry-after", str(int(round(self.admission.retry_after_s))).encode()),
+                (b"content-length", str(len(body)).encode()),
+            ]})
+            await send({"type": "http.response.body", "body": body})
+            return
+        self.admission.inflight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.admission.inflight -= 1
+            self.admission.release()
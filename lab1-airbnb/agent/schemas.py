@@ -24,6 +24,14 @@ class AgentPlanRequest(BaseModel):
     preferences: Preferences = Preferences()
     ask: Optional[str] = None
 
+class PlanBatchRequest(BaseModel):
+    # Either a traveler id (plans every upcoming booking) or explicit requests
+    user_id: Optional[int] = None
+    requests: List[AgentPlanRequest] = Field(default_factory=list)
+    # Applied to bookings loaded via user_id
+    preferences: Preferences = Preferences()
+    ask: Optional[str] = None
+
 class GeneralChatRequest(BaseModel):
     question: str
 
@@ -55,4 +63,13 @@ class PlanResponse(BaseModel):
     itinerary: List[DayBlock] = Field(default_factory=list)
     activities: List[Activity] = Field(default_factory=list)
     restaurants: List[Activity] = Field(default_factory=list)
-    packing: List[str] = Field(default_factory=list)
\ No newline at end of file
+    packing: List[str] = Field(default_factory=list)
+
+class PlanBatchItem(BaseModel):
+    index: int
+    booking: Booking
+    plan: Optional[PlanResponse] = None
+    error: Optional[str] = None
+
+class PlanBatchResponse(BaseModel):
+    plans: List[PlanBatchItem] = Field(default_factory=list)
@@ -0,0 +1,51 @@
+# agent/singleflight.py
+"""
+Request coalescing for identical in-flight lookups.
+
+    TAVILY_FLIGHT = SingleFlight("tavily")
+    data = await TAVILY_FLIGHT.do(key, lambda: fetch(...))
+
+The first caller for `key` starts the upstream call; everyone who asks for
+the same key while it is running awaits that same task and gets its result
+(or its exception). Once it finishes the key is released, so this never
+serves stale data — pair it with cache.py for that.
+
+The shared call runs without any request deadline (the first caller's
+X-Request-Deadline must not cut it short for everyone else); each caller
+bounds only its own wait by its deadline.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+import deadline
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[str, "asyncio.Task[Any]"] = {}
+        self.calls = 0       # upstream calls actually made
+        self.coalesced = 0   # callers that piggy-backed on one of them
+        _REGISTRY[name] = self
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            self.calls += 1
+            task = deadline.detached(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _t, k=key: self._inflight.pop(k, None))
+        else:
+            self.coalesced += 1
+        # shield: one impatient caller being cancelled (or out of time) must not cancel the shared call
+        return await deadline.within(asyncio.shield(task))
+
+    def stats(self) -> Dict[str, Any]:
+        return {"calls": self.calls, "coalesced": self.coalesced, "inflight": len(self._inflight)}
+
+
+_REGISTRY: Dict[str, SingleFlight] = {}
+
+
+def all_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: f.stats() for name, f in _REGISTRY.items()}
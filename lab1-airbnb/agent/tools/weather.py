@@ -1,8 +1,112 @@
-from langchain.tools import tool
-import httpx
+import os, re, datetime
 
-@tool("weather_summary", return_direct=False)
-def weather_summary(city_and_dates: str) -> str:
+from http_clients import get_client, request_timeout
+from cache import make_cache, make_key
+from ratelimit import IntervalLimiter
+from singleflight import SingleFlight
+from metrics import span
+from resilience import UPSTREAMS, hedged
+import climate
+
+# City → (lat, lon) practically never changes: keep it forever, on disk,
+# with an in-memory front (the file is opened on first lookup). A city
+# Nominatim cannot find is remembered for GEOCODE_NEGATIVE_TTL_S only, so a
+# typo does not cost a rate-limited request every time but a new place can
+# still appear. Forecasts are shared per ~1 km grid cell for a short TTL.
+GEOCODE_CACHE = make_cache(
+    "geocode",
+    ttl_s=None,
+    max_entries=int(os.getenv("GEOCODE_CACHE_MAX", "50000")),
+    backend=os.getenv("GEOCODE_CACHE_BACKEND", "tiered"),
+)
+GEOCODE_NEGATIVE_TTL_S = float(os.getenv("GEOCODE_NEGATIVE_TTL_S", "3600"))
+FORECAST_CACHE = make_cache(
+    "forecast",
+    ttl_s=float(os.getenv("FORECAST_CACHE_TTL_S", "1800")),
+    max_entries=int(os.getenv("FORECAST_CACHE_MAX", "2000")),
+)
+
+# Stays starting further out than this are answered from climate normals
+# (climate.py) when a store is installed, and otherwise reported as beyond
+# the forecast; Open-Meteo forecasts ~7-16 days.
+FORECAST_HORIZON_DAYS = int(os.getenv("FORECAST_HORIZON_DAYS", "7"))
+
+# Nominatim usage policy: at most 1 request per second
+NOMINATIM_LIMIT = IntervalLimiter(float(os.getenv("NOMINATIM_MIN_INTERVAL_S", "1.0")))
+
+# A slow geocode gets a second attempt after its p95, but never sooner than the
+# Nominatim interval, so hedging stays within the 1 req/s policy
+GEOCODE_HEDGE_DELAY_S = float(os.getenv("GEOCODE_HEDGE_DELAY_S", "1.5"))
+
+# Concurrent requests for the same city / grid cell share one upstream call
+GEOCODE_FLIGHT = SingleFlight("geocode")
+FORECAST_FLIGHT = SingleFlight("forecast")
+
+
+def _city_key(city: str) -> str:
+    return re.sub(r"\s+", " ", city.strip().lower())
+
+
+async def _geocode(city: str):
+    """Return (lat, lon) as floats, or None if Nominatim has no match."""
+    key = _city_key(city)
+    hit = GEOCODE_CACHE.get(key)
+    if hit is not None:
+        return tuple(hit) or None   # [] = known miss
+    return await GEOCODE_FLIGHT.do(key, lambda: _geocode_fetch(city, key))
+
+
+async def _geocode_fetch(city: str, key: str):
+    async with NOMINATIM_LIMIT:
+        # Another waiter may have resolved the same city while we queued
+        hit = GEOCODE_CACHE.get(key)
+        if hit is not None:
+            return tuple(hit) or None
+        g = await hedged("geocode", lambda: _geocode_get(city), default_delay_s=GEOCODE_HEDGE_DELAY_S,
+                         min_delay_s=NOMINATIM_LIMIT.min_interval_s)
+    if not g:
+        GEOCODE_CACHE.set(key, [], ttl_s=GEOCODE_NEGATIVE_TTL_S)
+        return None
+    latlon = (float(g[0]["lat"]), float(g[0]["lon"]))
+    GEOCODE_CACHE.set(key, list(latlon))
+    return latlon
+
+
+async def _geocode_get(city: str):
+    with span("geocode"):
+        async with UPSTREAMS["nominatim"].guard():
+            r = await get_client("nominatim").get("/search", params={"q": city, "format":"json", "limit":1},
+                                                  timeout=request_timeout("nominatim"))
+            r.raise_for_status()
+            return r.json()
+
+
+async def _forecast(lat: float, lon: float) -> dict:
+    """Open-Meteo daily block, cached on lat/lon rounded to 2 decimals."""
+    key = make_key(round(lat, 2), round(lon, 2))
+    hit = FORECAST_CACHE.get(key)
+    if hit is not None:
+        return hit
+    return await FORECAST_FLIGHT.do(key, lambda: _forecast_fetch(lat, lon, key))
+
+
+async def _forecast_fetch(lat: float, lon: float, key: str) -> dict:
+    with span("forecast"):
+        async with UPSTREAMS["open_meteo"].guard():
+            r = await get_client("open_meteo").get("/v1/forecast",
+                                                   params={
+                                                       "latitude":lat, "longitude":lon,
+                                                       "daily":"temperature_2m_max,temperature_2m_min,precipitation_probability_max",
+                                                       "timezone":"auto"
+                                                   }, timeout=request_timeout("open_meteo"))
+            r.raise_for_status()
+            w = r.json().get("daily",{})
+    if w:
+        FORECAST_CACHE.set(key, w)
+    return w
+
+
+async def summarize_weather(city_and_dates: str) -> str:
     """
     Given 'City, CC | YYYY-MM-DD to YYYY-MM-DD', returns concise weather info & packing suggestions.
     """
@@ -12,19 +116,16 @@ def weather_summary(city_and_dates: str) -> str:
     except Exception:
         return "Format error. Use: 'City, CountryCode | YYYY-MM-DD to YYYY-MM-DD'"
 
-    with httpx.Client(timeout=20, headers={"User-Agent":"StayBnB-Agent/1.0"}) as c:
-        g = c.get("https://nominatim.openstreetmap.org/search",
-                  params={"q": city, "format":"json", "limit":1}).json()
-        if not g:
-            return f"Could not geocode {city}"
-        lat, lon = g[0]["lat"], g[0]["lon"]
+    if _beyond_forecast(start):
+        # Today's forecast says nothing about a stay weeks away, so never label it as the trip's weather
+        typical = await _normals_summary(city, start, end)
+        return typical or (f"No forecast yet for {city} ({start}→{end}): the dates are more than "
+                           f"{FORECAST_HORIZON_DAYS} days out and no climate normals are available.")
 
-        w = c.get("https://api.open-meteo.com/v1/forecast",
-                  params={
-                      "latitude":lat, "longitude":lon,
-                      "daily":"temperature_2m_max,temperature_2m_min,precipitation_probability_max",
-                      "timezone":"auto"
-                  }).json().get("daily",{})
+    latlon = await _geocode(city)
+    if not latlon:
+        return f"Could not geocode {city}"
+    w = await _forecast(*latlon)
 
     if not w:
         return "No weather data."
@@ -35,4 +136,63 @@ def weather_summary(city_and_dates: str) -> str:
     if tmax >= 27: tips += ["sunscreen","hat","light clothing"]
     if pprec >= 40: tips += ["light rain jacket","umbrella"]
 
-    return f"Weather for {city} ({start}→{end}): max {tmax}°C, rain chance up to {pprec}%. Packing: {', '.join(tips)}."
\ No newline at end of file
+    return f"Weather for {city} ({start}→{end}): max {tmax}°C, rain chance up to {pprec}%. Packing: {', '.join(tips)}."
+
+
+def _beyond_forecast(start: str) -> bool:
+    try:
+        first = datetime.date.fromisoformat(start[:10])
+    except ValueError:
+        return False
+    return (first - datetime.date.today()).days > FORECAST_HORIZON_DAYS
+
+
+def _trip_months(start: str, end: str):
+    s, e = datetime.date.fromisoformat(start[:10]), datetime.date.fromisoformat(end[:10])
+    months, cur = [], s.replace(day=1)
+    while cur <= max(e, s) and len(months) < 12:
+        months.append(cur.month)
+        cur = (cur + datetime.timedelta(days=32)).replace(day=1)
+    return months
+
+
+async def _normals_summary(city: str, start: str, end: str):
+    """Typical weather from climate normals, or None (no store / unknown city / no nearby cell)."""
+    store = climate.get_store()
+    if store is None:
+        return None
+    latlon = store.city(city)
+    if latlon is None:
+        latlon = await _geocode(city)   # usually a geocode-cache hit
+        if not latlon:
+            return None
+    try:
+        months = _trip_months(start, end)
+    except ValueError:
+        return None
+    with span("climate"):
+        normals = [n for n in (store.lookup(*latlon, m) for m in months) if n is not None]
+    if not normals:
+        return None
+    n = climate.summarize(normals)
+
+    tips = ["comfortable shoes","reusable water bottle"]
+    if n.tmax_c >= 27: tips += ["sunscreen","hat","light clothing"]
+    if n.tmin_c <= 8: tips += ["warm layers"]
+    if n.wet_days >= 8 or n.precip_mm >= 60: tips += ["light rain jacket","umbrella"]
+
+    names = [climate.MONTH_NAMES[m - 1] for m in months]
+    when = names[0] if len(names) == 1 else f"{names[0]}–{names[-1]}"
+    return (f"Typical weather for {city} in {when} (climate normals, not a forecast): "
+            f"highs around {n.tmax_c:.0f}°C, lows around {n.tmin_c:.0f}°C, "
+            f"~{n.precip_mm:.0f} mm rain over ~{n.wet_days:.0f} wet days a month. Packing: {', '.join(tips)}.")
+
+
+def __getattr__(name: str):
+    # LangChain's tool machinery adds ~1 s to import time and the chains call
+    # summarize_weather directly, so the `weather_summary` tool is built on first access.
+    if name == "weather_summary":
+        from langchain.tools import tool
+        t = globals()["weather_summary"] = tool("weather_summary", return_direct=False)(summarize_weather)
+        return t
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,134 @@
+# agent/warmer.py
+"""
+Plan-context warmer for upcoming bookings.
+
+We know from `bookings` which cities and dates travelers will ask the planner
+about, so fetch that context ahead of time: for every distinct
+(city, start, end) of an upcoming stay, run the same Tavily + weather lookups
+/ai/plan would run (filling the Tavily, geocode and forecast caches), and
+optionally generate the no-ask PlanResponse draft for each booking.
+
+CLI (one pass):
+    python warmer.py --days 14 --concurrency 4 --budget 200 --drafts 20
+
+In-process (app.py lifespan) when WARMER_INTERVAL_S > 0, using:
+    WARMER_DAYS_AHEAD    (default 14)
+    WARMER_CONCURRENCY   (default 4)
+    WARMER_BUDGET        max context windows per pass (default 200)
+    WARMER_DRAFTS        max LLM plan drafts per pass (default 0 = off)
+
+Only ask-free prompts are warmed; a request with free text still fetches
+its own context (but reuses the cached weather/geocode).
+"""
+import os, time, asyncio, logging, argparse
+from typing import Any, Dict, List
+
+log = logging.getLogger(__name__)
+
+WARMER_INTERVAL_S = float(os.getenv("WARMER_INTERVAL_S", "0"))
+
+
+async def warm_once(
+    *,
+    days_ahead: int = int(os.getenv("WARMER_DAYS_AHEAD", "14")),
+    concurrency: int = int(os.getenv("WARMER_CONCURRENCY", "4")),
+    budget: int = int(os.getenv("WARMER_BUDGET", "200")),
+    drafts: int = int(os.getenv("WARMER_DRAFTS", "0")),
+) -> Dict[str, Any]:
+    """One warming pass. Returns counters for logging."""
+    # Deferred: keeps `import warmer` cheap for app startup
+    from chains import plan_context, plan_with_context
+    from bookings_repo import fetch_upcoming_trip_windows
+    from schemas import AgentPlanRequest, Booking
+
+    t0 = time.perf_counter()
+    stays = await fetch_upcoming_trip_windows(days_ahead, limit=max(budget, drafts) * 4)
+
+    windows: List[tuple] = []
+    seen = set()
+    for s in stays:
+        key = (str(s["location"]).strip(), str(s["start"])[:10], str(s["end"])[:10])
+        if key not in seen:
+            seen.add(key)
+            windows.append(key)
+    skipped = max(len(windows) - budget, 0)
+    windows = windows[:budget]
+
+    sem = asyncio.Semaphore(max(concurrency, 1))
+    errors = 0
+
+    async def _context(city: str, start: str, end: str):
+        nonlocal errors
+        async with sem:
+            try:
+                await plan_context(city, start, end)
+            except Exception as e:
+                errors += 1
+                log.warning("warm context %s %s→%s failed: %s", city, start, end, e)
+
+    await asyncio.gather(*(_context(*w) for w in windows))
+
+    drafted = 0
+    if drafts > 0:
+        async def _draft(s: Dict[str, Any]):
+            nonlocal errors, drafted
+            async with sem:
+                try:
+                    await plan_with_context(AgentPlanRequest(booking=Booking(
+                        location=str(s["location"]), start=str(s["start"])[:10],
+                        end=str(s["end"])[:10], guests=int(s["guests"] or 1),
+                    )))
+                    drafted += 1
+                except Exception as e:
+                    errors += 1
+                    log.warning("warm draft %s failed: %s", s["location"], e)
+
+        await asyncio.gather(*(_draft(s) for s in stays[:drafts]))
+
+    out = {
+        "stays": len(stays),
+        "windows": len(windows),
+        "over_budget": skipped,
+        "drafts": drafted,
+        "errors": errors,
+        "seconds": round(time.perf_counter() - t0, 2),
+    }
+    log.info("warmer pass done: %s", out)
+    return out
+
+
+async def run_forever(interval_s: float = WARMER_INTERVAL_S) -> None:
+    """Background loop started from the FastAPI lifespan; cancelled on shutdown."""
+    while True:
+        try:
+            await warm_once()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.error("warmer pass failed: %s", e)
+        await asyncio.sleep(interval_s)
+
+
+async def _main(args) -> None:
+    import http_clients
+    await http_clients.startup()
+    try:
+        await warm_once(days_ahead=args.days, concurrency=args.concurrency,
+                        budget=args.budget, drafts=args.drafts)
+    finally:
+        await http_clients.shutdown()
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+    ap = argparse.ArgumentParser(description="Pre-populate planner caches for upcoming bookings.")
+    ap.add_argument("--days", type=int, default=int(os.getenv("WARMER_DAYS_AHEAD", "14")),
+                    help="look this many days ahead")
+    ap.add_argument("--concurrency", type=int, default=int(os.getenv("WARMER_CONCURRENCY", "4")))
+    ap.add_argument("--budget", type=int, default=int(os.getenv("WARMER_BUDGET", "200")),
+                    help="max (city, dates) windows to warm; each costs 2 Tavily + 1 weather lookup")
+    ap.add_argument("--drafts", type=int, default=int(os.getenv("WARMER_DRAFTS", "0")),
+                    help="max full plan drafts to generate (one LLM call each)")
+    asyncio.run(_main(ap.parse_args()))